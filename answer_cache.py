@@ -0,0 +1,178 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from embedding import cache_key, normalize_text
+
+answer_cache_enabled = os.environ.get('ANSWER_CACHE', '1') == '1'
+answer_cache_path = os.environ.get('ANSWER_CACHE_PATH', os.path.join('cache', 'answers.sqlite3'))
+# Cosine similarity above which a paraphrased question reuses a cached answer
+answer_cache_threshold = float(os.environ.get('ANSWER_CACHE_THRESHOLD', 0.95))
+answer_cache_max_entries = int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', 1000))
+answer_cache_ttl = float(os.environ.get('ANSWER_CACHE_TTL', 7 * 24 * 3600))
+
+
+def normalize_question(question: str) -> str:
+    return normalize_text(question).lower().rstrip("?!. ")
+
+
+def question_numbers(question: str) -> List[str]:
+    """
+    Numbers in a question. Questions that only differ in a number ("last 3 months" vs "last 6
+    months") embed almost identically, so the semantic tier requires these to match exactly.
+    """
+    return re.findall(r"\d+(?:[.,]\d+)?", question)
+
+
+class AnswerCache:
+    """
+    Persistent cache of LLM answers in front of the retrieval chain.
+
+    Questions are looked up by their normalized text first, then by the cosine similarity of their
+    embedding to the cached questions. Every entry records the version of the data it was answered
+    from (vector store revision and ledger contents); entries of any other version are never served
+    and are purged once the version changes. Entries expire after `ttl` seconds and the least
+    recently used ones are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, path: str = answer_cache_path, threshold: float = answer_cache_threshold,
+                 max_entries: int = answer_cache_max_entries, ttl: float = answer_cache_ttl):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY, question TEXT NOT NULL, answer TEXT NOT NULL, sources TEXT NOT NULL,
+                embedding BLOB, version TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)
+        """)
+        # Unit-length embeddings of the current version's entries, for the semantic tier
+        self._version = None
+        self._keys: List[str] = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+
+    def _key(self, question: str) -> str:
+        return cache_key("answer", normalize_question(question))
+
+    def _use_version(self, version: str) -> None:
+        if version == self._version:
+            return
+        with self._conn:
+            self._conn.execute("DELETE FROM answers WHERE version != ?", (version,))
+        rows = self._conn.execute(
+            "SELECT key, embedding FROM answers WHERE embedding IS NOT NULL").fetchall()
+        self._keys = [key for key, _ in rows]
+        vectors = [np.frombuffer(blob, dtype=np.float32) for _, blob in rows]
+        self._matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        self._version = version
+
+    def _drop_from_matrix(self, keys: List[str]) -> None:
+        dropped = set(keys)
+        keep = [i for i, key in enumerate(self._keys) if key not in dropped]
+        self._keys = [self._keys[i] for i in keep]
+        self._matrix = self._matrix[keep] if keep else np.zeros((0, 0), dtype=np.float32)
+
+    def _expire(self, now: float) -> None:
+        expired = [r[0] for r in self._conn.execute("SELECT key FROM answers WHERE created < ?", (now - self.ttl,))]
+        if expired:
+            with self._conn:
+                self._conn.executemany("DELETE FROM answers WHERE key = ?", [(key,) for key in expired])
+            self._drop_from_matrix(expired)
+            self.evictions += len(expired)
+
+    def _semantic_match(self, question: str, embedding: List[float]) -> Optional[str]:
+        if not len(self._keys):
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        scores = self._matrix @ query
+        numbers = question_numbers(question)
+        for index in np.argsort(-scores):
+            if scores[index] < self.threshold:
+                break
+            row = self._conn.execute("SELECT question FROM answers WHERE key = ?", (self._keys[index],)).fetchone()
+            if row and question_numbers(row[0]) == numbers:
+                return self._keys[index]
+        return None
+
+    def lookup(self, question: str, version: str, embedding: Optional[List[float]] = None) \
+            -> Optional[Tuple[str, List[dict], str]]:
+        """
+        Returns (answer, sources, "exact" or "semantic") of a cached answer to the question, or None.
+        Without an embedding only the exact tier is searched.
+        """
+        now = time.time()
+        with self._lock:
+            self._use_version(version)
+            self._expire(now)
+            tier, key = "exact", self._key(question)
+            row = self._conn.execute("SELECT answer, sources FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None and embedding is not None:
+                tier, key = "semantic", self._semantic_match(question, embedding)
+                if key is not None:
+                    row = self._conn.execute("SELECT answer, sources FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            with self._conn:
+                self._conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, key))
+            self.hits[tier] += 1
+            return row[0], json.loads(row[1]), tier
+
+    def store(self, question: str, answer: str, sources: List[dict], version: str,
+              embedding: Optional[List[float]] = None) -> None:
+        now = time.time()
+        blob = None
+        if embedding is not None:
+            vector = np.asarray(embedding, dtype=np.float32)
+            vector /= np.linalg.norm(vector) or 1.0
+            blob = vector.tobytes()
+        key = self._key(question)
+        with self._lock:
+            self._use_version(version)
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO answers (key, question, answer, sources, embedding, version, created, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, question, answer, json.dumps(sources), blob, version, now, now))
+            if blob is not None and key not in self._keys:
+                self._keys.append(key)
+                self._matrix = np.vstack([self._matrix, vector[None, :]]) if len(self._matrix) else vector[None, :]
+            self._evict()
+
+    def _evict(self) -> None:
+        count = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        oldest = [r[0] for r in self._conn.execute(
+            "SELECT key FROM answers ORDER BY last_used LIMIT ?", (count - self.max_entries,))]
+        with self._conn:
+            self._conn.executemany("DELETE FROM answers WHERE key = ?", [(key,) for key in oldest])
+        self._drop_from_matrix(oldest)
+        self.evictions += len(oldest)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        return {"entries": entries, "exact_hits": self.hits["exact"], "semantic_hits": self.hits["semantic"],
+                "misses": self.misses, "evictions": self.evictions}
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM answers")
+            self._keys, self._matrix = [], np.zeros((0, 0), dtype=np.float32)
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,288 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from tqdm import tqdm
+
+from ingest_manifest import IngestManifest
+from ledger import TransactionLedger, ledger_path
+from ledger_store import LedgerStore, get_ledger, ledger_cache_dir
+from privateGPT import date_filter, get_engine, persist_directory
+from query_router import route_question
+from tracing import start_trace
+
+# Answers generated at the same time; Ollama serves one model, so more mostly adds contention
+batch_concurrency = int(os.environ.get('BATCH_CONCURRENCY', 2))
+
+FILTER_FIELDS = ("source", "doc_type", "date_from", "date_to")
+
+
+class BatchQuestion:
+    """
+    One question of a batch, optionally about a specific ledger (e.g. one account's CSV export) and
+    with retrieval filters. The ID identifies its result in the output, for resuming.
+    """
+
+    def __init__(self, question: str, ledger: Optional[str] = None, filters: Optional[dict] = None,
+                 id: Optional[str] = None):
+        self.question = question
+        self.ledger = ledger
+        self.filters = {key: value for key, value in (filters or {}).items() if value}
+        self.id = id or hashlib.sha1(f"{ledger or ''}\0{question}\0{json.dumps(self.filters, sort_keys=True)}"
+                                     .encode("utf-8")).hexdigest()[:16]
+
+
+def parse_filters(item: dict) -> dict:
+    filters = {field: item[field] for field in FILTER_FIELDS if item.get(field)}
+    for field in ("date_from", "date_to"):
+        if isinstance(filters.get(field), str):
+            filters[field] = date_filter(filters[field])
+    return filters
+
+
+def load_questions(path: str, ledgers: Optional[List[str]] = None) -> List[BatchQuestion]:
+    """
+    Reads questions from a text file (one per line, # starts a comment) or a JSONL file of objects
+    with "question" and optionally "id", "ledger", "source", "doc_type", "date_from" and "date_to"
+    (YYYY-MM-DD). With `ledgers`, every question that does not name a ledger is asked once per ledger.
+    """
+    items = []
+    with open(path, encoding="utf8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            items.append(json.loads(line) if path.endswith(".jsonl") else {"question": line})
+
+    questions = []
+    for item in items:
+        filters = parse_filters(item)
+        if item.get("ledger") or not ledgers:
+            questions.append(BatchQuestion(item["question"], item.get("ledger"), filters, item.get("id")))
+            continue
+        for ledger in ledgers:
+            item_id = f"{item['id']}@{ledger}" if item.get("id") else None
+            questions.append(BatchQuestion(item["question"], ledger, filters, item_id))
+    return questions
+
+
+def open_ledger(path: str) -> TransactionLedger:
+    """
+    The ledger of a CSV export, through its own columnar cache next to the default ledger's
+    """
+    if os.path.abspath(path) == os.path.abspath(ledger_path):
+        return get_ledger()
+    cache_dir = os.path.join(ledger_cache_dir, "batch", hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:12])
+    return TransactionLedger(LedgerStore(path, cache_dir).transactions())
+
+
+def ingested_sources() -> Dict[str, str]:
+    """
+    {absolute path: path as recorded in chunk metadata} of the ingested source files
+    """
+    return {os.path.abspath(path): path for path in IngestManifest.load(persist_directory).files}
+
+
+def answer_batch(questions: List[BatchQuestion], concurrency: int = batch_concurrency,
+                 use_cache: bool = True) -> Iterator[dict]:
+    """
+    Answers questions and yields one result per question as soon as it is ready, in no particular
+    order. Numeric ledger questions are answered from their ledger. The rest go to the LLM, and
+    a question about a ledger that was ingested retrieves from that ledger's chunks only. One about
+    a ledger that was not ingested is answered from all documents, which its result records in
+    "ledger_specific". A question asked several times with the same retrieval (e.g. once per
+    ledger that was not ingested) is retrieved and generated once, all of them are embedded in
+    one model call up front, and at most `concurrency` are generated at once.
+    """
+    ledgers: Dict[str, TransactionLedger] = {}
+    sources = None
+    answered = []
+    # (question, retrieval filters) -> the batch questions sharing its answer
+    llm_questions: Dict[str, List[BatchQuestion]] = {}
+    with start_trace("batch", questions=len(questions), concurrency=concurrency) as trace:
+        with trace.span("route"):
+            for item in questions:
+                start = time.perf_counter()
+                if item.ledger and item.ledger not in ledgers:
+                    ledgers[item.ledger] = open_ledger(item.ledger)
+                answer = route_question(item.question, ledgers.get(item.ledger))
+                if answer is None:
+                    if item.ledger and "source" not in item.filters:
+                        sources = ingested_sources() if sources is None else sources
+                        if os.path.abspath(item.ledger) in sources:
+                            item.filters = dict(item.filters, source=sources[os.path.abspath(item.ledger)])
+                    key = json.dumps([item.question, item.filters], sort_keys=True)
+                    llm_questions.setdefault(key, []).append(item)
+                else:
+                    answered.append(result(item, "ledger", answer, [], time.perf_counter() - start))
+        trace.set(ledger_answers=len(answered), llm_answers=len(llm_questions))
+        engine = get_engine() if llm_questions else None
+        if engine:
+            engine.embed_queries([items[0].question for items in llm_questions.values()])
+    yield from answered
+    if not engine:
+        return
+
+    def ask(item: BatchQuestion):
+        start = time.perf_counter()
+        with start_trace("answer", question=item.question, batch=True):
+            answer, docs = engine.ask(item.question, hide_source=False, mute_stream=True, use_cache=use_cache,
+                                      filters=item.filters or None)
+        sources = sorted({doc.metadata.get("source", "") for doc in docs} - {""})
+        return answer, sources, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch-answer") as executor:
+        futures = {executor.submit(ask, items[0]): items for items in llm_questions.values()}
+        try:
+            for future in as_completed(futures):
+                try:
+                    answer, sources, seconds = future.result()
+                except Exception as e:
+                    for item in futures[future]:
+                        yield dict(result(item, "llm", None, [], 0.0), status="failed", error=str(e))
+                    continue
+                for item in futures[future]:
+                    yield result(item, "llm", answer, sources, seconds)
+        finally:
+            # Stopped early (e.g. Ctrl+C): don't start the questions still waiting
+            for future in futures:
+                future.cancel()
+
+
+def result(item: BatchQuestion, answered_by: str, answer: Optional[str], sources: List[str], seconds: float) -> dict:
+    # Whether the answer comes from this ledger rather than from all documents
+    ledger_specific = bool(item.ledger) and (answered_by == "ledger" or "source" in item.filters)
+    return {"id": item.id, "question": item.question, "ledger": item.ledger, "filters": item.filters,
+            "status": "ok", "answered_by": answered_by, "answer": answer, "sources": sources,
+            "ledger_specific": ledger_specific, "seconds": round(seconds, 3)}
+
+
+def read_results(path: str) -> Dict[str, dict]:
+    """
+    Successful results already in an output file, by question ID. A line cut off by an
+    interrupted run is ignored.
+    """
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path, encoding="utf8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "ok":
+                results[record["id"]] = record
+    return results
+
+
+def markdown_section(record: dict) -> str:
+    section = f"### {record['question']}\n\n"
+    if record["status"] != "ok":
+        return section + f"_Could not answer the question: {record['error']}_\n\n"
+    section += f"{record['answer'].strip()}\n\n"
+    if record["ledger"] and not record.get("ledger_specific", record["answered_by"] == "ledger"):
+        section += "_This ledger was not ingested; the answer draws on all documents, not on this ledger._\n\n"
+    if record["sources"]:
+        section += "_Sources: " + ", ".join(os.path.basename(source) for source in record["sources"]) + "_\n\n"
+    return section
+
+
+def write_markdown(path: str, records: List[dict]) -> None:
+    """
+    Writes the report: the answers in question order, grouped by ledger
+    """
+    with open(path + ".tmp", "w", encoding="utf8") as f:
+        f.write(f"# Finance insights\n\n_Generated {datetime.now():%d %b %Y %H:%M} from {len(records)} questions_\n\n")
+        for ledger in dict.fromkeys(record["ledger"] for record in records):
+            if ledger:
+                f.write(f"## {os.path.basename(ledger)}\n\n")
+            for record in records:
+                if record["ledger"] == ledger:
+                    f.write(markdown_section(record))
+    os.replace(path + ".tmp", path)
+
+
+def run_batch(questions: List[BatchQuestion], output_path: str, markdown_path: Optional[str] = None,
+              concurrency: int = batch_concurrency, use_cache: bool = True, resume: bool = True) -> List[dict]:
+    """
+    Answers a batch of questions, appending each result to the JSONL file at `output_path` as it is
+    ready, and returns the results in question order. With `resume`, questions answered by an
+    earlier run into the same file are skipped, so an interrupted batch picks up where it stopped.
+    The Markdown report, if requested, grows as answers arrive and is rewritten in question order
+    at the end.
+    """
+    results = read_results(output_path) if resume else {}
+    pending = [item for item in questions if item.id not in results]
+    print(f"{len(questions)} questions, {len(questions) - len(pending)} already answered in {output_path}")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    mode = "a" if resume else "w"
+    out = open(output_path, mode, encoding="utf8")
+    if resume and out.tell():
+        with open(output_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                # Ends in a line cut off by an interrupted run; start the next result on its own line
+                out.write("\n")
+    md = open(markdown_path, mode, encoding="utf8") if markdown_path else None
+    progress = tqdm(total=len(pending), desc="Answering", unit="question", ncols=100)
+    try:
+        for record in answer_batch(pending, concurrency, use_cache):
+            # Written as they arrive, so an interrupted run loses at most the answers being generated
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            if md:
+                md.write(markdown_section(record))
+                md.flush()
+            if record["status"] == "ok":
+                results[record["id"]] = record
+            progress.update(1)
+    finally:
+        progress.close()
+        out.close()
+        if md:
+            md.close()
+
+    failed = len(pending) - sum(item.id in results for item in pending)
+    records = [results[item.id] for item in questions if item.id in results]
+    if markdown_path:
+        write_markdown(markdown_path, records)
+    print(f"Answered {len(records)} of {len(questions)} questions" + (f", {failed} failed" if failed else ""))
+    return records
+
+
+def main():
+    args = parse_arguments()
+    questions = load_questions(args.questions, args.ledger)
+    output = args.output or os.path.splitext(args.questions)[0] + ".answers.jsonl"
+    run_batch(questions, output, args.markdown, concurrency=args.concurrency, use_cache=not args.no_cache,
+              resume=not args.no_resume)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Answer a file of questions with privateGPT and write the results '
+                                                 'as JSONL and optionally a Markdown report.')
+    parser.add_argument("questions",
+                        help='Text file with one question per line, or JSONL with a "question" per line.')
+    parser.add_argument("--output", "-o",
+                        help='JSONL results file (default: next to the questions, ending in .answers.jsonl).')
+    parser.add_argument("--markdown",
+                        help='Also write a Markdown report to this file.')
+    parser.add_argument("--ledger", action='append',
+                        help='Ask every question about this ledger CSV, e.g. one export per account; '
+                             'may be given several times.')
+    parser.add_argument("--concurrency", type=int, default=batch_concurrency,
+                        help=f'Answers generated at the same time (default {batch_concurrency}).')
+    parser.add_argument("--no-cache", action='store_true',
+                        help='Use this flag to always ask the LLM instead of reusing cached answers.')
+    parser.add_argument("--no-resume", action='store_true',
+                        help='Start over instead of skipping questions already answered in the output file.')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
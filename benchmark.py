@@ -0,0 +1,635 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# NumPy, pandas, LangChain and privateGPT are imported by the benchmarks that use them: isolated
+# runs start by re-importing this module, and the dashboard benchmark times importing them cold
+
+DEFAULT_QUESTIONS = [
+    "Where am I overspending?",
+    "How do I build a food budget?",
+    "What are some strategies to pay off credit card debt faster?",
+    "How can I avoid medical debt?",
+]
+RESULTS_VERSION = 1
+# Generated corpora, ledgers and stores
+DEFAULT_WORKDIR = os.path.join("cache", "bench")
+LEDGER_HEADER = ["Date", "Day", "Type", "Category", "Debit Amount", "Credit Amount", "Closing Balance"]
+
+
+def metric(value, unit, higher_is_better=False):
+    return {"value": float(value), "unit": unit, "higher_is_better": higher_is_better}
+
+
+def latency_metrics(name, latencies):
+    """
+    p50, p95 and p99 of a list of durations in seconds, as millisecond metrics
+    """
+    import numpy as np
+
+    values = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {f"{name}.p{q}_ms": metric(value, "ms") for q, value in zip((50, 95, 99), values)}
+
+
+def run_isolated(function, args=(), env=None):
+    """
+    Runs function(*args) in a fresh interpreter that sees the extra environment variables, so
+    module-level configuration and caches start clean, and returns its result
+    """
+    saved = dict(os.environ)
+    os.environ.update(env or {})
+    try:
+        # Spawned processes copy the environment when they start
+        with multiprocessing.get_context("spawn").Pool(1) as pool:
+            return pool.apply(function, args)
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+
+
+def cold_answer(query, retrieval_only=False):
+    """
+    Answers a query the way get_answer used to: rebuilding every component for each call.
+    """
+    from langchain.chains import RetrievalQA
+    from langchain.embeddings import HuggingFaceEmbeddings
+    from langchain.llms import Ollama
+    from langchain.vectorstores import Chroma
+
+    import privateGPT
+
+    embeddings = HuggingFaceEmbeddings(model_name=privateGPT.embeddings_model_name)
+    db = Chroma(persist_directory=privateGPT.persist_directory, embedding_function=embeddings)
+    retriever = db.as_retriever(search_kwargs={"k": privateGPT.target_source_chunks})
+    if retrieval_only:
+        return retriever.get_relevant_documents(query)
+    llm = Ollama(model=privateGPT.model)
+    qa = RetrievalQA.from_chain_type(llm=llm, chain_type="stuff", retriever=retriever, return_source_documents=True)
+    return qa(query)['result']
+
+
+def warm_answer(engine, query, retrieval_only=False):
+    """
+    Answers a query through the shared, already loaded QueryEngine.
+    """
+    if retrieval_only:
+        return engine.load()._qa.retriever.get_relevant_documents(query)
+    # Bypass the answer cache so repeats measure the engine, not cache hits
+    return engine.ask(query, mute_stream=True, use_cache=False)[0]
+
+
+def time_calls(fn, questions, repeat):
+    latencies = []
+    for _ in range(repeat):
+        for question in questions:
+            start = time.perf_counter()
+            fn(question)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def summarize(name, latencies):
+    print(f"{name:>6}: n={len(latencies)} mean={statistics.mean(latencies) * 1000:.1f}ms "
+          f"median={statistics.median(latencies) * 1000:.1f}ms max={max(latencies) * 1000:.1f}ms")
+
+
+def bench_query(args):
+    import privateGPT
+
+    questions = args.question or DEFAULT_QUESTIONS
+    cold = time_calls(lambda q: cold_answer(q, args.retrieval_only), questions, args.repeat)
+
+    engine = privateGPT.QueryEngine()
+    start = time.perf_counter()
+    engine.warm_up()
+    print(f"Engine warm-up took {(time.perf_counter() - start) * 1000:.1f}ms")
+    warm = time_calls(lambda q: warm_answer(engine, q, args.retrieval_only), questions, args.repeat)
+
+    summarize("before", cold)
+    summarize("after", warm)
+    print(f"Speed-up (median): {statistics.median(cold) / statistics.median(warm):.1f}x")
+    return dict(latency_metrics("query.cold", cold), **latency_metrics("query.warm", warm))
+
+
+def current_rss_mb():
+    """
+    Resident memory of this process; falls back to the peak where /proc is not available
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_vector_backend(backend, persist_dir, queries, k):
+    """
+    Opens one vector backend in a fresh process and times its queries; returns the measurements
+    and the IDs found for every query
+    """
+    from quantized_index import QuantizedIndex, quantized_index_path
+    from vectorstore import open_collection
+
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    if backend == "chroma":
+        index = open_collection(persist_dir)
+    else:
+        index = QuantizedIndex(quantized_index_path(persist_dir), rerank=backend == "quantized")
+    # Chroma loads its HNSW segment lazily, so opening includes the first query
+    found = [index.query(query_embeddings=[queries[0].tolist()], n_results=k)["ids"][0]]
+    open_seconds = time.perf_counter() - start
+
+    latencies = []
+    for query in queries[1:]:
+        start = time.perf_counter()
+        found.append(index.query(query_embeddings=[query.tolist()], n_results=k)["ids"][0])
+        latencies.append(time.perf_counter() - start)
+    return {"open_seconds": open_seconds, "rss_mb": current_rss_mb() - rss_before,
+            "latencies": latencies or [open_seconds], "found": found}
+
+
+def bench_vectors(args):
+    import numpy as np
+
+    import privateGPT
+    from quantized_index import build_quantized_index, is_quantized_index_current, quantized_index_path
+
+    persist_dir = args.persist_directory or privateGPT.persist_directory
+    if not is_quantized_index_current(persist_dir):
+        print("Building the quantized index...")
+        build_quantized_index(persist_dir)
+    directory = quantized_index_path(persist_dir)
+    vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+    ids = np.load(os.path.join(directory, "ids.npy"))
+    if not len(vectors):
+        print("The vectorstore is empty")
+        return
+
+    # Stored vectors with a little noise stand in for query embeddings, so no embedding model is needed
+    rng = np.random.RandomState(0)
+    sample = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    queries = np.asarray(vectors[np.sort(sample)], dtype=np.float32)
+    queries += rng.normal(scale=args.noise * float(np.abs(queries).mean()), size=queries.shape).astype(np.float32)
+    # Exact nearest neighbours by squared L2 distance, as ground truth
+    truth = []
+    for query in queries:
+        distances = np.einsum("ij,ij->i", vectors, vectors) - 2 * (vectors @ query)
+        truth.append(set(ids[np.argsort(distances)[:args.k]]))
+
+    print(f"{len(vectors)} vectors, {len(queries)} queries, k={args.k}")
+    results = {}
+    for backend in ("chroma", "quantized", "quantized-norerank"):
+        result = run_isolated(run_vector_backend, (backend, persist_dir, queries, args.k))
+        recall = statistics.mean(len(truth_ids & set(found)) / len(truth_ids)
+                                 for truth_ids, found in zip(truth, result["found"]))
+        print(f"{backend:>18}: recall@{args.k}={recall:.3f} open={result['open_seconds'] * 1000:.1f}ms "
+              f"rss=+{result['rss_mb']:.1f}MB median query={statistics.median(result['latencies']) * 1000:.2f}ms")
+        results[f"vectors.{backend}.recall"] = metric(recall, "ratio", higher_is_better=True)
+        results[f"vectors.{backend}.open_ms"] = metric(result["open_seconds"] * 1000, "ms")
+        results[f"vectors.{backend}.rss_mb"] = metric(result["rss_mb"], "MB")
+        results.update(latency_metrics(f"vectors.{backend}.query", result["latencies"]))
+    return results
+
+
+# Ingest throughput
+
+def build_corpus(source_dir, target_dir, scale):
+    """
+    Fills target_dir with `scale` copies of every supported file in source_dir, one copy per
+    subdirectory. Existing copies are kept, so corpora are reused across runs.
+    """
+    from ingest import LOADER_MAPPING
+    from ingest_manifest import scan_source_files
+
+    sources = scan_source_files(source_dir, LOADER_MAPPING)
+    for copy in range(scale):
+        for path in sources:
+            target = os.path.join(target_dir, f"copy-{copy}", os.path.relpath(path, source_dir))
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copy2(path, target)
+
+
+def run_ingest_isolated():
+    import ingest
+
+    return ingest.run_ingest(reset=True)
+
+
+def bench_ingest(args):
+    results = {}
+    for scale in args.scale:
+        corpus = os.path.join(args.workdir, f"corpus-x{scale}")
+        build_corpus(args.source_directory, corpus, scale)
+        # Without the caches and deduplication every copy costs as much as an original
+        env = {"SOURCE_DIRECTORY": corpus, "PERSIST_DIRECTORY": os.path.join(args.workdir, f"db-x{scale}"),
+               "EMBEDDING_CACHE_PATH": "", "PDF_PAGE_CACHE_PATH": "", "DEDUP": "0"}
+        stats = run_isolated(run_ingest_isolated, env=env)
+        seconds = max(stats["seconds"], 1e-9)
+        rates = {"files_per_sec": (stats["files"] / seconds, "files/s"),
+                 "chunks_per_sec": (stats["split_chunks"] / seconds, "chunks/s"),
+                 "embeddings_per_sec": (stats["embeddings"] / max(stats["embed_seconds"], 1e-9), "embeddings/s")}
+        print(f"x{scale}: {stats['files']} files, {stats['split_chunks']} chunks, {stats['embeddings']} embeddings "
+              f"in {seconds:.1f}s - " + ", ".join(f"{value:.1f} {unit}" for value, unit in rates.values()))
+        for name, (value, unit) in rates.items():
+            results[f"ingest.x{scale}.{name}"] = metric(value, unit, higher_is_better=True)
+        results[f"ingest.x{scale}.seconds"] = metric(seconds, "s")
+    return results
+
+
+# Query latency against a local LLM stand-in
+
+class StubOllamaServer:
+    """
+    Local stand-in for Ollama's streaming /api/generate endpoint. Every prompt is answered after a
+    prompt evaluation delay proportional to its length, with `tokens` tokens `token_latency`
+    seconds apart, as newline-delimited JSON like Ollama sends.
+    """
+
+    def __init__(self, tokens=32, token_latency=0.05, prefill_latency=0.25, host="127.0.0.1", port=0):
+        self.tokens = tokens
+        self.token_latency = token_latency
+        # Seconds per 1000 prompt characters
+        self.prefill_latency = prefill_latency
+        # TCP connections accepted, to tell whether clients reuse them
+        self.connections = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Chunked keep-alive responses, as Ollama sends them
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                stub.connections += 1
+
+            def do_POST(self):
+                if self.path.rstrip("/") != "/api/generate":
+                    self.send_error(404)
+                    return
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                stub.stream(self.wfile, request)
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://{host}:{self._server.server_address[1]}"
+
+    def stream(self, out, request):
+        prompt = request.get("prompt", "")
+        time.sleep(self.prefill_latency * len(prompt) / 1000)
+        for index in range(self.tokens + 1):
+            done = index == self.tokens
+            if index:
+                time.sleep(self.token_latency)
+            message = {"model": request.get("model"), "created_at": datetime.now(timezone.utc).isoformat(),
+                       "response": "" if done else f" token{index}", "done": done}
+            if done:
+                message.update(prompt_eval_count=len(prompt) // 4, eval_count=self.tokens)
+            line = json.dumps(message).encode("utf-8") + b"\n"
+            out.write(b"%x\r\n%s\r\n" % (len(line), line))
+            out.flush()
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="stub-ollama", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def bench_latency(args):
+    import privateGPT
+    from callbacks import TraceCallbackHandler
+    from tracing import Trace
+    from context_packing import CHARS_PER_TOKEN
+
+    questions = args.question or DEFAULT_QUESTIONS
+    stub = None
+    base_url = args.ollama_url
+    if not base_url:
+        stub = StubOllamaServer(args.tokens, args.token_latency, args.prefill_latency).start()
+        base_url = stub.url
+        print(f"Stub Ollama at {base_url}: {args.tokens} tokens, {args.token_latency * 1000:.0f}ms per token, "
+              f"{args.prefill_latency * 1000:.0f}ms per 1000 prompt characters")
+    try:
+        engine = privateGPT.QueryEngine(base_url=base_url)
+        engine.warm_up()
+        # One untimed answer opens the HTTP connection and fills lazy imports
+        engine.ask(questions[0], mute_stream=True, use_cache=False)
+
+        stages = {"retrieval": [], "first_token": [], "generation": [], "total": []}
+        tokens_per_sec, prompt_chars = [], []
+        for _ in range(args.repeat):
+            for question in questions:
+                # Never entered, so the answer's spans are collected here without being logged
+                trace = Trace("benchmark")
+                start = time.perf_counter()
+                engine.ask(question, mute_stream=True, use_cache=False, callbacks=[TraceCallbackHandler(trace)])
+                stages["total"].append(time.perf_counter() - start)
+                spans = {span.name: span.end - span.start for span in trace.spans}
+                stages["retrieval"].append(spans["retrieval"])
+                # From sending the prompt to the first token: prompt evaluation on a real model
+                stages["first_token"].append(spans["first_token"])
+                stages["generation"].append(spans["generation"])
+                tokens_per_sec.append(trace.attributes["tokens_per_sec"])
+                prompt_chars.append(trace.attributes["prompt_chars"])
+    finally:
+        if stub:
+            stub.stop()
+
+    results = {}
+    for stage, latencies in stages.items():
+        stage_metrics = latency_metrics(f"latency.{stage}", latencies)
+        print(f"{stage:>12}: " + " ".join(f"{name.rsplit('.', 1)[1]}={m['value']:.1f}"
+                                          for name, m in stage_metrics.items()))
+        results.update(stage_metrics)
+    results["latency.tokens_per_sec"] = metric(statistics.mean(tokens_per_sec), "tokens/s", higher_is_better=True)
+    results["latency.prompt_chars"] = metric(statistics.mean(prompt_chars), "chars")
+    results["latency.prompt_tokens"] = metric(statistics.mean(prompt_chars) / CHARS_PER_TOKEN, "tokens (est.)")
+    print(f"{statistics.mean(tokens_per_sec):.1f} tokens/s, {statistics.mean(prompt_chars):.0f} prompt characters "
+          f"(~{statistics.mean(prompt_chars) / CHARS_PER_TOKEN:.0f} tokens)")
+    return results
+
+
+def bench_stub_ollama(args):
+    stub = StubOllamaServer(args.tokens, args.token_latency, args.prefill_latency, port=args.port)
+    print(f"Stub Ollama listening on {stub.url}, point OLLAMA_BASE_URL at it. Ctrl-C to stop.")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub._server.server_close()
+
+
+# Dashboard startup over synthetic ledgers
+
+def generate_ledger(path, rows, sample_path, years=5, seed=0, block_rows=1_000_000):
+    """
+    Writes a synthetic bank export in the Banking-Data.csv schema: `rows` transactions spread
+    evenly over `years` years, with types, categories and (jittered) amounts drawn from the rows
+    of the sample export and a running closing balance
+    """
+    import numpy as np
+    import pandas as pd
+
+    from ledger import DATE_FORMAT
+
+    sample = pd.read_csv(sample_path)
+    rng = np.random.default_rng(seed)
+    days = pd.date_range("2018-01-01", periods=int(years * 365.25), freq="D")
+    day_labels, weekdays = days.strftime(DATE_FORMAT).to_numpy(), days.day_name().to_numpy()
+    balance = 100_000.0
+    with open(path + ".tmp", "w", newline="") as f:
+        f.write(",".join(LEDGER_HEADER) + "\n")
+        for start in range(0, rows, block_rows):
+            count = min(block_rows, rows - start)
+            day = (np.arange(start, start + count) * len(days)) // rows
+            picked = sample.iloc[rng.integers(0, len(sample), count)]
+            jitter = rng.uniform(0.5, 1.5, count)
+            debit = np.round(pd.to_numeric(picked["Debit Amount"], errors="coerce").fillna(0).to_numpy() * jitter, 2)
+            credit = np.round(pd.to_numeric(picked["Credit Amount"], errors="coerce").fillna(0).to_numpy() * jitter, 2)
+            closing = np.round(balance + np.cumsum(credit - debit), 2)
+            balance = closing[-1]
+            pd.DataFrame({"Date": day_labels[day], "Day": weekdays[day], "Type": picked["Type"].to_numpy(),
+                          "Category": picked["Category"].to_numpy(), "Debit Amount": debit,
+                          "Credit Amount": credit, "Closing Balance": closing}).to_csv(f, header=False, index=False)
+    os.replace(path + ".tmp", path)
+
+
+def run_dashboard_isolated():
+    """
+    Times what serving the dashboard costs: importing the dashboard module and rendering a session's
+    page (the Overview tab), then what opening an analysis tab adds: validating or building the ledger
+    cache, reading the cube and building each chart for the whole ledger
+    """
+    timings = {}
+    start = time.perf_counter()
+    import dashboard
+    from bokeh.document import Document
+
+    timings["import"] = time.perf_counter() - start
+    start = time.perf_counter()
+    dashboard.build_app().server_doc(Document())
+    timings["overview"] = time.perf_counter() - start
+    start = time.perf_counter()
+    from ledger_store import get_ledger_store
+
+    get_ledger_store().refresh()
+    timings["ledger_cache"] = time.perf_counter() - start
+    start = time.perf_counter()
+    cube = get_ledger_store().cube()
+    timings["cube"] = time.perf_counter() - start
+    for name, make_chart in (("expenses_chart", dashboard.make_expenses_pie_chart),
+                             ("income_chart", dashboard.make_income_pie_chart),
+                             ("trend_chart", dashboard.make_trendline_chart)):
+        start = time.perf_counter()
+        make_chart(cube)
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+def bench_dashboard(args):
+    from ledger import ledger_path
+
+    os.makedirs(args.workdir, exist_ok=True)
+    results = {}
+    for rows in args.rows:
+        path = os.path.join(args.workdir, f"ledger-{rows}.csv")
+        if not os.path.exists(path):
+            start = time.perf_counter()
+            generate_ledger(path, rows, args.sample or ledger_path)
+            print(f"Generated {path} in {time.perf_counter() - start:.1f}s")
+        cache_dir = os.path.join(args.workdir, f"ledger-cache-{rows}")
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        env = {"LEDGER_PATH": path, "LEDGER_CACHE_DIR": cache_dir}
+        # The first start builds the ledger cache, the second one finds it up to date
+        cold = run_isolated(run_dashboard_isolated, env=env)
+        warm = run_isolated(run_dashboard_isolated, env=env)
+        prefix = f"dashboard.{rows}_rows"
+        # Start-up ends with the Overview tab served; the ledger is first read by an analysis tab
+        results[f"{prefix}.cold_startup_ms"] = metric((cold["import"] + cold["overview"]) * 1000, "ms")
+        results[f"{prefix}.warm_startup_ms"] = metric((warm["import"] + warm["overview"]) * 1000, "ms")
+        results[f"{prefix}.ledger_cache_build_ms"] = metric(cold["ledger_cache"] * 1000, "ms")
+        results[f"{prefix}.first_analysis_tab_ms"] = metric(
+            (cold["ledger_cache"] + cold["cube"] + cold["expenses_chart"]) * 1000, "ms")
+        for chart in ("expenses_chart", "income_chart", "trend_chart"):
+            results[f"{prefix}.{chart}_ms"] = metric(warm[chart] * 1000, "ms")
+        print(f"{rows:>10} rows: cold start {results[f'{prefix}.cold_startup_ms']['value']:.0f}ms "
+              f"(then ledger cache {cold['ledger_cache'] * 1000:.0f}ms on the first analysis tab), "
+              f"warm start {results[f'{prefix}.warm_startup_ms']['value']:.0f}ms, charts "
+              + ", ".join(f"{warm[chart] * 1000:.0f}ms" for chart in ("expenses_chart", "income_chart", "trend_chart")))
+    return results
+
+
+def bench_suite(args):
+    results = {}
+    for bench in (bench_ingest, bench_latency, bench_dashboard):
+        print(f"== {bench.__name__[len('bench_'):]}")
+        results.update(bench(args))
+    return results
+
+
+# Results
+
+def write_results(path, command, results):
+    document = {"version": RESULTS_VERSION, "command": command,
+                "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                                "cpus": os.cpu_count()},
+                "metrics": results}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf8") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    print(f"Results written to {path}")
+
+
+def compare_results(baseline_path, results, tolerance):
+    """
+    Prints every metric next to its baseline value and returns the names of the metrics that got
+    worse by more than `tolerance` (relative to the baseline)
+    """
+    with open(baseline_path, encoding="utf8") as f:
+        baseline = json.load(f)["metrics"]
+    regressions = []
+    for name, current in sorted(results.items()):
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["value"], current["value"]
+        change = (after - before) / before if before else 0.0
+        worse = -change if current["higher_is_better"] else change
+        flag = ""
+        if worse > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<50} {before:>12.2f} -> {after:>12.2f} {current['unit']:<12} {change:+7.1%}{flag}")
+    return regressions
+
+
+def add_ingest_arguments(parser):
+    parser.add_argument("--source-directory", default="source_documents",
+                        help='Documents the synthetic corpora are copied from.')
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 4, 16],
+                        help='Corpus sizes, as copies of the source directory.')
+
+
+def add_latency_arguments(parser):
+    parser.add_argument("--question", "-q", action='append',
+                        help='Question to ask; may be given several times. Defaults to a built-in set.')
+    parser.add_argument("--repeat", "-n", type=int, default=3, help='How many times to ask every question.')
+    parser.add_argument("--ollama-url", help='Measure a real Ollama server instead of the stub.')
+    add_stub_arguments(parser)
+
+
+def add_stub_arguments(parser):
+    parser.add_argument("--tokens", type=int, default=32, help='Tokens the stub LLM answers with.')
+    parser.add_argument("--token-latency", type=float, default=0.05, help='Seconds between stub tokens.')
+    parser.add_argument("--prefill-latency", type=float, default=0.25,
+                        help='Seconds the stub takes per 1000 prompt characters before its first token.')
+
+
+def add_dashboard_arguments(parser):
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000, 10_000_000],
+                        help='Sizes of the synthetic ledgers.')
+    parser.add_argument("--sample", help='Bank export whose rows the synthetic ledgers are drawn from '
+                                         '(default: LEDGER_PATH or Banking-Data.csv).')
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Performance benchmarks for the privateGPT finance assistant.')
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    # Options shared by every benchmark
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--json", metavar="PATH", help='Write the results as JSON to this file.')
+    common.add_argument("--compare", metavar="BASELINE",
+                        help='Compare the results with a JSON file written by --json and exit with status 1 '
+                             'if any metric regressed.')
+    common.add_argument("--tolerance", type=float, default=0.1,
+                        help='Relative change a metric may get worse by before --compare fails (default 0.1).')
+    common.add_argument("--workdir", default=DEFAULT_WORKDIR,
+                        help=f'Directory for generated corpora, ledgers and stores (default {DEFAULT_WORKDIR}).')
+
+    query_parser = subparsers.add_parser("query", parents=[common],
+                                         help='Latency of repeated questions, per-call setup vs. shared engine.')
+    query_parser.add_argument("--question", "-q", action='append',
+                              help='Question to ask; may be given several times. Defaults to a built-in set.')
+    query_parser.add_argument("--repeat", "-n", type=int, default=3,
+                              help='How many times to ask every question.')
+    query_parser.add_argument("--retrieval-only", "-R", action='store_true',
+                              help='Skip the LLM call and only time retrieval, so Ollama is not needed.')
+    query_parser.set_defaults(func=bench_query)
+
+    vectors_parser = subparsers.add_parser("vectors", parents=[common], help='Recall, memory and open time of Chroma vs. the quantized index.')
+    vectors_parser.add_argument("--persist-directory", help='Vectorstore directory (default: PERSIST_DIRECTORY or db).')
+    vectors_parser.add_argument("--queries", type=int, default=200, help='Number of sampled queries.')
+    vectors_parser.add_argument("-k", type=int, default=4, help='Results per query.')
+    vectors_parser.add_argument("--noise", type=float, default=0.1,
+                                help='Relative noise added to the stored vectors used as queries.')
+    vectors_parser.set_defaults(func=bench_vectors)
+
+    ingest_parser = subparsers.add_parser("ingest", parents=[common],
+                                          help='Ingest throughput over copies of the source documents.')
+    add_ingest_arguments(ingest_parser)
+    ingest_parser.set_defaults(func=bench_ingest)
+
+    latency_parser = subparsers.add_parser("latency", parents=[common],
+                                           help='Retrieval and generation latency percentiles against a stub LLM.')
+    add_latency_arguments(latency_parser)
+    latency_parser.set_defaults(func=bench_latency)
+
+    dashboard_parser = subparsers.add_parser("dashboard", parents=[common],
+                                             help='Dashboard startup and chart build time over synthetic ledgers.')
+    add_dashboard_arguments(dashboard_parser)
+    dashboard_parser.set_defaults(func=bench_dashboard)
+
+    suite_parser = subparsers.add_parser("suite", parents=[common], help='The ingest, latency and dashboard benchmarks.')
+    add_ingest_arguments(suite_parser)
+    add_latency_arguments(suite_parser)
+    add_dashboard_arguments(suite_parser)
+    suite_parser.set_defaults(func=bench_suite)
+
+    stub_parser = subparsers.add_parser("stub-ollama", help='Serve the stub LLM, e.g. to try the dashboard without a model.')
+    stub_parser.add_argument("--port", type=int, default=11434, help='Port to listen on (default 11434).')
+    add_stub_arguments(stub_parser)
+    stub_parser.set_defaults(func=bench_stub_ollama)
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    results = args.func(args) or {}
+    if getattr(args, "json", None):
+        write_results(args.json, args.command, results)
+    if getattr(args, "compare", None):
+        regressions = compare_results(args.compare, results, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metrics got worse by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
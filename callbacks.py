@@ -0,0 +1,85 @@
+"""
+LangChain callback handlers. They live apart from llm_service and tracing so that importing those
+(and the dashboard) does not load LangChain; only answering a question does.
+"""
+import threading
+import time
+from typing import Callable, Dict
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+from llm_service import AnswerCancelled
+from tracing import Trace
+
+
+class TokenStreamHandler(BaseCallbackHandler):
+    """
+    Forwards every generated token to `on_token` and aborts the chain as soon as the request is cancelled.
+    """
+
+    # Let AnswerCancelled propagate instead of LangChain logging and swallowing it
+    raise_error = True
+
+    def __init__(self, on_token: Callable[[str], None], cancelled: threading.Event):
+        self.on_token = on_token
+        self.cancelled = cancelled
+
+    def _check(self) -> None:
+        if self.cancelled.is_set():
+            raise AnswerCancelled()
+
+    def on_llm_start(self, serialized, prompts, **kwargs) -> None:
+        self._check()
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        self._check()
+        self.on_token(token)
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """
+    Turns the callbacks of a RetrievalQA run into spans: retrieval, prompt assembly in the stuff
+    chain, time to the first token and generation, with chunk, character and token counts.
+    """
+
+    def __init__(self, trace: Trace):
+        self.trace = trace
+        self.marks: Dict[str, float] = {}
+        self.tokens = 0
+
+    def _mark(self, name: str) -> float:
+        return self.marks.setdefault(name, time.perf_counter())
+
+    def _span(self, name: str, start: str, end: str, **attributes) -> None:
+        if start in self.marks:
+            self.trace.add_span(name, self.marks[end] - self.marks[start], start=self.marks[start], **attributes)
+
+    def on_retriever_start(self, serialized, query, **kwargs) -> None:
+        self._mark("retrieval_start")
+
+    def on_retriever_end(self, documents, **kwargs) -> None:
+        self._mark("retrieval_end")
+        context_chars = sum(len(doc.page_content) for doc in documents)
+        self._span("retrieval", "retrieval_start", "retrieval_end", chunks=len(documents))
+        self.trace.set(retrieved_chunks=len(documents), context_chars=context_chars)
+
+    def on_llm_start(self, serialized, prompts, **kwargs) -> None:
+        self._mark("llm_start")
+        self._span("prompt", "retrieval_end", "llm_start")
+        self.trace.set(prompt_chars=sum(len(prompt) for prompt in prompts))
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        if "first_token" not in self.marks:
+            self._mark("first_token")
+            self._span("first_token", "llm_start", "first_token")
+        if token:
+            self.tokens += 1
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        self._mark("llm_end")
+        start = "first_token" if "first_token" in self.marks else "llm_start"
+        generation = self.marks["llm_end"] - self.marks[start]
+        tokens_per_sec = self.tokens / generation if generation > 0 else 0.0
+        self._span("generation", start, "llm_end", tokens=self.tokens)
+        self.trace.set(tokens=self.tokens, tokens_per_sec=round(tokens_per_sec, 2))
+
@@ -0,0 +1,180 @@
+import math
+import os
+import re
+from typing import Any, List, Optional, Tuple
+
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from langchain.schema import BaseRetriever, Document
+
+from tracing import current_trace
+
+# "0" passes the top TARGET_SOURCE_CHUNKS chunks to the stuff chain verbatim
+context_packing_enabled = os.environ.get('CONTEXT_PACKING', '1') == '1'
+# Estimated prompt tokens the retrieved context may take
+context_token_budget = int(os.environ.get('CONTEXT_TOKEN_BUDGET', 384))
+# Candidates retrieved before packing; how many of them fit depends on the budget
+context_max_chunks = int(os.environ.get('CONTEXT_MAX_CHUNKS', 12))
+
+# Llama and Mistral tokenizers average about four characters per token on English text
+CHARS_PER_TOKEN = 4
+# Shortest suffix/prefix match that counts as the splitter's overlap between neighbouring chunks
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 200
+# Sentences sharing this fraction of their words with an earlier one are dropped
+REDUNDANT_SIMILARITY = 0.8
+# A passage is only cut to fit the rest of the budget if at least this much of it fits
+MIN_PARTIAL_TOKENS = 32
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _same_region(a: Document, b: Document) -> bool:
+    return (a.metadata.get("source") == b.metadata.get("source")
+            and a.metadata.get("page") == b.metadata.get("page"))
+
+
+def _overlap(left: str, right: str) -> int:
+    """
+    Length of the longest suffix of `left` that is a prefix of `right`, or 0 if it is too short
+    to show that `right` continues `left`
+    """
+    for size in range(min(len(left), len(right), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if right.startswith(left[-size:]):
+            return size
+    return 0
+
+
+def merge_adjacent(chunks: List[Document]) -> List[Tuple[int, Document]]:
+    """
+    Joins chunks that continue each other (same source and page, overlapping text) into single
+    passages, so the overlap is sent once. Returns (best rank, passage) pairs in the order of the
+    passages' best chunk.
+    """
+    passages: List[Tuple[int, Document]] = []
+    for rank, chunk in enumerate(chunks):
+        text = chunk.page_content
+        merged = True
+        while merged:
+            merged = False
+            for index, (passage_rank, passage) in enumerate(passages):
+                if not _same_region(passage, chunk):
+                    continue
+                after, before = _overlap(passage.page_content, text), _overlap(text, passage.page_content)
+                if after or before:
+                    text = passage.page_content + text[after:] if after else text + passage.page_content[before:]
+                    rank = min(rank, passage_rank)
+                    del passages[index]
+                    merged = True
+                    break
+        passages.append((rank, Document(page_content=text, metadata=dict(chunk.metadata))))
+    return sorted(passages, key=lambda item: item[0])
+
+
+def _words(sentence: str) -> frozenset:
+    return frozenset(WORD_PATTERN.findall(sentence.lower()))
+
+
+def drop_redundant_sentences(passages: List[Document]) -> Tuple[List[Document], int]:
+    """
+    Removes sentences already said by an earlier (more relevant) passage, exactly or nearly.
+    Returns the remaining passages and the number of sentences dropped.
+    """
+    seen: List[frozenset] = []
+    kept_passages, dropped = [], 0
+    for passage in passages:
+        lines = []
+        for line in passage.page_content.split("\n"):
+            sentences = []
+            for sentence in SENTENCE_END.split(line):
+                words = _words(sentence)
+                if len(words) >= 3 and any(len(words & other) >= REDUNDANT_SIMILARITY * len(words | other)
+                                           for other in seen):
+                    dropped += 1
+                    continue
+                if len(words) >= 3:
+                    seen.append(words)
+                sentences.append(sentence)
+            if sentences:
+                lines.append(" ".join(sentences))
+        text = "\n".join(lines).strip()
+        if text:
+            kept_passages.append(Document(page_content=text, metadata=passage.metadata))
+    return kept_passages, dropped
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """
+    The leading sentences of `text` that fit in `max_tokens`; if not even the first sentence fits,
+    its leading words, or characters for text without spaces
+    """
+    kept = ""
+    for sentence in re.split(r"(?<=[.!?\n])\s*", text):
+        candidate = f"{kept} {sentence}" if kept else sentence
+        if estimate_tokens(candidate) > max_tokens:
+            break
+        kept = candidate
+    if kept:
+        return kept
+    limit = max(max_tokens, 0) * CHARS_PER_TOKEN
+    cut = text[:limit]
+    if len(text) > limit and not text[limit].isspace() and " " in cut.strip():
+        cut = cut.rsplit(" ", 1)[0]
+    return cut.strip()
+
+
+def pack_context(chunks: List[Document], token_budget: int) -> Tuple[List[Document], dict]:
+    """
+    Fits retrieved chunks, best first, into `token_budget` estimated tokens: neighbouring chunks
+    are merged, repeated sentences dropped, and passages are taken in order of relevance until
+    the budget is spent, the last one cut at a sentence boundary (or a word, for a passage
+    without one). A passage that cannot be cut to fit is skipped. Returns the passages and
+    statistics of the packing.
+    """
+    passages, dropped = drop_redundant_sentences([passage for _, passage in merge_adjacent(chunks)])
+    packed, used = [], 0
+    for passage in passages:
+        tokens = estimate_tokens(passage.page_content)
+        if used + tokens > token_budget:
+            remaining = token_budget - used
+            text = ""
+            if remaining >= MIN_PARTIAL_TOKENS or not packed:
+                text = _truncate(passage.page_content, remaining)
+            if not text:
+                continue
+            packed.append(Document(page_content=text, metadata=passage.metadata))
+            used += estimate_tokens(text)
+            break
+        packed.append(passage)
+        used += tokens
+    stats = {"candidates": len(chunks), "candidate_tokens": sum(estimate_tokens(c.page_content) for c in chunks),
+             "passages": len(packed), "tokens": used, "dropped_sentences": dropped}
+    return packed, stats
+
+
+class PackedRetriever(BaseRetriever):
+    """
+    Retrieves `retriever`'s candidates and packs them into the token budget, so the stuff chain
+    gets as much distinct context as the budget allows rather than a fixed number of chunks.
+    """
+
+    retriever: Any
+    token_budget: int = context_token_budget
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def with_filters(self, filters: Optional[dict]) -> "PackedRetriever":
+        return self.copy(update={"retriever": self.retriever.with_filters(filters)})
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        # Not reported to the callbacks, so traces see one retrieval with the packed result
+        chunks = self.retriever.get_relevant_documents(query)
+        with current_trace().span("pack_context", budget=self.token_budget) as span:
+            packed, stats = pack_context(chunks, self.token_budget)
+            span.set(**stats)
+        return packed
@@ -1,35 +1,43 @@
+import argparse
+import asyncio
+import threading
 import pandas as pd
 import plotly.express as px
 import panel as pn
-import subprocess
-from privateGPT import get_answer
+import param
+from tornado.web import RequestHandler
+# Nothing here imports LangChain or the embedding model: the query engine is loaded by the first
+# question, or in the background with --prewarm
+from ledger_store import get_ledger_store
+from llm_service import AnswerCancelled, AnswerSession, ServiceBusy, get_answer_service, loaded_engine, prewarm_engine
+from tracing import METRICS_CONTENT_TYPE, metrics
 # Ensure Panel extensions are loaded
 pn.extension("plotly")
 
-# Function to create the expenses pie chart for a specific time period
-def make_expenses_pie_chart(df, months=None):
-    df['Date'] = pd.to_datetime(df['Date'], format="%d/%m/%Y", errors='coerce')
-    df = df.dropna(subset=['Date'])
-
-    df['Type'] = df['Type'].str.strip()
-    df['Category'] = df['Category'].str.strip()
-
-    latest_date = df['Date'].max()
-    
-    if months:
-        start_date = latest_date - pd.DateOffset(months=months)
-        
-        sub_df = df[df['Date'] > start_date]
-        
-    else:
-        sub_df = df
-    
+# Preset periods, as months back from the newest transaction (None means the whole ledger)
+PERIOD_PRESETS = {"Total": None, "Last 1 Month": 1, "Last 3 Months": 3, "Last 6 Months": 6, "Last 12 Months": 12}
+EMPTY_LEDGER_MESSAGE = "No transactions in the ledger yet."
+
+def preset_range(cube, months):
+    """
+    Inclusive (start, end) days of a preset period. "Last N months" excludes the day N months
+    before the newest transaction, as the charts always did.
+    """
+    if months is None:
+        return cube.earliest, cube.latest
+    return cube.latest - pd.DateOffset(months=months) + pd.Timedelta(days=1), cube.latest
+
+def period_label(cube, start, end):
+    for label, months in PERIOD_PRESETS.items():
+        if preset_range(cube, months) == (start, end):
+            return label
+    return f"{start:%d %b %Y} - {end:%d %b %Y}"
 
+# Function to create the expenses pie chart for a specific time period
+def make_expenses_pie_chart(cube, start=None, end=None):
+    start, end = start or cube.earliest, end or cube.latest
+    category_totals = cube.expense_totals(start, end).reset_index()
 
-    sub_df = sub_df[(sub_df['Type'] == 'Debit') & (~sub_df['Category'].isin(['Interest', 'Salary']))]
-    
-    category_totals = sub_df.groupby("Category")["Debit Amount"].sum().reset_index()
-    
     if category_totals.empty:
         return px.scatter(title="No data available for selected period")
 
@@ -37,7 +45,7 @@ def make_expenses_pie_chart(df, months=None):
         category_totals,
         values="Debit Amount",
         names="Category",
-        title=f"Expense Breakdown by Category ({'Total' if not months else f'Last {months} Month' + ('s' if months > 1 else '')})",
+        title=f"Expense Breakdown by Category ({period_label(cube, start, end)})",
         color_discrete_sequence=px.colors.qualitative.Set2
     )
 
@@ -51,27 +59,10 @@ def make_expenses_pie_chart(df, months=None):
 
 
 # Function to create the income pie chart for a specific time period
-def make_income_pie_chart(df, months=None):
-    # Clean the 'Type' and 'Category' columns by removing leading/trailing spaces
-    df['Date'] = pd.to_datetime(df['Date'], format="%d/%m/%Y", errors='coerce')
-    df['Type'] = df['Type'].str.strip()
-    df['Category'] = df['Category'].str.strip()
-
-    latest_date = df['Date'].max()
-    
-    if months:
-        start_date = latest_date - pd.DateOffset(months=months)
-        
-        sub_df = df[df['Date'] > start_date]
-        
-    else:
-        sub_df = df
-
-    # Filter for 'Credit' transactions and 'Interest' or 'Salary' categories
-    sub_df = sub_df[(sub_df['Type'] == 'Credit') & (sub_df['Category'].isin(['Interest', 'Salary']))]
-
-    # Group by Category and sum the Credit Amount
-    category_totals = sub_df.groupby("Category")["Credit Amount"].sum().reset_index()
+def make_income_pie_chart(cube, start=None, end=None):
+    start, end = start or cube.earliest, end or cube.latest
+    # Salary and interest credits, summed per category
+    category_totals = cube.income_totals(start, end).reset_index()
 
     # If there is no data after filtering, return a message
     if category_totals.empty:
@@ -82,7 +73,7 @@ def make_income_pie_chart(df, months=None):
         category_totals,
         values="Credit Amount",
         names="Category",
-        title=f"Income Breakdown by Category ({'Total' if not months else f'Last {months} Month' + ('s' if months > 1 else '')})",
+        title=f"Income Breakdown by Category ({period_label(cube, start, end)})",
         color_discrete_sequence=px.colors.qualitative.Set1,
     )
 
@@ -96,45 +87,19 @@ def make_income_pie_chart(df, months=None):
     return pie_fig
 
 # Function to create the trendline chart for monthly income and expenses
-def make_trendline_chart(df):
-    # Ensure the 'Date' column is in datetime format and clean data
-    df['Date'] = pd.to_datetime(df['Date'], format="%d/%m/%Y", errors='coerce')
-    df = df.dropna(subset=['Date'])
-
-    # Filter for the last 8 months
-    latest_date = df['Date'].max()
-    start_date = latest_date - pd.DateOffset(months=8)
-    df = df[df['Date'] >= start_date]
-
-    # Clean and prepare the data
-    df['Type'] = df['Type'].str.strip()
-    df['Category'] = df['Category'].str.strip()
-    
-    # Extract year and month for grouping
-    df['YearMonth'] = df['Date'].dt.to_period("M")
-
-    # Aggregate data by month for both income and expenses
-    monthly_totals = df.groupby(['YearMonth', 'Type']).agg({
-        'Debit Amount': 'sum',
-        'Credit Amount': 'sum'
-    }).reset_index()
-
-    # Pivot the data to have 'Income' and 'Expense' columns for each month
-    monthly_totals['Income'] = monthly_totals.apply(lambda x: x['Credit Amount'] if x['Type'] == 'Credit' else 0, axis=1)
-    monthly_totals['Expenses'] = monthly_totals.apply(lambda x: x['Debit Amount'] if x['Type'] == 'Debit' else 0, axis=1)
-    
-    # Sum up income and expenses by month
-    monthly_totals = monthly_totals.groupby('YearMonth').agg({'Income': 'sum', 'Expenses': 'sum'}).reset_index()
-
-    # Convert YearMonth back to a date format for plotting
-    monthly_totals['YearMonth'] = monthly_totals['YearMonth'].dt.to_timestamp()
+def make_trendline_chart(cube, months=8):
+    if cube.latest is None:
+        return px.scatter(title=EMPTY_LEDGER_MESSAGE)
+    # Monthly totals from the cube for the last 8 months (start day included)
+    start = cube.latest - pd.DateOffset(months=months)
+    monthly_totals = cube.monthly_trend(start, cube.latest)
 
     # Create the line chart with separate lines for income and expenses
     trendline_fig = px.line(
         monthly_totals, 
         x='YearMonth', 
         y=['Income', 'Expenses'], 
-        title="Monthly Income and Expense Trends (Last 8 Months)",
+        title=f"Monthly Income and Expense Trends (Last {months} Months)",
         labels={"value": "Amount ($)", "YearMonth": "Month"},
         color_discrete_sequence=['#17BECF', '#FF7F0E']  # Color for income and expenses
     )
@@ -147,135 +112,267 @@ def make_trendline_chart(df):
     
     return trendline_fig
 
-# Function to interact with the LLM model
-def ask_llm(question):
-    # Replace this with actual LLM call 
-    answer = get_answer(question)
-    return answer
-
-# Load data from CSV file
-df = pd.read_csv('Banking-Data.csv', parse_dates=['Date'])
-
-# Create the pie charts for each period for both income and expenses
-income_pie_fig_total = make_income_pie_chart(df)  # Total period
-income_pie_fig_one_month = make_income_pie_chart(df, months=1)  # One-month period
-income_pie_fig_three_months = make_income_pie_chart(df, months=3)  # Three-month period
-income_pie_fig_six_months = make_income_pie_chart(df, months=6)  # Six-month period
-
-expense_pie_fig_total = make_expenses_pie_chart(df)  # Total period
-expense_pie_fig_one_month = make_expenses_pie_chart(df, months=1)  # One-month period
-expense_pie_fig_three_months = make_expenses_pie_chart(df, months=3)  # Three-month period
-expense_pie_fig_six_months = make_expenses_pie_chart(df, months=6)  # Six-month period
-
-# Generate the trendline figure
-trendline_fig = make_trendline_chart(df)
-
-# Create the sub-tabs for the "Expense Analysis" tab
-expense_subtabs = pn.Tabs(
-    ("Total", pn.pane.Plotly(expense_pie_fig_total, sizing_mode="stretch_both")),
-    ("Last 1 Month", pn.pane.Plotly(expense_pie_fig_one_month, sizing_mode="stretch_both")),
-    ("Last 3 Months", pn.pane.Plotly(expense_pie_fig_three_months, sizing_mode="stretch_both")),
-    ("Last 6 Months", pn.pane.Plotly(expense_pie_fig_six_months, sizing_mode="stretch_both"))
-)
-
-# Create the sub-tabs for the "Income Analysis" tab
-income_subtabs = pn.Tabs(
-    ("Total", pn.pane.Plotly(income_pie_fig_total, sizing_mode="stretch_both")),
-    ("Last 1 Month", pn.pane.Plotly(income_pie_fig_one_month, sizing_mode="stretch_both")),
-    ("Last 3 Months", pn.pane.Plotly(income_pie_fig_three_months, sizing_mode="stretch_both")),
-    ("Last 6 Months", pn.pane.Plotly(income_pie_fig_six_months, sizing_mode="stretch_both"))
-)
-
-
-# Panel widgets for question and response
-question_input = pn.widgets.TextInput(name="Ask a Question", placeholder="Type your question here...")
-submit_button = pn.widgets.Button(name="Submit", button_type="primary")
-response_area = pn.pane.Markdown("")  # Removed 'style' argument
-
-# Define the submit action
-def on_submit(event):
-    question = question_input.value
-    response = ask_llm(question)
-    response_area.object = f"**Response:** {response}"
-
-submit_button.on_click(on_submit)
-
-#load data from csv file
-def run_private_gpt():
-    try:
-        # Run privateGPT.py as a separate process
-        process = subprocess.Popen(['python', 'privateGPT.py'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-        # Print output and error in real-time
-        for line in process.stdout:
-            print(line.decode(), end='')
-
-        # Check for errors after process completes
-        stdout, stderr = process.communicate()
-        if stderr:
-            print("Error:", stderr.decode())
-
-    except Exception as e:
-        print(f"An error occurred: {e}")
+def period_chart(cube, make_chart):
+    """
+    A chart with a preset selector and a date range slider for an arbitrary period.
+    The figure is only built when the widgets change or the chart is first shown.
+    """
+    if cube.latest is None:
+        # An empty ledger has no period to slide over
+        return pn.pane.Markdown(EMPTY_LEDGER_MESSAGE)
+    presets = pn.widgets.RadioButtonGroup(name="Period", options=list(PERIOD_PRESETS), value="Total")
+    dates = pn.widgets.DateRangeSlider(name="Custom period", start=cube.earliest, end=cube.latest,
+                                       value=preset_range(cube, None), step=1)
+
+    def apply_preset(event):
+        dates.value = preset_range(cube, PERIOD_PRESETS[event.new])
+
+    presets.param.watch(apply_preset, 'value')
+
+    def chart(value):
+        start, end = (pd.Timestamp(v).normalize() for v in value)
+        return pn.pane.Plotly(make_chart(cube, start, end), sizing_mode="stretch_both")
+
+    return pn.Column(presets, dates, pn.panel(pn.bind(chart, dates), defer_load=True), sizing_mode="stretch_both")
+
+def collect_service_metrics():
+    """
+    Live answer queue and answer cache figures for the /metrics endpoint
+    """
+    service = get_answer_service().metrics()
+    yield "privategpt_answers_queued", "gauge", "Questions waiting for a worker", {}, service["queued"]
+    yield "privategpt_answers_in_flight", "gauge", "Questions being answered", {}, service["in_flight"]
+    for outcome in ("completed", "cancelled", "failed", "rejected"):
+        yield "privategpt_answers_total", "counter", "Questions by outcome", {"outcome": outcome}, service[outcome]
+    engine = loaded_engine()
+    cache = engine.answer_cache if engine else None
+    if cache:
+        stats = cache.stats()
+        yield "privategpt_answer_cache_entries", "gauge", "Cached answers", {}, stats["entries"]
+        for result, key in (("exact", "exact_hits"), ("semantic", "semantic_hits"), ("miss", "misses")):
+            yield "privategpt_answer_cache_lookups_total", "counter", "Answer cache lookups by result", \
+                {"result": result}, stats[key]
+        yield "privategpt_answer_cache_evictions_total", "counter", "Expired or evicted answers", {}, stats["evictions"]
+
+metrics.register_collector(collect_service_metrics)
+
+class MetricsHandler(RequestHandler):
+    """
+    Prometheus scrape endpoint: stage timings of traced answers plus the live service figures
+    """
+
+    def get(self):
+        self.set_header("Content-Type", METRICS_CONTENT_TYPE)
+        self.write(metrics.render())
+
+def update_queue_status(session, status_pane):
+    service = session.service.metrics()
+    status = f"{service['in_flight']} answering, {service['queued']} waiting"
+    engine = loaded_engine()
+    cache = engine.answer_cache if engine else None
+    if cache:
+        stats = cache.stats()
+        status += f" · answer cache: {stats['exact_hits'] + stats['semantic_hits']} hits, {stats['misses']} misses"
+    status_pane.object = status
+
+class LedgerVersion(param.Parameterized):
+    """
+    The ledger contents a session's charts were drawn from; charts bound to it are redrawn when
+    the ledger changes (e.g. updated by `ingest.py --watch`)
+    """
+
+    value = param.String(default="")
+
+    def check(self) -> None:
+        store = get_ledger_store()
+        try:
+            store.refresh()
+        except FileNotFoundError:
+            return
+        if self.value:
+            self.value = store.version
+        else:
+            # The first check only records the version the charts were drawn from
+            with param.discard_events(self):
+                self.value = store.version
+
+def analysis_chart(make_chart, version):
+    """
+    A period chart that reads the ledger cube when its tab is first opened, not when the page loads
+    """
+    # Load the (day x type x category) cube from the columnar ledger cache;
+    # only the precomputed aggregates are read, never the transaction rows
+    return pn.panel(pn.bind(lambda _: period_chart(get_ledger_store().cube(), make_chart), version.param.value),
+                    defer_load=True)
+
+def build_app():
+    """
+    Builds one session's dashboard. Widgets and the question state belong to the session, so
+    browser tabs don't share questions or chart periods.
+    """
+    # Panel widgets for question and response
+    question_input = pn.widgets.TextInput(name="Ask a Question", placeholder="Type your question here...")
+    submit_button = pn.widgets.Button(name="Submit", button_type="primary")
+    stop_button = pn.widgets.Button(name="Stop", button_type="light", disabled=True)
+    response_area = pn.pane.Markdown("")  # Removed 'style' argument
+    queue_status = pn.pane.Markdown("", styles={"color": "gray"})
+
+    # Questions run on the shared worker pool; this session only keeps track of its own
+    answer_session = AnswerSession(get_answer_service())
+
+    # Define the submit action. It runs on the server's event loop and only awaits the worker,
+    # so a slow answer never blocks other sessions or this session's charts
+    async def on_submit(event):
+        question = question_input.value.strip()
+        if not question:
+            return
+        loop = asyncio.get_running_loop()
+        tokens = asyncio.Queue()
+
+        def on_token(token):
+            # Called from the worker thread
+            loop.call_soon_threadsafe(tokens.put_nowait, token)
+
+        try:
+            request = answer_session.ask(question, on_token)
+        except ServiceBusy:
+            response_area.object = "**Response:** Too many questions are waiting, please try again in a moment."
+            update_queue_status(answer_session, queue_status)
+            return
+        stop_button.disabled = False
+        response_area.object = "**Response:** _Thinking..._"
+        update_queue_status(answer_session, queue_status)
+
+        answer = asyncio.wrap_future(request.future)
+        streamed = ""
+        while True:
+            next_token = asyncio.ensure_future(tokens.get())
+            await asyncio.wait([next_token, answer], return_when=asyncio.FIRST_COMPLETED)
+            if not next_token.done():
+                next_token.cancel()
+                break
+            streamed += next_token.result()
+            # Render whatever arrived meanwhile in one update
+            while not tokens.empty():
+                streamed += tokens.get_nowait()
+            if answer_session.current is request:
+                response_area.object = f"**Response:** {streamed}▌"
+
+        # A newer question from this session owns the response area now
+        if answer_session.current is not request:
+            return
+        try:
+            response = await answer
+        except (AnswerCancelled, asyncio.CancelledError):
+            response = f"{streamed} _(stopped)_"
+        except Exception as e:
+            response = f"{streamed}\n\n_Could not answer the question: {e}_"
+        response_area.object = f"**Response:** {response}"
+        stop_button.disabled = True
+        update_queue_status(answer_session, queue_status)
+
+    def on_stop(event):
+        answer_session.cancel()
+
+    submit_button.on_click(on_submit)
+    stop_button.on_click(on_stop)
+    # Keep the queue status current while other sessions are asking, and the charts with the ledger
+    ledger_version = LedgerVersion()
+
+    def poll():
+        update_queue_status(answer_session, queue_status)
+        ledger_version.check()
+
+    pn.state.onload(lambda: pn.state.add_periodic_callback(poll, period=2000))
+    # A closed session no longer needs its running question
+    pn.state.on_session_destroyed(lambda context: answer_session.cancel())
+
+    # Define the dashboard tabs with detailed descriptions
+    tabs = pn.Tabs(
+        ("Overview", pn.Column(
+            pn.pane.Markdown("### Welcome to the Personal Finance Dashboard"),
+            pn.pane.Markdown("This dashboard provides an overview of your income and expense categories, "
+                             "helping you track your financial activities. Use the tabs above to explore "
+                             "various aspects of your financial data."),
+            pn.Row(question_input, submit_button, stop_button),
+            response_area,  # Display the response here
+            queue_status,
+            pn.pane.Markdown("#### Dashboard Guide:"),
+            pn.pane.Markdown("1. **Income Analysis** - Explore your income sources and their breakdown.\n"
+                             "2. **Expense Analysis** - Get insights into your spending habits by category.\n"
+                             "3. **Trends** - Analyze monthly trends and seasonal patterns in your finances.\n")
+        )),
+        ("Income Analysis", pn.Column(
+            pn.pane.Markdown("### Income Breakdown"),
+            pn.pane.Markdown("The pie chart below provides a breakdown of your income sources, helping you "
+                             "identify the contributions of different income streams, like salary and interest."),
+            analysis_chart(make_income_pie_chart, ledger_version)  # Income chart with its period controls
+        )),
+        ("Expense Analysis", pn.Column(
+            pn.pane.Markdown("### Expense Breakdown"),
+            pn.pane.Markdown("Understand your spending patterns with this categorized view of your expenses. "
+                             "This analysis can help you pinpoint areas where you may want to reduce spending."),
+            analysis_chart(make_expenses_pie_chart, ledger_version)
+        )),
+        ("Trends", pn.Column(
+            pn.pane.Markdown("### Financial Trends Analysis"),
+            pn.pane.Markdown("This section displays Income and expense TrendLine"),
+            pn.panel(pn.bind(lambda _: pn.pane.Plotly(make_trendline_chart(get_ledger_store().cube()),
+                                                      sizing_mode="stretch_both"), ledger_version.param.value),
+                     defer_load=True)
+        )),
+        dynamic=True  # Only render the active tab
+    )
+
+    # Define the dashboard template with improved sidebar and header
+    return pn.template.FastListTemplate(
+        title="Summit Finance Analytics",
+        sidebar=[
+            pn.pane.Markdown("# Personal Finance Insights"),
+            pn.pane.Markdown("Welcome to your personal finance dashboard. Get an overview of your income and expenses, "
+                             "visualized through clear, easy-to-understand charts. These insights are generated from "
+                             "your banking data using a Local LLM."),
+            pn.pane.Markdown("### Navigation Guide"),
+            pn.pane.Markdown("Use the tabs on the main screen to explore detailed views of your **Income Analysis**, "
+                             "**Expense Analysis**, and **Trends**."),
+            pn.pane.PNG("logo.png", sizing_mode="scale_both")
+        ],
+        main=[
+            pn.Row(tabs, sizing_mode="stretch_both")
+        ],
+        accent_base_color="#000000",
+        header_background="#000000",
+    )
 
-if __name__ == "__main__":
-    print("Starting privateGPT from dashboard...")
-    run_private_gpt()
-    
+def prewarm():
+    """
+    Loads the query engine (LangChain, the embedding model, the vector store) and the ledger cache in
+    background threads while the server is already answering requests
+    """
+    prewarm_engine()
+    threading.Thread(target=get_ledger_store().refresh, name="ledger-warmup", daemon=True).start()
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Personal finance dashboard with questions answered by privateGPT.')
+    parser.add_argument("--port", type=int, default=5006,
+                        help='Port to serve the dashboard on (default 5006).')
+    parser.add_argument("--prewarm", action='store_true',
+                        help='Load the models in the background at start-up, so the first question '
+                             'does not wait for them.')
+    parser.add_argument("--no-browser", action='store_true',
+                        help='Use this flag to not open the dashboard in a browser.')
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    if args.prewarm:
+        prewarm()
+    # Display the dashboard, with Prometheus metrics at /metrics
+    pn.serve(build_app, port=args.port, show=not args.no_browser, title="Summit Finance Analytics",
+             extra_patterns=[(r"/metrics", MetricsHandler)])
 
-# Define the dashboard tabs with detailed descriptions
-tabs = pn.Tabs(
-    ("Overview", pn.Column(
-        pn.pane.Markdown("### Welcome to the Personal Finance Dashboard"),
-        pn.pane.Markdown("This dashboard provides an overview of your income and expense categories, "
-                         "helping you track your financial activities. Use the tabs above to explore "
-                         "various aspects of your financial data."),
-        pn.Row(question_input, submit_button),
-        response_area,  # Display the response here
-        pn.pane.Markdown("#### Dashboard Guide:"),
-        pn.pane.Markdown("1. **Income Analysis** - Explore your income sources and their breakdown.\n"
-                         "2. **Expense Analysis** - Get insights into your spending habits by category.\n"
-                         "3. **Trends** - Analyze monthly trends and seasonal patterns in your finances.\n")
-    )),
-    ("Income Analysis", pn.Column(
-        pn.pane.Markdown("### Income Breakdown"),
-        pn.pane.Markdown("The pie chart below provides a breakdown of your income sources, helping you "
-                         "identify the contributions of different income streams, like salary and interest."),
-        income_subtabs  # Add income subtabs for different periods
-    )),
-    ("Expense Analysis", pn.Column(
-        pn.pane.Markdown("### Expense Breakdown"),
-        pn.pane.Markdown("Understand your spending patterns with this categorized view of your expenses. "
-                         "This analysis can help you pinpoint areas where you may want to reduce spending."),
-        expense_subtabs
-    )),
-    ("Trends", pn.Column(
-        pn.pane.Markdown("### Financial Trends Analysis"),
-        pn.pane.Markdown("This section displays Income and expense TrendLine"),
-        pn.pane.Plotly(trendline_fig, sizing_mode="stretch_both")  # Add the trendline chart here
-    ))
-)
-
-# Define the dashboard template with improved sidebar and header
-template = pn.template.FastListTemplate(
-    title="Summit Finance Analytics",
-    sidebar=[
-        pn.pane.Markdown("# Personal Finance Insights"),
-        pn.pane.Markdown("Welcome to your personal finance dashboard. Get an overview of your income and expenses, "
-                         "visualized through clear, easy-to-understand charts. These insights are generated from "
-                         "your banking data using a Local LLM."),
-        pn.pane.Markdown("### Navigation Guide"),
-        pn.pane.Markdown("Use the tabs on the main screen to explore detailed views of your **Income Analysis**, "
-                         "**Expense Analysis**, and **Trends**."),
-        pn.pane.PNG("logo.png", sizing_mode="scale_both")
-    ],
-    main=[
-        pn.Row(tabs, sizing_mode="stretch_both")
-    ],
-    accent_base_color="#000000",
-    header_background="#000000",
-)
-
-run_private_gpt()
-# Display the dashboard
-template.show()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
+elif __name__.startswith("bokeh"):
+    # `panel serve dashboard.py`
+    build_app().servable()
@@ -0,0 +1,126 @@
+import hashlib
+import os
+import sqlite3
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from embedding import normalize_text
+
+DEDUP_INDEX_FILE = "dedup.sqlite3"
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class ChunkDeduplicator:
+    """
+    Persistent index of the chunks in the vector store used to drop duplicates before they are embedded.
+
+    Exact duplicates are found by the hash of the normalized text, near-duplicates by MinHash
+    signatures over word shingles bucketed with LSH banding. The index also records every source
+    file that references a stored chunk, so a chunk is only deleted when its last source goes away.
+    Changes become visible to the same connection immediately and are made durable by commit(),
+    which the ingest writer calls after the matching vectors are stored.
+    """
+
+    def __init__(self, path: str, threshold: float = 0.85, num_perm: int = 128, bands: int = 16, shingle_size: int = 5):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(42)
+        self._a = rng.randint(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, hash TEXT NOT NULL, signature BLOB NOT NULL);
+            CREATE INDEX IF NOT EXISTS chunks_hash ON chunks (hash);
+            CREATE TABLE IF NOT EXISTS bands (band INTEGER NOT NULL, bucket INTEGER NOT NULL, id TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS bands_bucket ON bands (band, bucket);
+            CREATE INDEX IF NOT EXISTS bands_id ON bands (id);
+            CREATE TABLE IF NOT EXISTS refs (id TEXT NOT NULL, source TEXT NOT NULL, PRIMARY KEY (id, source));
+            CREATE INDEX IF NOT EXISTS refs_source ON refs (source);
+        """)
+
+    def signature(self, text: str) -> np.ndarray:
+        tokens = normalize_text(text).lower().split()
+        size = self.shingle_size
+        shingles = {" ".join(tokens[i:i + size]) for i in range(max(1, len(tokens) - size + 1))}
+        hashes = np.fromiter((int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+                              for s in shingles), dtype=np.uint64, count=len(shingles))
+        # Universal hashing with wrap-around uint64 arithmetic; truncating to 32 bits before taking
+        # the minimum keeps the permutations independent of each other
+        with np.errstate(over="ignore"):
+            permuted = np.bitwise_and((hashes[:, None] * self._a + self._b) % _MERSENNE_PRIME, _MAX_HASH)
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _band_buckets(self, signature: np.ndarray) -> List[Tuple[int, int]]:
+        buckets = []
+        for band in range(self.bands):
+            digest = hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(), digest_size=8).digest()
+            buckets.append((band, int.from_bytes(digest, "little", signed=True)))
+        return buckets
+
+    def match(self, text: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Returns (chunk ID, "exact" or "near") of a stored chunk duplicating the text, or (None, None)
+        """
+        row = self._conn.execute("SELECT id FROM chunks WHERE hash = ? LIMIT 1", (content_hash(text),)).fetchone()
+        if row:
+            return row[0], "exact"
+        signature = self.signature(text)
+        candidates = set()
+        for band, bucket in self._band_buckets(signature):
+            candidates.update(r[0] for r in self._conn.execute(
+                "SELECT id FROM bands WHERE band = ? AND bucket = ?", (band, bucket)))
+        best_id, best_score = None, self.threshold
+        for candidate in candidates:
+            blob = self._conn.execute("SELECT signature FROM chunks WHERE id = ?", (candidate,)).fetchone()[0]
+            score = float(np.mean(np.frombuffer(blob, dtype=np.uint32) == signature))
+            if score >= best_score:
+                best_id, best_score = candidate, score
+        return (best_id, "near") if best_id else (None, None)
+
+    def add(self, chunk_id: str, text: str) -> None:
+        signature = self.signature(text)
+        self._conn.execute("INSERT OR REPLACE INTO chunks (id, hash, signature) VALUES (?, ?, ?)",
+                           (chunk_id, content_hash(text), signature.tobytes()))
+        self._conn.execute("DELETE FROM bands WHERE id = ?", (chunk_id,))
+        self._conn.executemany("INSERT INTO bands (band, bucket, id) VALUES (?, ?, ?)",
+                               [(band, bucket, chunk_id) for band, bucket in self._band_buckets(signature)])
+
+    def add_ref(self, chunk_id: str, source: str) -> None:
+        self._conn.execute("INSERT OR IGNORE INTO refs (id, source) VALUES (?, ?)", (chunk_id, source))
+
+    def remove_ref(self, chunk_id: str, source: str) -> List[str]:
+        """
+        Drops one source's reference to a chunk and returns the sources still referencing it
+        """
+        self._conn.execute("DELETE FROM refs WHERE id = ? AND source = ?", (chunk_id, source))
+        return self.sources(chunk_id)
+
+    def sources(self, chunk_id: str) -> List[str]:
+        return [r[0] for r in self._conn.execute("SELECT source FROM refs WHERE id = ? ORDER BY source", (chunk_id,))]
+
+    def chunk_ids(self, source: str) -> List[str]:
+        return [r[0] for r in self._conn.execute("SELECT id FROM refs WHERE source = ?", (source,))]
+
+    def forget(self, chunk_id: str) -> None:
+        for table in ("chunks", "bands", "refs"):
+            self._conn.execute(f"DELETE FROM {table} WHERE id = ?", (chunk_id,))
+
+    def commit(self) -> None:
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,162 @@
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+# The cache lives outside the persist directory so it survives `ingest.py --reset`
+embedding_cache_path = os.environ.get('EMBEDDING_CACHE_PATH', os.path.join('cache', 'embeddings.sqlite3'))
+embedding_workers = int(os.environ.get('EMBEDDING_WORKERS', 1))
+embedding_threads = int(os.environ.get('EMBEDDING_THREADS', max(1, (os.cpu_count() or 1) // embedding_workers)))
+encode_batch_size = int(os.environ.get('EMBEDDING_BATCH_SIZE', 32))
+
+
+def normalize_text(text: str) -> str:
+    """
+    Collapses whitespace, which the tokenizer ignores anyway, so trivially different copies of a
+    chunk share one cache entry
+    """
+    return " ".join(text.split())
+
+
+def cache_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent map from (model name, normalized chunk text) to its embedding vector
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's host parameter limit
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part)
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()])
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+_worker_model = None
+
+def _init_worker(model_name: str, threads: int) -> None:
+    global _worker_model
+    _worker_model = load_model(model_name, threads)
+
+def _encode_in_worker(texts: List[str]) -> List[List[float]]:
+    return encode(_worker_model, texts)
+
+
+def load_model(model_name: str, threads: int):
+    import torch
+    import sentence_transformers
+
+    torch.set_num_threads(threads)
+    return sentence_transformers.SentenceTransformer(model_name)
+
+
+def encode(model, texts: List[str]) -> List[List[float]]:
+    # Same preprocessing and encode defaults as HuggingFaceEmbeddings, so stored vectors match
+    # the query vectors privateGPT.py computes
+    texts = [text.replace("\n", " ") for text in texts]
+    return model.encode(texts, batch_size=encode_batch_size, show_progress_bar=False).tolist()
+
+
+class CachedEmbedder(Embeddings):
+    """
+    Batch embedder for ingestion. Looks every chunk up in the embedding cache first and only
+    encodes the missing ones, either in-process or spread over `workers` spawned processes that
+    each use `threads` torch threads.
+    """
+
+    def __init__(self, model_name: str, cache_path: Optional[str] = embedding_cache_path,
+                 workers: int = embedding_workers, threads: int = embedding_threads):
+        self.model_name = model_name
+        self.workers = workers
+        self.threads = threads
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
+        self.hits = 0
+        self.misses = 0
+        # Time spent encoding, excluding cache lookups
+        self.compute_seconds = 0.0
+        self._model = None
+        self._pool = None
+
+    def _compute(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        vectors = self._encode(texts)
+        self.compute_seconds += time.perf_counter() - start
+        return vectors
+
+    def load(self) -> None:
+        """
+        Loads the model, or starts the worker processes, ahead of the first chunk that misses the cache
+        """
+        if self.workers <= 1:
+            if self._model is None:
+                self._model = load_model(self.model_name, self.threads)
+        elif self._pool is None:
+            # Spawned rather than forked: forking after torch has started its threads can deadlock
+            context = multiprocessing.get_context("spawn")
+            self._pool = context.Pool(self.workers, initializer=_init_worker, initargs=(self.model_name, self.threads))
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        self.load()
+        if self.workers <= 1:
+            return encode(self._model, texts)
+        part_size = max(encode_batch_size, -(-len(texts) // self.workers))
+        parts = [texts[start:start + part_size] for start in range(0, len(texts), part_size)]
+        return [vector for vectors in self._pool.map(_encode_in_worker, parts) for vector in vectors]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [cache_key(self.model_name, text) for text in texts]
+        found = self.cache.get_many(list(set(keys))) if self.cache else {}
+        # Identical chunks within the batch are only encoded once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            computed = dict(zip(missing, self._compute(list(missing.values()))))
+            if self.cache:
+                self.cache.put_many(computed)
+            found.update(computed)
+        self.misses += len(missing)
+        self.hits += len(texts) - len(missing)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        if self.cache:
+            self.cache.close()
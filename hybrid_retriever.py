@@ -0,0 +1,108 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from langchain.schema import BaseRetriever, Document
+
+from lexical_index import filter_values, source_flag
+from tracing import current_trace
+
+# Candidates taken from each ranking before they are fused
+hybrid_fetch_k = int(os.environ.get('HYBRID_FETCH_K', 20))
+# Rank offset of reciprocal rank fusion; 60 is the value from the original paper
+rrf_constant = int(os.environ.get('RRF_K', 60))
+
+# Lexical searches run next to the query embedding and dense search instead of after them
+_lexical_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="lexical-search")
+
+
+def chroma_where(filters: Optional[dict]) -> Optional[dict]:
+    """
+    Translates retrieval filters (source, doc_type, date_from, date_to) into a Chroma where clause
+    """
+    conditions = []
+    if filters and filters.get("source"):
+        # Any file a deduplicated chunk came from; chunks stored before source flags only have "source"
+        options = [option for value in filter_values(filters["source"])
+                   for option in ({"source": {"$eq": value}}, {source_flag(value): {"$eq": 1}})]
+        conditions.append({"$or": options})
+    if filters and filters.get("doc_type"):
+        options = [{"doc_type": {"$eq": value}} for value in filter_values(filters["doc_type"])]
+        conditions.append(options[0] if len(options) == 1 else {"$or": options})
+    if filters and filters.get("date_from") is not None:
+        # Ledger summaries cover date..date_to and match when that period overlaps the filter's
+        conditions.append({"$or": [{"date": {"$gte": filters["date_from"]}},
+                                   {"date_to": {"$gte": filters["date_from"]}}]})
+    if filters and filters.get("date_to") is not None:
+        conditions.append({"date": {"$lte": filters["date_to"]}})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = rrf_constant) -> List[str]:
+    """
+    Merges ranked ID lists by summing 1 / (k + rank) over the lists each ID appears in
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fuses dense similarity search in Chroma with BM25 search in the lexical index.
+
+    Filters are applied inside both searches, so the ANN search only considers matching chunks
+    rather than post-filtering its top hits. Without a lexical index it is a plain dense
+    retriever with the same filters.
+    """
+
+    collection: Any
+    embed_query: Callable[[str], List[float]]
+    lexical: Any = None
+    k: int = 4
+    fetch_k: int = hybrid_fetch_k
+    rrf_k: int = rrf_constant
+    filters: Optional[dict] = None
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def with_filters(self, filters: Optional[dict]) -> "HybridRetriever":
+        return self.copy(update={"filters": filters})
+
+    def _timed_lexical_search(self, query: str, k: int):
+        start = time.perf_counter()
+        hits = self.lexical.search(query, k, self.filters)
+        return start, time.perf_counter(), hits
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        trace = current_trace()
+        fetch_k = max(self.fetch_k, self.k)
+        lexical = _lexical_executor.submit(self._timed_lexical_search, query, fetch_k) if self.lexical else None
+        embedding = list(self.embed_query(query))
+        with trace.span("vector_search", k=fetch_k):
+            dense = self.collection.query(query_embeddings=[embedding], n_results=fetch_k,
+                                          where=chroma_where(self.filters), include=["documents", "metadatas"])
+        documents = {chunk_id: Document(page_content=text, metadata=metadata or {})
+                     for chunk_id, text, metadata in zip(dense["ids"][0], dense["documents"][0], dense["metadatas"][0])}
+        if lexical is None:
+            return list(documents.values())[:self.k]
+
+        # Timed in the search thread, which does not see the trace
+        start, end, lexical_hits = lexical.result()
+        trace.add_span("lexical_search", end - start, start=start, hits=len(lexical_hits))
+        ranked = reciprocal_rank_fusion([dense["ids"][0], [chunk_id for chunk_id, _ in lexical_hits]],
+                                        self.rrf_k)[:self.k]
+        missing = [chunk_id for chunk_id in ranked if chunk_id not in documents]
+        if missing:
+            found = self.collection.get(ids=missing, include=["documents", "metadatas"])
+            for chunk_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"]):
+                documents[chunk_id] = Document(page_content=text, metadata=metadata or {})
+        # Chunks deleted since the lexical index was read are skipped
+        return [documents[chunk_id] for chunk_id in ranked if chunk_id in documents]
@@ -1,6 +1,12 @@
 import os
-import glob
-from typing import List
+import argparse
+import queue
+import resource
+import shutil
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from multiprocessing import Pool
 from tqdm import tqdm
 
@@ -18,19 +24,29 @@ from langchain.document_loaders import (
     UnstructuredWordDocumentLoader,
 )
 
+import pandas as pd
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores import Chroma
-from langchain.embeddings import HuggingFaceEmbeddings
 from langchain.docstore.document import Document
-import sentence_transformers
-
-CHROMA_SETTINGS = {
-    "host": "localhost",
-    "port": 8000,
-    "persist_directory": "./chroma_data",
-    "metric": "cosine",
-    "embedding_dim": 768
-}
+
+from dedup import DEDUP_INDEX_FILE, ChunkDeduplicator
+from embedding import CachedEmbedder
+from ledger import LEDGER_COLUMNS, TransactionLedger, ledger_summaries, load_ledger
+from lexical_index import LEXICAL_INDEX_FILE, LexicalIndex, chunk_fields, flagged_sources, source_flag
+from ingest_manifest import IngestManifest, chunk_id, file_digest, scan_source_files
+from pdf_pages import load_pdf_pages, page_count
+from tracing import current_trace, start_trace
+from vectorstore import (
+    LAYOUT_CHROMA_04,
+    LAYOUT_LEGACY,
+    LAYOUT_ORPHANED,
+    IncompatibleStoreError,
+    build_store_meta,
+    check_compatibility,
+    detect_layout,
+    open_collection,
+    read_store_meta,
+    write_store_meta,
+)
 
 # Load environment variables
 persist_directory = os.environ.get('PERSIST_DIRECTORY', 'db')
@@ -38,6 +54,21 @@ source_directory = os.environ.get('SOURCE_DIRECTORY', 'source_documents')
 embeddings_model_name = os.environ.get('EMBEDDINGS_MODEL_NAME', 'all-MiniLM-L6-v2')
 chunk_size = 500
 chunk_overlap = 50
+batch_size = int(os.environ.get('INGEST_BATCH_SIZE', 256))
+# Bounds between pipeline stages: split files waiting for the writer, files being parsed
+queue_size = int(os.environ.get('INGEST_QUEUE_SIZE', 4))
+max_files_in_flight = int(os.environ.get('INGEST_MAX_FILES_IN_FLIGHT', 2 * (os.cpu_count() or 1)))
+checkpoint_every = int(os.environ.get('INGEST_CHECKPOINT_EVERY', 10))
+# PDFs are extracted in page ranges of this size, spread over the loader pool
+pdf_pages_per_task = int(os.environ.get('PDF_PAGES_PER_TASK', 16))
+# Drop exact and near-duplicate chunks; near-duplicates are chunks with an estimated Jaccard
+# similarity of their word shingles of at least DEDUP_THRESHOLD
+deduplicate = os.environ.get('DEDUP', '1') == '1'
+dedup_threshold = float(os.environ.get('DEDUP_THRESHOLD', 0.85))
+# Bank exports become monthly and per-category summaries instead of one document per row
+ledger_summaries_enabled = os.environ.get('LEDGER_SUMMARIES', '1') == '1'
+# Recorded in the store metadata; changing it re-ingests the CSV files
+csv_loader_name = "ledger-summary-1" if ledger_summaries_enabled else "rows"
 
 # Custom document loaders
 class MyElmLoader(UnstructuredEmailLoader):
@@ -62,9 +93,25 @@ class MyElmLoader(UnstructuredEmailLoader):
         return doc
 
 
+class LedgerCSVLoader(CSVLoader):
+    """
+    CSVLoader that recognises bank exports (Date, Type, Category and amount columns) and emits one
+    summary document per month and per category and year instead of one document per transaction.
+    Other CSV files are still loaded row by row.
+    """
+
+    def load(self) -> List[Document]:
+        columns = pd.read_csv(self.file_path, nrows=0, encoding=self.encoding).columns.str.strip()
+        if not ledger_summaries_enabled or not set(LEDGER_COLUMNS).issubset(columns):
+            return CSVLoader.load(self)
+        ledger = TransactionLedger(load_ledger(self.file_path))
+        return [Document(page_content=text, metadata=metadata)
+                for text, metadata in ledger_summaries(ledger, self.file_path)]
+
+
 # Map file extensions to document loaders and their arguments
 LOADER_MAPPING = {
-    ".csv": (CSVLoader, {}),
+    ".csv": (LedgerCSVLoader, {}),
     # ".docx": (Docx2txtLoader, {}),
     ".doc": (UnstructuredWordDocumentLoader, {}),
     ".docx": (UnstructuredWordDocumentLoader, {}),
@@ -91,76 +138,492 @@ def load_single_document(file_path: str) -> List[Document]:
 
     raise ValueError(f"Unsupported file extension '{ext}'")
 
-def load_documents(source_dir: str, ignored_files: List[str] = []) -> List[Document]:
+def load_file(file_path: str) -> List[Document]:
+    return load_single_document(file_path)
+
+def plan_load_tasks(file_path: str, sha256: str) -> List[Tuple[Callable, tuple]]:
+    """
+    Splits loading a file into pool tasks: page ranges for PDFs, the whole file otherwise
     """
-    Loads all documents from the source documents directory, ignoring specified files
+    if file_path.lower().endswith(".pdf"):
+        pages = page_count(file_path)
+        return [(load_pdf_pages, (file_path, sha256, start, min(start + pdf_pages_per_task, pages)))
+                for start in range(0, max(pages, 1), pdf_pages_per_task)]
+    return [(load_file, (file_path,))]
+
+def iter_loaded_files(file_paths: List[str], max_in_flight: int) -> Iterator[Tuple[str, str, List[Document]]]:
     """
-    all_files = []
-    for ext in LOADER_MAPPING:
-        all_files.extend(
-            glob.glob(os.path.join(source_dir, f"**/*{ext}"), recursive=True)
-        )
-    filtered_files = [file_path for file_path in all_files if file_path not in ignored_files]
+    Loads files in a process pool and yields each file's (path, SHA-256, documents) as soon as all
+    of it is parsed. Large PDFs are split into page ranges, so one big file is parsed by several
+    processes instead of holding up the end of the run. At most max_in_flight tasks are being
+    parsed or waiting to be consumed at any time, so memory does not grow with the size of the corpus.
+    """
+    results = queue.Queue()
+
+    def iter_tasks():
+        for file_path in file_paths:
+            sha256 = file_digest(file_path)
+            file_tasks = plan_load_tasks(file_path, sha256)
+            for index, task in enumerate(file_tasks):
+                yield file_path, sha256, index, len(file_tasks), task
+
+    tasks = iter_tasks()
+    # Per file: its digest and its parsed parts by index
+    parts: Dict[str, Tuple[str, int, Dict[int, List[Document]]]] = {}
 
     with Pool(processes=os.cpu_count()) as pool:
-        results = []
-        with tqdm(total=len(filtered_files), desc='Loading new documents', ncols=80) as pbar:
-            for i, docs in enumerate(pool.imap_unordered(load_single_document, filtered_files)):
-                results.extend(docs)
-                pbar.update()
+        def submit() -> bool:
+            item = next(tasks, None)
+            if item is None:
+                return False
+            file_path, sha256, index, total, (function, args) = item
+            parts.setdefault(file_path, (sha256, total, {}))
+            pool.apply_async(function, args,
+                             callback=lambda docs, path=file_path, i=index: results.put((path, i, docs)),
+                             error_callback=lambda e, path=file_path, i=index: results.put((path, i, e)))
+            return True
 
-    return results
+        in_flight = sum(submit() for _ in range(max_in_flight))
+        while in_flight:
+            file_path, index, docs = results.get()
+            if isinstance(docs, BaseException):
+                raise RuntimeError(f"Failed to load {file_path}: {docs}") from docs
+            in_flight += submit() - 1
+            sha256, total, loaded = parts[file_path]
+            loaded[index] = docs
+            if len(loaded) == total:
+                del parts[file_path]
+                yield file_path, sha256, [doc for i in range(total) for doc in loaded[i]]
 
-def process_documents(ignored_files: List[str] = []) -> List[Document]:
+def iter_file_chunks(file_paths: List[str]) -> Iterator[Tuple[str, str, List[Tuple[str, Document]]]]:
     """
-    Load documents and split in chunks
+    Streams (file path, SHA-256, [(chunk ID, chunk)]) for the given files, one file at a time
     """
-    print(f"Loading documents from {source_directory}")
-    documents = load_documents(source_directory, ignored_files)
-    if not documents:
-        print("No new documents to load")
-        exit(0)
-    print(f"Loaded {len(documents)} new documents from {source_directory}")
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-    texts = text_splitter.split_documents(documents)
-    print(f"Split into {len(texts)} chunks of text (max. {chunk_size} tokens each)")
-    return texts
+    for file_path, sha256, documents in iter_loaded_files(file_paths, max_files_in_flight):
+        occurrences = defaultdict(int)
+        chunks = []
+        # Ledger summaries are compact already and stay whole
+        whole = [doc for doc in documents if "ledger_summary" in doc.metadata]
+        parts = text_splitter.split_documents([doc for doc in documents if "ledger_summary" not in doc.metadata])
+        for doc in whole + parts:
+            # Document type and ledger row dates, for retrieval filters
+            doc.metadata.update(chunk_fields(file_path, doc.page_content))
+            chunks.append((chunk_id(file_path, doc.page_content, occurrences[doc.page_content]), doc))
+            occurrences[doc.page_content] += 1
+        yield file_path, sha256, chunks
 
-def does_vectorstore_exist(persist_directory: str) -> bool:
+def adopt_existing_store(collection, manifest: IngestManifest, current: Dict[str, Tuple[int, float]]) -> None:
     """
-    Checks if vectorstore exists
+    Seeds an empty manifest from a store that was built before manifests existed, so its files
+    are treated as unchanged instead of being embedded a second time
     """
-    if os.path.exists(os.path.join(persist_directory, 'index')):
-        if os.path.exists(os.path.join(persist_directory, 'chroma-collections.parquet')) and os.path.exists(os.path.join(persist_directory, 'chroma-embeddings.parquet')):
-            list_index_files = glob.glob(os.path.join(persist_directory, 'index/*.bin'))
-            list_index_files += glob.glob(os.path.join(persist_directory, 'index/*.pkl'))
-            # At least 3 documents are needed in a working vectorstore
-            if len(list_index_files) > 3:
-                return True
-    return False
+    stored = collection.get(include=["metadatas"])
+    ids_by_source = defaultdict(list)
+    for cid, metadata in zip(stored["ids"], stored["metadatas"]):
+        ids_by_source[metadata["source"]].append(cid)
+    for path, ids in ids_by_source.items():
+        if path in current:
+            size, mtime = current[path]
+            manifest.record(path, size, mtime, file_digest(path), ids)
+    print(f"Adopted {len(ids_by_source)} previously ingested files into the manifest")
 
-def main():
-    # Create embeddings
-    embeddings = HuggingFaceEmbeddings(model_name=embeddings_model_name)
+def backfill_lexical_index(collection, lexical: LexicalIndex, page_size: int = 1000) -> None:
+    """
+    Builds the lexical index of a store ingested before it existed, adding the filterable
+    metadata its chunks are missing to Chroma as well
+    """
+    total = collection.count()
+    for offset in range(0, total, page_size):
+        stored = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        metadatas = [dict(metadata, **chunk_fields(metadata["source"], text))
+                     for text, metadata in zip(stored["documents"], stored["metadatas"])]
+        collection.update(ids=stored["ids"], metadatas=metadatas)
+        lexical.add_many(stored["ids"], stored["documents"], metadatas)
+    lexical.commit()
+    print(f"Built the lexical index for {total} previously stored chunks")
+
+
+def backfill_source_flags(collection, lexical: LexicalIndex, dedup: ChunkDeduplicator, page_size: int = 1000) -> None:
+    """
+    Flags every source file of the chunks of a store ingested before source flags existed, so
+    source filters also find chunks deduplicated across files
+    """
+    total = collection.count()
+    for offset in range(0, total, page_size):
+        stored = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        updates = []
+        for cid, metadata in zip(stored["ids"], stored["metadatas"]):
+            sources = dedup.sources(cid) or [metadata["source"]]
+            lexical.set_sources(cid, sources)
+            updates.append({source_flag(source): 1 for source in sources})
+        collection.update(ids=stored["ids"], metadatas=updates)
+    lexical.commit()
+    print(f"Flagged the source files of {total} previously stored chunks")
+
+
+def backfill_date_ranges(collection, lexical: LexicalIndex, page_size: int = 1000) -> None:
+    """
+    Copies the end of the period of each ledger summary into a lexical index built before it
+    stored one, so date filters match summaries whose period overlaps them
+    """
+    total = collection.count()
+    for offset in range(0, total, page_size):
+        stored = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        for cid, metadata in zip(stored["ids"], stored["metadatas"]):
+            if metadata.get("date_to") is not None:
+                lexical.set_date_to(cid, metadata["date_to"])
+    lexical.commit()
+    print(f"Indexed the periods of {total} previously stored chunks")
+
+
+class IngestWriter(threading.Thread):
+    """
+    Deduplicates, embeds and upserts the chunks of files taken from a bounded queue. New chunks are
+    stored in fixed-size batches and indexed in the lexical index alongside. A file is recorded in the manifest only after all of its chunks
+    are stored, and the manifest is checkpointed every few batches, so a killed run resumes with
+    the files it had not finished.
+    """
+
+    def __init__(self, collection, embeddings, manifest: IngestManifest, dedup: ChunkDeduplicator,
+                 lexical: LexicalIndex, embedding_dim: int, total_files: int):
+        super().__init__(name="ingest-writer", daemon=True)
+        self.collection = collection
+        self.embeddings = embeddings
+        self.manifest = manifest
+        self.dedup = dedup
+        self.lexical = lexical
+        self.embedding_dim = embedding_dim
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.pending = []        # new (chunk ID, chunk) pairs waiting to be embedded
+        self.pending_files = []  # (path, manifest record or None if removed, stale chunk IDs)
+        self.dirty = set()       # stored chunks whose list of sources changed
+        self.batches = 0
+        self.split_chunks = 0  # chunks received from the splitter, before deduplication
+        self.store_seconds = 0.0  # time spent writing to Chroma and the lexical index
+        self.chunks = 0
+        self.files = 0
+        self.duplicates = {"exact": 0, "near": 0}
+        self.saved_bytes = 0
+        self.total_files = total_files
+        self.started = time.perf_counter()
+        self.progress = tqdm(desc='Embedding chunks', unit='chunk', ncols=100)
+
+    def put(self, item) -> None:
+        if self.error is not None:
+            raise RuntimeError("Ingest writer failed") from self.error
+        self.queue.put(item)
+
+    def run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                continue  # keep draining so the producer never blocks
+            try:
+                self.add_file(*item)
+            except BaseException as e:
+                self.error = e
+        if self.error is None:
+            try:
+                self.flush()
+            except BaseException as e:
+                self.error = e
+        self.manifest.save()
 
-    if does_vectorstore_exist(persist_directory):
-        # Update and store locally vectorstore
+    def add_file(self, path: str, size: int, mtime: float, sha256: str, chunks: List[Tuple[str, Document]]) -> None:
+        old_ids = set(self.manifest.chunk_ids(path))
+        # Chunks an interrupted run already stored for this file, before it reached the manifest
+        resumed_ids = set(self.dedup.chunk_ids(path)).difference(old_ids)
+        self.split_chunks += len(chunks)
+        ids = []
+        for cid, doc in chunks:
+            # Chunks whose text did not change keep their ID and vector
+            if cid not in old_ids:
+                target, kind = self.dedup.match(doc.page_content) if deduplicate else (None, None)
+                if target is None:
+                    self.dedup.add(cid, doc.page_content)
+                    self.pending.append((cid, doc))
+                elif target in resumed_ids:
+                    # The file's own chunk, not a duplicate of another file
+                    cid = target
+                else:
+                    self.duplicates[kind] += 1
+                    self.saved_bytes += len(doc.page_content.encode("utf-8")) + 4 * self.embedding_dim
+                    self.dirty.add(target)
+                    cid = target
+            ids.append(cid)
+            self.dedup.add_ref(cid, path)
+        ids = list(dict.fromkeys(ids))
+        self.pending_files.append((path, (size, mtime, sha256, ids), old_ids.difference(ids)))
+        if len(self.pending) >= batch_size:
+            self.flush()
+
+    def remove_file(self, path: str) -> None:
+        self.pending_files.append((path, None, set(self.manifest.chunk_ids(path))))
+
+    def flush(self) -> None:
+        for start in range(0, len(self.pending), batch_size):
+            batch = self.pending[start:start + batch_size]
+            texts = [doc.page_content for _, doc in batch]
+            vectors = self.embeddings.embed_documents(texts)
+            # Upsert keeps re-runs after an interruption idempotent
+            ids, metadatas = [cid for cid, _ in batch], [doc.metadata for _, doc in batch]
+            t0 = time.perf_counter()
+            self.collection.upsert(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+            self.lexical.add_many(ids, texts, metadatas)
+            self.store_seconds += time.perf_counter() - t0
+            self.chunks += len(batch)
+            self.batches += 1
+            self.progress.update(len(batch))
+            if self.batches % checkpoint_every == 0:
+                self.manifest.save()
+
+        deleted = []
+        for path, record, stale_ids in self.pending_files:
+            # A chunk other files still point to stays, it only loses this source
+            for cid in stale_ids:
+                if self.dedup.remove_ref(cid, path):
+                    self.dirty.add(cid)
+                else:
+                    self.dedup.forget(cid)
+                    deleted.append(cid)
+            if record is None:
+                self.manifest.forget(path)
+            else:
+                self.manifest.record(path, *record)
+                self.files += 1
+        if deleted:
+            self.collection.delete(ids=deleted)
+            self.lexical.remove(deleted)
+        dirty = sorted(self.dirty.difference(deleted))
+        if dirty:
+            stored = self.collection.get(ids=dirty, include=["metadatas"])
+            metadatas = []
+            for cid, metadata in zip(stored["ids"], stored["metadatas"]):
+                # Provenance of deduplicated chunks: every source file the stored text came from
+                sources = self.dedup.sources(cid)
+                update = {"sources": "\n".join(sources), **{source_flag(source): 1 for source in sources}}
+                # Chroma 0.4 cannot remove a metadata key, so flags of removed files are cleared instead
+                update.update({source_flag(source): 0 for source in flagged_sources(metadata)
+                               if source not in sources})
+                self.lexical.set_sources(cid, sources)
+                if metadata.get("source") not in sources:
+                    # The file the chunk was first stored from is gone; credit one that still holds it
+                    update["source"] = sources[0]
+                    update["doc_type"] = chunk_fields(sources[0], "")["doc_type"]
+                    self.lexical.set_source(cid, update["source"], update["doc_type"])
+                metadatas.append(update)
+            self.collection.update(ids=stored["ids"], metadatas=metadatas)
+        self.dedup.commit()
+        self.lexical.commit()
+        self.pending, self.pending_files, self.dirty = [], [], set()
+        self.progress.set_postfix(files=f"{self.files}/{self.total_files}")
+
+    def close(self) -> None:
+        self.queue.put(None)
+        self.join()
+        self.progress.close()
+        if self.error is not None:
+            raise RuntimeError("Ingest writer failed") from self.error
+
+
+def ingest_files(file_paths: List[str], current: Dict[str, Tuple[int, float]], writer: IngestWriter) -> None:
+    """
+    Streams files through load and split into the writer, one file at a time
+    """
+    for file_path, sha256, chunks in iter_file_chunks(file_paths):
+        size, mtime = current[file_path]
+        writer.put((file_path, size, mtime, sha256, chunks))
+
+def reset_store(persist_directory: str) -> None:
+    """
+    Removes the vector store together with its metadata and ingest manifest
+    """
+    if os.path.isdir(persist_directory):
+        print(f"Removing vectorstore at {persist_directory}")
+        shutil.rmtree(persist_directory)
+
+def check_embedding_dim(collection, stored_meta: dict, embedding_dim: int) -> None:
+    """
+    Makes sure new vectors have the dimension of the stored ones. Stores without metadata are
+    checked against one of their vectors.
+    """
+    if stored_meta:
+        check_compatibility(stored_meta, {"embedding_dim": embedding_dim})
+    elif collection.count():
+        stored_dim = len(collection.get(limit=1, include=["embeddings"])["embeddings"][0])
+        if stored_dim != embedding_dim:
+            raise IncompatibleStoreError(f"Vector store holds {stored_dim}-dimensional vectors but "
+                                         f"{embeddings_model_name} produces {embedding_dim}; rebuild it with --reset")
+
+def run_ingest(reset: bool = False, embeddings: Optional[CachedEmbedder] = None) -> dict:
+    """
+    Brings the vectorstore up to date with the source directory and returns counts and timings
+    of the run: files, split_chunks, stored_chunks, embeddings (vectors actually computed),
+    embed_seconds (time spent computing them) and seconds. The run is traced as "ingest".
+
+    :param embeddings: An embedder to use and keep open, so repeated runs load the model once;
+                       by default every run opens its own.
+    """
+    with start_trace("ingest", reset=reset, source_directory=source_directory) as trace:
+        stats = update_store(reset, embeddings)
+        trace.set(**stats)
+    return stats
+
+def update_store(reset: bool, embeddings: Optional[CachedEmbedder] = None) -> dict:
+    trace = current_trace()
+    started = time.perf_counter()
+    if reset:
+        reset_store(persist_directory)
+
+    layout = detect_layout(persist_directory)
+    if layout == LAYOUT_LEGACY:
+        raise IncompatibleStoreError(f"{persist_directory} holds a chromadb < 0.4 (duckdb+parquet) store. "
+                                     f"Convert it with chroma-migrate or rebuild it with --reset")
+    if layout == LAYOUT_ORPHANED:
+        print(f"Warning: {persist_directory} has segment directories but no chroma.sqlite3, "
+              f"they cannot be opened and a new store will be created")
+    stored_meta = read_store_meta(persist_directory) if layout == LAYOUT_CHROMA_04 else None
+    rechunk = []
+    if stored_meta:
+        # Stores from before the ledger loader loaded CSV files row by row
+        rechunk = check_compatibility(dict({"csv_loader": "rows"}, **stored_meta),
+                                      {"embedding_model": embeddings_model_name, "chunk_size": chunk_size,
+                                       "chunk_overlap": chunk_overlap, "csv_loader": csv_loader_name})
+
+    manifest = IngestManifest.load(persist_directory)
+    if layout != LAYOUT_CHROMA_04:
+        # A manifest or chunk index without the store it describes is meaningless
+        manifest.files = {}
+        for index_file in (DEDUP_INDEX_FILE, LEXICAL_INDEX_FILE):
+            if os.path.exists(os.path.join(persist_directory, index_file)):
+                os.remove(os.path.join(persist_directory, index_file))
+    with trace.span("scan") as span:
+        current = scan_source_files(source_directory, LOADER_MAPPING)
+        span.set(files=len(current))
+    collection = None
+
+    if layout == LAYOUT_CHROMA_04 and not manifest.exists():
+        collection = open_collection(persist_directory)
+        if collection.count():
+            adopt_existing_store(collection, manifest, current)
+
+    lexical = LexicalIndex(os.path.join(persist_directory, LEXICAL_INDEX_FILE))
+    flag_sources = layout == LAYOUT_CHROMA_04 and not lexical.has_sources()
+    if layout == LAYOUT_CHROMA_04 and not lexical.count():
+        collection = collection or open_collection(persist_directory)
+        if collection.count():
+            backfill_lexical_index(collection, lexical)
+    elif layout == LAYOUT_CHROMA_04 and lexical.date_ranges_missing:
+        collection = collection or open_collection(persist_directory)
+        if collection.count():
+            backfill_date_ranges(collection, lexical)
+    if flag_sources:
+        collection = collection or open_collection(persist_directory)
+        if collection.count():
+            dedup = ChunkDeduplicator(os.path.join(persist_directory, DEDUP_INDEX_FILE), threshold=dedup_threshold)
+            backfill_source_flags(collection, lexical, dedup)
+            dedup.close()
+
+    new, changed, unchanged, removed = manifest.classify(current)
+    print(f"{len(new)} new, {len(changed)} changed, {len(unchanged)} unchanged, {len(removed)} removed files")
+    if rechunk == ["csv_loader"]:
+        print(f"CSV loading changed to {csv_loader_name}, re-ingesting CSV files")
+        changed, unchanged = changed + [p for p in unchanged if p.endswith(".csv")], \
+            [p for p in unchanged if not p.endswith(".csv")]
+    elif rechunk:
+        # Unchanged chunk texts keep their IDs, so only chunks that are really cut differently get embedded
+        print(f"Migrating vectorstore to new chunking parameters ({', '.join(rechunk)}), re-splitting all files")
+        changed, unchanged = changed + unchanged, []
+    if not (new or changed or removed):
+        manifest.save()
+        lexical.close()
+        if rechunk:
+            # Nothing had to be re-split; record the new parameters so the migration is not repeated
+            write_store_meta(persist_directory, dict(stored_meta, chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                                     csv_loader=csv_loader_name))
+        print("No new documents to load")
+        return {"files": 0, "split_chunks": 0, "stored_chunks": 0, "embeddings": 0, "embed_seconds": 0.0,
+                "seconds": time.perf_counter() - started}
+
+    if collection is None:
+        with trace.span("open_store"):
+            collection = open_collection(persist_directory)
+    owns_embeddings = embeddings is None
+    if owns_embeddings:
+        embeddings = CachedEmbedder(embeddings_model_name)
+    with trace.span("load_embedding_model", model=embeddings_model_name):
+        embedding_dim = len(embeddings.embed_query("dimension probe"))
+    # The probe paid for loading the model; leave it out of the embedding throughput. The counters
+    # of a shared embedder also include earlier runs.
+    probe_embeddings, probe_seconds, probe_hits = embeddings.misses, embeddings.compute_seconds, embeddings.hits
+    check_embedding_dim(collection, stored_meta, embedding_dim)
+    if layout == LAYOUT_CHROMA_04:
         print(f"Appending to existing vectorstore at {persist_directory}")
-        db = Chroma(persist_directory=persist_directory, embedding_function=embeddings, client_settings=CHROMA_SETTINGS)
-        collection = db.get()
-        texts = process_documents([metadata['source'] for metadata in collection['metadatas']])
-        print(f"Creating embeddings. May take some minutes...")
-        db.add_documents(texts)
     else:
-        # Create and store locally vectorstore
-        print("Creating new vectorstore")
-        texts = process_documents()
-        print(f"Creating embeddings. May take some minutes...")
-        db = Chroma.from_documents(texts, embeddings, persist_directory=persist_directory)
-    db.persist()
-    db = None
+        print(f"Creating new vectorstore at {persist_directory}")
+
+    print(f"Loading documents from {source_directory} and creating embeddings in batches of {batch_size}...")
+    dedup = ChunkDeduplicator(os.path.join(persist_directory, DEDUP_INDEX_FILE), threshold=dedup_threshold)
+    writer = IngestWriter(collection, embeddings, manifest, dedup, lexical, embedding_dim, len(new + changed))
+    for path in removed:
+        writer.remove_file(path)
+    writer.start()
+    # Loading and splitting overlap with embedding and storing, which are totalled separately below
+    with trace.span("pipeline", files=len(new + changed)):
+        try:
+            ingest_files(new + changed, current, writer)
+        finally:
+            # Stores the finished files' checkpoint even if loading failed half-way
+            writer.close()
+            if owns_embeddings:
+                embeddings.close()
+            dedup.close()
+            lexical.close()
+    trace.add_span("embed", embeddings.compute_seconds - probe_seconds, embeddings=embeddings.misses - probe_embeddings)
+    trace.add_span("store", writer.store_seconds, chunks=writer.chunks)
+    meta = build_store_meta(embeddings_model_name, embedding_dim, chunk_size, chunk_overlap, csv_loader_name)
+    meta["revision"] = stored_meta["revision"] if stored_meta else 0
+    write_store_meta(persist_directory, meta)
 
+    elapsed = time.perf_counter() - writer.started
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Stored {writer.chunks} new or changed chunks from {writer.files} files in {elapsed:.1f}s "
+          f"({writer.chunks / max(elapsed, 1e-9):.1f} chunks/sec, {embeddings.hits - probe_hits} embedding cache hits, "
+          f"peak memory {peak_mb:.0f} MB)")
+    skipped = sum(writer.duplicates.values())
+    if skipped:
+        print(f"Deduplication dropped {skipped} chunks ({writer.duplicates['exact']} exact, "
+              f"{writer.duplicates['near']} near-duplicates), saving {skipped} vectors and "
+              f"{writer.saved_bytes / 1024:.1f} KiB")
     print(f"Ingestion complete! You can now run privateGPT.py to query your documents")
+    return {"files": writer.files, "split_chunks": writer.split_chunks, "stored_chunks": writer.chunks,
+            "embeddings": embeddings.misses - probe_embeddings,
+            "embed_seconds": embeddings.compute_seconds - probe_seconds,
+            "seconds": time.perf_counter() - started}
+
+def main():
+    args = parse_arguments()
+    if args.watch:
+        from ingest_watch import IngestService
+
+        IngestService(reset=args.reset).serve_forever()
+    else:
+        run_ingest(reset=args.reset)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Ingest documents from the source directory into the local vectorstore.')
+    parser.add_argument("--reset", action='store_true',
+                        help='Delete the existing vectorstore and manifest and rebuild them from scratch. '
+                             'Needed after changing the embedding model.')
+    parser.add_argument("--watch", action='store_true',
+                        help='Keep running, and ingest files as they are added to, changed in or removed from '
+                             'the source directory.')
+
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
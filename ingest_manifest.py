@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Tuple
+
+MANIFEST_FILE = "ingest_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_digest(file_path: str, block_size: int = 1 << 20) -> str:
+    """
+    Returns the SHA-256 hex digest of a file, read in blocks
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(source: str, text: str, occurrence: int = 0) -> str:
+    """
+    Deterministic vector ID for a chunk: the same text at the same source always maps to the
+    same ID, so unchanged chunks of an edited file keep their vectors
+    """
+    key = f"{source}\0{occurrence}\0{text}".encode("utf-8")
+    return hashlib.sha1(key).hexdigest()
+
+
+def scan_source_files(source_dir: str, extensions: Iterable[str]) -> Dict[str, Tuple[int, float]]:
+    """
+    Walks the source tree once and returns {path: (size, mtime)} for every supported file
+    """
+    extensions = set(extensions)
+    found = {}
+    for root, _, files in os.walk(source_dir):
+        for name in files:
+            if "." + name.rsplit(".", 1)[-1] not in extensions:
+                continue
+            path = os.path.join(root, name)
+            st = os.stat(path)
+            found[path] = (st.st_size, st.st_mtime)
+    return found
+
+
+class IngestManifest:
+    """
+    Persistent record of what has been ingested: for every source file its size, mtime,
+    content hash and the IDs of the chunks stored for it
+    """
+
+    def __init__(self, path: str, files: Dict[str, dict] = None):
+        self.path = path
+        self.files = files or {}
+
+    @classmethod
+    def load(cls, persist_directory: str) -> "IngestManifest":
+        path = os.path.join(persist_directory, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path, encoding="utf8") as f:
+            data = json.load(f)
+        if data.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"{path}: unsupported manifest version {data.get('version')}")
+        return cls(path, data["files"])
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def save(self) -> None:
+        """
+        Writes the manifest atomically so an interrupted run never leaves a truncated file
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f)
+        os.replace(tmp_path, self.path)
+
+    def classify(self, current: Dict[str, Tuple[int, float]]) -> Tuple[List[str], List[str], List[str], List[str]]:
+        """
+        Splits the current files into new, changed, unchanged and removed ones.
+        Files whose size and mtime match the manifest are trusted without hashing; the others are
+        hashed, so a touched but identical file stays unchanged.
+        """
+        new, changed, unchanged = [], [], []
+        for path, (size, mtime) in current.items():
+            entry = self.files.get(path)
+            if entry is None:
+                new.append(path)
+            elif entry["size"] == size and entry["mtime"] == mtime:
+                unchanged.append(path)
+            else:
+                sha256 = file_digest(path)
+                if sha256 == entry["sha256"]:
+                    entry["size"], entry["mtime"] = size, mtime
+                    unchanged.append(path)
+                else:
+                    changed.append(path)
+        removed = [path for path in self.files if path not in current]
+        return new, changed, unchanged, removed
+
+    def chunk_ids(self, path: str) -> List[str]:
+        entry = self.files.get(path)
+        return entry["chunks"] if entry else []
+
+    def record(self, path: str, size: int, mtime: float, sha256: str, chunk_ids: List[str]) -> None:
+        self.files[path] = {"size": size, "mtime": mtime, "sha256": sha256, "chunks": chunk_ids}
+
+    def forget(self, path: str) -> None:
+        self.files.pop(path, None)
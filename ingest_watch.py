@@ -0,0 +1,222 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from embedding import CachedEmbedder
+from ingest import LOADER_MAPPING, embeddings_model_name, persist_directory, run_ingest, source_directory
+from ingest_manifest import scan_source_files
+from ledger import ledger_path
+from ledger_store import get_ledger_store
+from quantized_index import build_quantized_index, quantized_index_path
+from vectorstore import store_revision
+
+# Changes are ingested once the source tree has been quiet this long...
+watch_debounce_seconds = float(os.environ.get('WATCH_DEBOUNCE_SECONDS', 2))
+# ...or at the latest this long after the first change, so a steady trickle of files still gets ingested
+watch_max_delay_seconds = float(os.environ.get('WATCH_MAX_DELAY_SECONDS', 30))
+# "auto" uses inotify (or the platform's equivalent) through watchdog if it is installed, "polling" rescans
+watch_backend = os.environ.get('WATCH_BACKEND', 'auto')
+watch_poll_interval = float(os.environ.get('WATCH_POLL_INTERVAL', 5))
+
+# Only these report a file that was written, moved or removed; opens and reads (including ingest's
+# own) are ignored
+WRITE_EVENTS = ("created", "modified", "moved", "deleted", "closed")
+
+
+class ChangeBatcher:
+    """
+    Collects changed paths from the watcher thread and hands them out in bursts: wait() returns
+    once no change arrived for `quiet_seconds`, or `max_delay` after the first change of the burst.
+    """
+
+    def __init__(self, quiet_seconds: float = watch_debounce_seconds, max_delay: float = watch_max_delay_seconds):
+        self.quiet_seconds = quiet_seconds
+        self.max_delay = max_delay
+        self._condition = threading.Condition()
+        self._paths: Set[str] = set()
+        self._first = self._last = 0.0
+        self._closed = False
+
+    def add(self, path: str) -> None:
+        with self._condition:
+            now = time.monotonic()
+            if not self._paths:
+                self._first = now
+            self._paths.add(path)
+            self._last = now
+            self._condition.notify()
+
+    def wait(self) -> Optional[Set[str]]:
+        """
+        Blocks until a burst of changes is complete and returns its paths, or None once closed
+        """
+        with self._condition:
+            while not self._closed:
+                if not self._paths:
+                    self._condition.wait()
+                    continue
+                due = min(self._last + self.quiet_seconds, self._first + self.max_delay)
+                if time.monotonic() >= due:
+                    paths, self._paths = self._paths, set()
+                    return paths
+                self._condition.wait(due - time.monotonic())
+            return None
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+
+def is_source_file(path: str) -> bool:
+    return "." + path.rsplit(".", 1)[-1] in LOADER_MAPPING
+
+
+def is_ledger(path: str) -> bool:
+    return os.path.abspath(path) == os.path.abspath(ledger_path)
+
+
+def snapshot() -> Dict[str, Tuple[int, float]]:
+    """
+    {path: (size, mtime)} of the supported source files and the ledger
+    """
+    files = scan_source_files(source_directory, LOADER_MAPPING)
+    if os.path.exists(ledger_path):
+        st = os.stat(ledger_path)
+        files[ledger_path] = (st.st_size, st.st_mtime)
+    return files
+
+
+class PollingWatcher(threading.Thread):
+    """
+    Rescans the source tree every `interval` seconds and reports files that appeared, changed or
+    disappeared. Works everywhere, including network and container mounts that deliver no events.
+    """
+
+    def __init__(self, on_change: Callable[[str], None], interval: float = watch_poll_interval):
+        super().__init__(name="source-poller", daemon=True)
+        self.on_change = on_change
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        previous = snapshot()
+        while not self._stopped.wait(self.interval):
+            current = snapshot()
+            for path in previous.keys() | current.keys():
+                if previous.get(path) != current.get(path):
+                    self.on_change(path)
+            previous = current
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+
+class EventWatcher:
+    """
+    Reports changes as the operating system announces them (inotify on Linux), through watchdog
+    """
+
+    def __init__(self, on_change: Callable[[str], None]):
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        class Handler(FileSystemEventHandler):
+            def __init__(self, accept: Callable[[str], bool], directories: bool):
+                self.accept = accept
+                self.directories = directories
+
+            def on_any_event(self, event):
+                if event.event_type not in WRITE_EVENTS:
+                    return
+                for path in (event.src_path, getattr(event, "dest_path", "")):
+                    # A removed or renamed directory takes its files with it
+                    if path and (self.accept(path) or self.directories and event.is_directory
+                                 and event.event_type != "modified"):
+                        on_change(path)
+
+        self._observer = Observer()
+        self._observer.schedule(Handler(lambda path: is_source_file(path) or is_ledger(path), True),
+                                source_directory, recursive=True)
+        ledger_dir, source_dir = os.path.dirname(os.path.abspath(ledger_path)), os.path.abspath(source_directory)
+        if os.path.commonpath([ledger_dir, source_dir]) != source_dir:
+            # Only the ledger itself; its directory is usually the project directory
+            self._observer.schedule(Handler(is_ledger, False), ledger_dir, recursive=False)
+
+    def start(self) -> None:
+        self._observer.start()
+
+    def stop(self) -> None:
+        self._observer.stop()
+
+
+def create_watcher(on_change: Callable[[str], None], backend: str = watch_backend):
+    if backend == "auto":
+        try:
+            return EventWatcher(on_change)
+        except ImportError:
+            print("watchdog is not installed, polling the source directory every "
+                  f"{watch_poll_interval:g}s (pip install watchdog for change events)")
+    return PollingWatcher(on_change)
+
+
+class IngestService:
+    """
+    Keeps the vectorstore and the ledger cache in step with the source directory. The embedding
+    model stays loaded between runs, and each burst of changes is applied incrementally: the
+    manifest decides which files are new, changed or removed, exactly as in a manual ingest.
+
+    Nothing is pushed to readers: every ingest that changes the store bumps its revision, which
+    query engines check before each question and reload on, and dashboards pick up the refreshed
+    ledger cache by its source file's size and mtime. A quantized index, if one was built, is
+    rebuilt after each change so it does not fall behind.
+    """
+
+    def __init__(self, reset: bool = False):
+        self.reset = reset
+        self.embeddings = CachedEmbedder(embeddings_model_name)
+        self.batcher = ChangeBatcher()
+
+    def sync(self, changes: Optional[Set[str]] = None) -> None:
+        started = time.perf_counter()
+        revision = store_revision(persist_directory)
+        stats = run_ingest(reset=self.reset, embeddings=self.embeddings)
+        self.reset = False
+        ledger = get_ledger_store().refresh() if os.path.exists(ledger_path) else "missing"
+        new_revision = store_revision(persist_directory)
+        if new_revision != revision and os.path.isdir(quantized_index_path(persist_directory)):
+            keep_vectors = os.path.exists(os.path.join(quantized_index_path(persist_directory), "vectors.npy"))
+            build_quantized_index(persist_directory, keep_vectors=keep_vectors)
+        trigger = f"{len(changes)} changed paths" if changes is not None else "Start-up sync"
+        print(f"{trigger}: {stats['files']} files ingested ({stats['stored_chunks']} chunks stored, "
+              f"{stats['embeddings']} embedded), store revision {new_revision}, ledger cache {ledger}, "
+              f"{time.perf_counter() - started:.1f}s")
+
+    def serve_forever(self) -> None:
+        os.makedirs(source_directory, exist_ok=True)
+        # Loaded once here rather than by the first file dropped in
+        self.embeddings.load()
+        watcher = create_watcher(self.batcher.add)
+        # Started before the initial sync, so nothing written meanwhile is missed
+        watcher.start()
+        print(f"Watching {source_directory} and {ledger_path}, Ctrl+C to stop")
+        try:
+            self.sync()
+            while True:
+                changes = self.batcher.wait()
+                if changes is None:
+                    break
+                try:
+                    self.sync(changes)
+                except Exception as e:
+                    # e.g. a file still being copied; its next write event triggers another run
+                    print(f"Ingest failed, waiting for further changes: {e}")
+        except KeyboardInterrupt:
+            print("Stopping")
+        finally:
+            watcher.stop()
+            self.embeddings.close()
+
+    def stop(self) -> None:
+        self.batcher.close()
@@ -0,0 +1,222 @@
+import os
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+ledger_path = os.environ.get('LEDGER_PATH', 'Banking-Data.csv')
+
+DATE_FORMAT = "%d/%m/%Y"
+AMOUNT_COLUMNS = ['Debit Amount', 'Credit Amount', 'Closing Balance']
+# Income is salary and interest credits, expenses are every other debit, as in the dashboard charts
+INCOME_CATEGORIES = ['Interest', 'Salary']
+# Columns that identify a bank export
+LEDGER_COLUMNS = ['Date', 'Type', 'Category'] + AMOUNT_COLUMNS
+
+
+def money(amount: float) -> str:
+    return f"${amount:,.2f}"
+
+
+def date_key(date) -> int:
+    """
+    A date as the yyyymmdd integer used in chunk metadata
+    """
+    return date.year * 10000 + date.month * 100 + date.day
+
+
+def normalize_transactions(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Parses a raw bank export in one pass: day-first dates, stripped categorical Type/Category
+    columns and numeric amounts, sorted by date
+    """
+    df = df.copy()
+    df['Date'] = pd.to_datetime(df['Date'], format=DATE_FORMAT, errors='coerce')
+    df = df.dropna(subset=['Date'])
+    for column in ('Type', 'Category'):
+        df[column] = df[column].astype(str).str.strip().astype('category')
+    for column in AMOUNT_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors='coerce').fillna(0.0)
+    return df.sort_values('Date', kind='stable').reset_index(drop=True)
+
+
+def load_ledger(path: str = None) -> pd.DataFrame:
+    return normalize_transactions(pd.read_csv(path or ledger_path))
+
+
+class TransactionCube:
+    """
+    Precomputed (day x Type x Category) totals of a ledger. Its size depends on the number of days
+    and categories rather than on the number of transactions, so every chart and period is a cheap
+    slice. Days rather than months keep the exact "last N months" cut-off of the charts.
+    """
+
+    def __init__(self, cube: pd.DataFrame):
+        self.cube = cube
+        self._dates = cube['Date'].values
+        self.latest = cube['Date'].max() if len(cube) else None
+        self.earliest = cube['Date'].min() if len(cube) else None
+
+    @classmethod
+    def from_transactions(cls, df: pd.DataFrame) -> "TransactionCube":
+        cube = df.groupby([df['Date'].dt.normalize(), 'Type', 'Category'], observed=True, sort=True).agg(**{
+            'Debit Amount': ('Debit Amount', 'sum'),
+            'Credit Amount': ('Credit Amount', 'sum'),
+            'Count': ('Date', 'size'),
+        }).reset_index()
+        return cls(cube)
+
+    def between(self, start=None, end=None) -> pd.DataFrame:
+        """
+        Cube cells with start <= day <= end
+        """
+        lo = 0 if start is None else np.searchsorted(self._dates, np.datetime64(start), 'left')
+        hi = len(self._dates) if end is None else np.searchsorted(self._dates, np.datetime64(end), 'right')
+        return self.cube.iloc[lo:hi]
+
+    def expense_totals(self, start=None, end=None) -> pd.Series:
+        cells = self.between(start, end)
+        cells = cells[(cells['Type'] == 'Debit') & ~cells['Category'].isin(INCOME_CATEGORIES)]
+        return cells.groupby('Category', observed=True)['Debit Amount'].sum()
+
+    def income_totals(self, start=None, end=None) -> pd.Series:
+        cells = self.between(start, end)
+        cells = cells[(cells['Type'] == 'Credit') & cells['Category'].isin(INCOME_CATEGORIES)]
+        return cells.groupby('Category', observed=True)['Credit Amount'].sum()
+
+    def monthly_trend(self, start=None, end=None) -> pd.DataFrame:
+        """
+        Monthly credit and debit totals over all categories, indexed by month start
+        """
+        cells = self.between(start, end)
+        month = cells['Date'].dt.to_period('M').dt.to_timestamp()
+        income = cells['Credit Amount'].where(cells['Type'] == 'Credit', 0.0)
+        expenses = cells['Debit Amount'].where(cells['Type'] == 'Debit', 0.0)
+        trend = pd.DataFrame({'YearMonth': month, 'Income': income, 'Expenses': expenses})
+        return trend.groupby('YearMonth').sum().reset_index()
+
+
+class TransactionLedger:
+    """
+    In-memory transaction table indexed by date. Rows are sorted by date so a period is a binary
+    search away, and Type/Category are categoricals so filters compare small integer codes.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self._dates = df['Date'].values
+        self.latest = df['Date'].max() if len(df) else None
+        self.earliest = df['Date'].min() if len(df) else None
+        self._cube = None
+
+    @classmethod
+    def from_csv(cls, path: str = None) -> "TransactionLedger":
+        return cls(load_ledger(path))
+
+    @property
+    def cube(self) -> TransactionCube:
+        if self._cube is None:
+            self._cube = TransactionCube.from_transactions(self.df)
+        return self._cube
+
+    @property
+    def categories(self):
+        return [c for c in self.df['Category'].cat.categories if c != 'None']
+
+    def last_months_start(self, months: int) -> pd.Timestamp:
+        """
+        Start of a "last N months" period. Like the dashboard, periods count back from the newest
+        transaction and exclude the start date itself.
+        """
+        return self.latest - pd.DateOffset(months=months)
+
+    def between(self, start=None, end=None, include_start: bool = True) -> pd.DataFrame:
+        """
+        Rows with start <= Date <= end (start < Date if include_start is False), by binary search
+        """
+        lo = 0 if start is None else np.searchsorted(self._dates, np.datetime64(start), 'left' if include_start else 'right')
+        hi = len(self._dates) if end is None else np.searchsorted(self._dates, np.datetime64(end), 'right')
+        return self.df.iloc[lo:hi]
+
+    def expenses(self, rows: pd.DataFrame, categories: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        mask = (rows['Type'] == 'Debit') & ~rows['Category'].isin(INCOME_CATEGORIES)
+        if categories:
+            mask &= rows['Category'].isin(list(categories))
+        return rows[mask]
+
+    def income(self, rows: pd.DataFrame, categories: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        mask = (rows['Type'] == 'Credit') & rows['Category'].isin(list(categories or INCOME_CATEGORIES))
+        return rows[mask]
+
+    def balance_at(self, date) -> Optional[float]:
+        """
+        Closing balance after the last transaction on or before the date
+        """
+        position = np.searchsorted(self._dates, np.datetime64(date), 'right')
+        if position == 0:
+            return None
+        return float(self.df['Closing Balance'].iat[position - 1])
+
+
+def month_summary(ledger: TransactionLedger, rows: pd.DataFrame, month: pd.Period, source: str) -> Tuple[str, dict]:
+    income, expenses = ledger.income(rows), ledger.expenses(rows)
+    by_category = expenses.groupby('Category', observed=True)['Debit Amount'].agg(['sum', 'size'])
+    by_category = by_category.sort_values('sum', ascending=False)
+    income_by_category = income.groupby('Category', observed=True)['Credit Amount'].sum()
+    largest = expenses.nlargest(3, 'Debit Amount')
+    balances = rows['Closing Balance']
+    lines = [
+        f"Bank statement summary for {month.strftime('%B %Y')}",
+        f"Transactions: {len(rows)}, from {rows['Date'].min():%d %b %Y} to {rows['Date'].max():%d %b %Y}",
+        f"Income: {money(income['Credit Amount'].sum())}"
+        + (f" ({', '.join(f'{c} {money(a)}' for c, a in income_by_category.items())})" if len(income) else ""),
+        f"Expenses: {money(expenses['Debit Amount'].sum())} across {len(expenses)} transactions",
+        f"Net cash flow: {money(income['Credit Amount'].sum() - expenses['Debit Amount'].sum())}",
+    ]
+    if len(by_category):
+        lines.append("Spending by category: " + ", ".join(
+            f"{category} {money(row['sum'])} ({int(row['size'])})" for category, row in by_category.head(5).iterrows()))
+    if len(largest):
+        lines.append("Largest expenses: " + "; ".join(
+            f"{money(row['Debit Amount'])} {row['Category']} on {row['Date']:%d %b %Y}" for _, row in largest.iterrows()))
+    lines.append(f"Closing balance: between {money(balances.min())} and {money(balances.max())}, "
+                 f"{money(balances.iloc[-1])} at month end")
+    metadata = {"source": source, "ledger_summary": "month", "period": str(month),
+                "date": date_key(month.start_time), "date_to": date_key(month.end_time), "transactions": len(rows)}
+    return "\n".join(lines), metadata
+
+
+def category_summary(rows: pd.DataFrame, category: str, year: int, income: bool, source: str) -> Tuple[str, dict]:
+    amount_column = 'Credit Amount' if income else 'Debit Amount'
+    monthly = rows.groupby(rows['Date'].dt.to_period('M'))[amount_column].sum()
+    largest = rows.loc[rows[amount_column].idxmax()]
+    heading = f"Income from {category}" if income else f"Spending on {category}"
+    lines = [
+        f"{heading} in {year}",
+        f"Transactions: {len(rows)} totalling {money(rows[amount_column].sum())}, "
+        f"average {money(rows[amount_column].mean())}",
+        f"Largest: {money(largest[amount_column])} on {largest['Date']:%d %b %Y}",
+        "By month: " + ", ".join(f"{month.strftime('%b')} {money(amount)}" for month, amount in monthly.items()),
+    ]
+    metadata = {"source": source, "ledger_summary": "category", "period": str(year), "category": category,
+                "date": year * 10000 + 101, "date_to": year * 10000 + 1231, "transactions": len(rows)}
+    return "\n".join(lines), metadata
+
+
+def ledger_summaries(ledger: TransactionLedger, source: str) -> List[Tuple[str, dict]]:
+    """
+    Compact (text, metadata) summaries of a ledger for retrieval: one per month and one per
+    category and year. Individual transactions are left to the ledger itself; the metadata
+    carries the period so the rows behind a summary can be looked up.
+    """
+    summaries = []
+    df = ledger.df
+    for month, rows in df.groupby(df['Date'].dt.to_period('M'), sort=True):
+        summaries.append(month_summary(ledger, rows, month, source))
+    for year, rows in df.groupby(df['Date'].dt.year, sort=True):
+        for category in ledger.categories:
+            income = category in INCOME_CATEGORIES
+            matching = ledger.income(rows, [category]) if income else ledger.expenses(rows, [category])
+            if len(matching):
+                summaries.append(category_summary(matching, category, int(year), income, source))
+    return summaries
@@ -0,0 +1,325 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from ledger import TransactionCube, TransactionLedger, ledger_path, normalize_transactions
+
+ledger_cache_dir = os.environ.get('LEDGER_CACHE_DIR', os.path.join('cache', 'ledger'))
+
+STORE_VERSION = 1
+META_FILE = "meta.json"
+# Transaction columns: file name -> (ledger column, dtype)
+ROW_COLUMNS = {
+    "date": ("Date", "datetime64[ns]"),
+    "type": ("Type", "int16"),
+    "category": ("Category", "int16"),
+    "debit": ("Debit Amount", "float64"),
+    "credit": ("Credit Amount", "float64"),
+    "balance": ("Closing Balance", "float64"),
+}
+# Per-partition (day x type x category) aggregates, so charts never touch the rows
+CUBE_COLUMNS = {
+    "cube_date": ("Date", "datetime64[ns]"),
+    "cube_type": ("Type", "int16"),
+    "cube_category": ("Category", "int16"),
+    "cube_debit": ("Debit Amount", "float64"),
+    "cube_credit": ("Credit Amount", "float64"),
+    "cube_count": ("Count", "int64"),
+}
+CATEGORICAL_COLUMNS = ("Type", "Category")
+
+
+def digest_prefix(path: str, length: int, block_size: int = 1 << 20) -> str:
+    """
+    SHA-256 of the first `length` bytes of a file
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        remaining = length
+        while remaining > 0:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest.hexdigest()
+
+
+def swap_directory(source: str, target: str) -> None:
+    """
+    Moves a finished directory into place, replacing the target
+    """
+    old = f"{target}.old-{os.getpid()}"
+    if os.path.isdir(target):
+        shutil.rmtree(old, ignore_errors=True)
+        os.rename(target, old)
+    os.rename(source, target)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+class LedgerStore:
+    """
+    Typed columnar cache of a bank export, partitioned by month.
+
+    Every partition directory holds one memory-mappable .npy file per column plus the partition's
+    daily aggregates. The cache is revalidated against the source file's size, mtime and hash. When
+    rows were only appended to the source, just those rows are parsed and only the months they fall
+    in are rewritten; any other change rebuilds the cache.
+
+    Other processes (the ingest watcher, other dashboards) may refresh the same cache, so nothing is
+    rewritten in place: a rebuild is written next to the cache and swapped in, as is every
+    partition an append changes.
+    """
+
+    def __init__(self, source_path: str = None, cache_dir: str = None):
+        self.source_path = source_path or ledger_path
+        self.cache_dir = cache_dir or ledger_cache_dir
+        self.meta = None
+        self._lock = threading.Lock()
+
+    # Validation and (re)building
+
+    def _read_meta(self) -> Optional[dict]:
+        path = os.path.join(self.cache_dir, META_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf8") as f:
+            meta = json.load(f)
+        return meta if meta.get("version") == STORE_VERSION else None
+
+    def _write_meta(self, meta: dict) -> None:
+        path = os.path.join(self.cache_dir, META_FILE)
+        with open(path + ".tmp", "w", encoding="utf8") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(path + ".tmp", path)
+        self.meta = meta
+
+    def refresh(self) -> str:
+        """
+        Brings the cache up to date with the source file.
+        Returns "fresh", "appended" or "rebuilt".
+        """
+        with self._lock:
+            st = os.stat(self.source_path)
+            meta = self.meta
+            if not self._matches(meta, st):
+                # Not read yet, or another process (e.g. the ingest watcher) has updated the cache since
+                meta = self._read_meta() or meta
+            if self._matches(meta, st):
+                self.meta = meta
+                return "fresh"
+            if meta and self._can_append(meta, st.st_size):
+                self._append(meta, st)
+                return "appended"
+            self._rebuild(st)
+            return "rebuilt"
+
+    @staticmethod
+    def _matches(meta: Optional[dict], st: os.stat_result) -> bool:
+        return bool(meta) and meta["source"]["size"] == st.st_size and meta["source"]["mtime"] == st.st_mtime
+
+    def _can_append(self, meta: dict, size: int) -> bool:
+        source = meta["source"]
+        if size < source["parsed_bytes"]:
+            return False
+        if digest_prefix(self.source_path, source["parsed_bytes"]) != source["parsed_sha256"]:
+            return False
+        # New rows must start on a fresh line, not extend the last parsed one
+        if source["ends_with_newline"]:
+            return True
+        with open(self.source_path, "rb") as f:
+            f.seek(source["parsed_bytes"])
+            return f.read(1) in (b"\n", b"\r", b"")
+
+    def _rebuild(self, st: os.stat_result) -> None:
+        with open(self.source_path, "rb") as f:
+            data = f.read(st.st_size)
+        header = data.split(b"\n", 1)[0] + b"\n"
+        df = normalize_transactions(pd.read_csv(io.BytesIO(data)))
+        categories = {column: [str(c) for c in df[column].cat.categories] for column in CATEGORICAL_COLUMNS}
+
+        tmp = f"{self.cache_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        partitions = {}
+        for month, rows in self._split_months(df, categories).items():
+            partitions[month] = self._write_partition(os.path.join(tmp, month), rows)
+        meta = self._build_meta(st, hashlib.sha256(data).hexdigest(), data.endswith(b"\n"),
+                                header, categories, partitions)
+        with open(os.path.join(tmp, META_FILE), "w", encoding="utf8") as f:
+            json.dump(meta, f, indent=2)
+        swap_directory(tmp, self.cache_dir)
+        self.meta = meta
+
+    def _append(self, meta: dict, st: os.stat_result) -> None:
+        source = meta["source"]
+        with open(self.source_path, "rb") as f:
+            f.seek(source["parsed_bytes"])
+            tail = f.read(st.st_size - source["parsed_bytes"])
+        header = source["header"].encode("utf-8")
+        categories = {column: list(values) for column, values in meta["categories"].items()}
+        partitions = dict(meta["partitions"])
+        if tail.strip():
+            new_rows = normalize_transactions(pd.read_csv(io.BytesIO(header + tail.lstrip(b"\r\n"))))
+            for column in CATEGORICAL_COLUMNS:
+                # Unseen values get new codes at the end, existing codes never change
+                categories[column] = categories[column] + [str(c) for c in new_rows[column].cat.categories
+                                                           if str(c) not in categories[column]]
+            for month, rows in self._split_months(new_rows, categories).items():
+                if month in partitions:
+                    rows = pd.concat([self._read_partition(month, categories), rows], ignore_index=True)
+                    rows = rows.sort_values("Date", kind="stable").reset_index(drop=True)
+                tmp = f"{self._partition_dir(month)}.tmp-{os.getpid()}"
+                partitions[month] = self._write_partition(tmp, rows)
+                swap_directory(tmp, self._partition_dir(month))
+        ends_with_newline = tail.endswith(b"\n") if tail else source["ends_with_newline"]
+        self._write_meta(self._build_meta(st, digest_prefix(self.source_path, st.st_size), ends_with_newline,
+                                          header, categories, partitions))
+
+    def _build_meta(self, st, sha256: str, ends_with_newline: bool, header: bytes, categories: dict,
+                    partitions: dict) -> dict:
+        return {
+            "version": STORE_VERSION,
+            "source": {
+                "path": self.source_path,
+                "size": st.st_size,
+                "mtime": st.st_mtime,
+                "parsed_bytes": st.st_size,
+                "parsed_sha256": sha256,
+                "ends_with_newline": ends_with_newline,
+                "header": header.decode("utf-8"),
+            },
+            "categories": categories,
+            "partitions": dict(sorted(partitions.items())),
+        }
+
+    @staticmethod
+    def _split_months(df: pd.DataFrame, categories: dict) -> Dict[str, pd.DataFrame]:
+        for column in CATEGORICAL_COLUMNS:
+            df[column] = df[column].astype(str).astype(pd.CategoricalDtype(categories[column]))
+        return {f"{period}": rows.reset_index(drop=True)
+                for period, rows in df.groupby(df["Date"].dt.to_period("M"), sort=True)}
+
+    # Partition files
+
+    def _partition_dir(self, month: str) -> str:
+        return os.path.join(self.cache_dir, month)
+
+    @staticmethod
+    def _write_partition(directory: str, rows: pd.DataFrame) -> int:
+        """
+        Writes a partition into a new directory, which the caller swaps in
+        """
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        cube = TransactionCube.from_transactions(rows).cube
+        for columns, frame in ((ROW_COLUMNS, rows), (CUBE_COLUMNS, cube)):
+            for name, (column, dtype) in columns.items():
+                values = frame[column]
+                values = values.cat.codes.values if column in CATEGORICAL_COLUMNS else values.values
+                np.save(os.path.join(directory, name + ".npy"), np.asarray(values).astype(dtype))
+        return len(rows)
+
+    def _read_columns(self, month: str, columns: dict, categories: dict) -> pd.DataFrame:
+        directory = self._partition_dir(month)
+        frame = {}
+        for name, (column, _) in columns.items():
+            values = np.load(os.path.join(directory, name + ".npy"), mmap_mode="r")
+            if column in CATEGORICAL_COLUMNS:
+                values = pd.Categorical.from_codes(values, categories=categories[column])
+            frame[column] = values
+        return pd.DataFrame(frame)
+
+    def _read_partition(self, month: str, categories: dict) -> pd.DataFrame:
+        return self._read_columns(month, ROW_COLUMNS, categories)
+
+    # Reading
+
+    @property
+    def version(self) -> str:
+        """
+        Identifies the cached ledger contents; changes whenever the source does
+        """
+        meta = self.meta or self._read_meta()
+        return meta["source"]["parsed_sha256"] if meta else ""
+
+    def source_version(self) -> str:
+        """
+        Identifies the source file as it is now, without reading or refreshing the cache
+        """
+        st = os.stat(self.source_path)
+        return f"{st.st_size}:{st.st_mtime_ns}"
+
+    def months(self, start=None, end=None) -> List[str]:
+        """
+        Partitions overlapping the [start, end] period
+        """
+        first = pd.Timestamp(start).to_period("M") if start is not None else None
+        last = pd.Timestamp(end).to_period("M") if end is not None else None
+        return [month for month in self.meta["partitions"]
+                if (first is None or pd.Period(month, "M") >= first) and (last is None or pd.Period(month, "M") <= last)]
+
+    def _concat(self, months: List[str], columns: dict) -> pd.DataFrame:
+        categories = self.meta["categories"]
+        if not months:
+            empty = {column: pd.Series(dtype=dtype) for column, dtype in columns.values()}
+            for column in CATEGORICAL_COLUMNS:
+                empty[column] = pd.Categorical([], categories=categories[column])
+            return pd.DataFrame(empty)
+        return pd.concat([self._read_columns(month, columns, categories) for month in months], ignore_index=True)
+
+    def _read(self, start, end, columns: dict) -> pd.DataFrame:
+        self.refresh()
+        try:
+            return self._concat(self.months(start, end), columns)
+        except FileNotFoundError:
+            # Another process swapped in a rebuilt cache while this one read the old one
+            self.meta = None
+            self.refresh()
+            return self._concat(self.months(start, end), columns)
+
+    def transactions(self, start=None, end=None) -> pd.DataFrame:
+        """
+        Normalized transactions of the months overlapping [start, end], reading only those partitions
+        """
+        return self._read(start, end, ROW_COLUMNS)
+
+    def cube(self, start=None, end=None) -> TransactionCube:
+        """
+        Daily aggregates of the months overlapping [start, end], without loading any transaction rows
+        """
+        return TransactionCube(self._read(start, end, CUBE_COLUMNS))
+
+
+_store = None
+_ledger = None
+_ledger_version = None
+_store_lock = threading.Lock()
+
+def get_ledger_store() -> LedgerStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = LedgerStore()
+    return _store
+
+def get_ledger() -> TransactionLedger:
+    """
+    Returns the shared in-memory ledger, reloaded from the cache when the source file changed
+    """
+    global _ledger, _ledger_version
+    store = get_ledger_store()
+    store.refresh()
+    if _ledger is None or store.version != _ledger_version:
+        with _store_lock:
+            if _ledger is None or store.version != _ledger_version:
+                _ledger, _ledger_version = TransactionLedger(store.transactions()), store.version
+    return _ledger
@@ -0,0 +1,201 @@
+import heapq
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+LEXICAL_INDEX_FILE = "lexical.sqlite3"
+
+# Numbers and dates ("1,288.01", "20/01/2019") stay single tokens so they can be matched exactly
+TOKEN_PATTERN = re.compile(r"\d+(?:[.,/:-]\d+)*|[a-z]+")
+STOPWORDS = frozenset("""
+    a an and are as at be been but by did do does for from had has have how i if in into is it its me my of
+    on or so than that the their them then there these they this to was we were what when where which who
+    why will with you your
+""".split())
+# CSVLoader rows start with "Date: dd/mm/yyyy"
+ROW_DATE_PATTERN = re.compile(r"^\s*Date:\s*(\d{1,2})/(\d{1,2})/(\d{4})", re.MULTILINE)
+# Chunk metadata flagging a file the chunk came from. A deduplicated chunk carries one per file,
+# so a source filter selects it through any of them, not only through its primary "source".
+SOURCE_FLAG_PREFIX = "source:"
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token[0].isdigit():
+            # "1,288.01" and "1288.01" are the same amount
+            token = token.replace(",", "")
+        if token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+def source_flag(source: str) -> str:
+    return SOURCE_FLAG_PREFIX + source
+
+
+def flagged_sources(metadata: dict) -> List[str]:
+    return [key[len(SOURCE_FLAG_PREFIX):] for key, value in metadata.items()
+            if key.startswith(SOURCE_FLAG_PREFIX) and value]
+
+
+def chunk_fields(source: str, text: str) -> dict:
+    """
+    Filterable metadata of a chunk: its document type (file extension), its source flag and, for
+    ledger rows, the transaction date as a yyyymmdd integer
+    """
+    fields = {"doc_type": os.path.splitext(source)[1].lower().lstrip("."), source_flag(source): 1}
+    match = ROW_DATE_PATTERN.search(text)
+    if match:
+        day, month, year = (int(part) for part in match.groups())
+        fields["date"] = year * 10000 + month * 100 + day
+    return fields
+
+
+def filter_values(value) -> List:
+    return list(value) if isinstance(value, (list, tuple, set)) else [value]
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over the chunks in the vector store, kept in an SQLite file next to it.
+
+    Postings hold per-chunk term frequencies, and document frequencies and corpus statistics are
+    maintained incrementally, so adding or removing a chunk only touches its own terms. The
+    filterable fields of every chunk (source, doc_type, date, date_to) are stored alongside it so
+    searches can be restricted before scoring, with every source file of a deduplicated chunk
+    in a table of their own.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (id TEXT PRIMARY KEY, length INTEGER NOT NULL,
+                                             source TEXT, doc_type TEXT, date INTEGER, date_to INTEGER);
+            CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, id TEXT NOT NULL, tf INTEGER NOT NULL,
+                                                 PRIMARY KEY (term, id)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_id ON postings (id);
+            CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS doc_sources (id TEXT NOT NULL, source TEXT NOT NULL,
+                                                    PRIMARY KEY (id, source)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS doc_sources_source ON doc_sources (source);
+            CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO stats (name, value) VALUES ('docs', 0), ('tokens', 0);
+        """)
+        # Indexes built before summaries carried their period's end get the column, to be backfilled
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(docs)")]
+        self.date_ranges_missing = "date_to" not in columns
+        if self.date_ranges_missing:
+            self._conn.execute("ALTER TABLE docs ADD COLUMN date_to INTEGER")
+
+    def _bump_stats(self, docs: int, tokens: int) -> None:
+        self._conn.execute("UPDATE stats SET value = value + ? WHERE name = 'docs'", (docs,))
+        self._conn.execute("UPDATE stats SET value = value + ? WHERE name = 'tokens'", (tokens,))
+
+    def add(self, chunk_id: str, text: str, metadata: dict) -> None:
+        # Re-adding a chunk (an upsert after an interrupted run) replaces it
+        self.remove([chunk_id])
+        counts = Counter(tokenize(text))
+        length = sum(counts.values())
+        self._conn.execute("INSERT INTO docs (id, length, source, doc_type, date, date_to) VALUES (?, ?, ?, ?, ?, ?)",
+                           (chunk_id, length, metadata.get("source"), metadata.get("doc_type"), metadata.get("date"),
+                            metadata.get("date_to")))
+        self.set_sources(chunk_id, flagged_sources(metadata) or [metadata.get("source")])
+        self._conn.executemany("INSERT INTO postings (term, id, tf) VALUES (?, ?, ?)",
+                               [(term, chunk_id, tf) for term, tf in counts.items()])
+        self._conn.executemany("INSERT INTO terms (term, df) VALUES (?, 1) ON CONFLICT (term) DO UPDATE SET df = df + 1",
+                               [(term,) for term in counts])
+        self._bump_stats(1, length)
+
+    def add_many(self, ids: List[str], texts: List[str], metadatas: List[dict]) -> None:
+        for chunk_id, text, metadata in zip(ids, texts, metadatas):
+            self.add(chunk_id, text, metadata)
+
+    def set_source(self, chunk_id: str, source: str, doc_type: str) -> None:
+        self._conn.execute("UPDATE docs SET source = ?, doc_type = ? WHERE id = ?", (source, doc_type, chunk_id))
+
+    def set_date_to(self, chunk_id: str, date_to: int) -> None:
+        self._conn.execute("UPDATE docs SET date_to = ? WHERE id = ?", (date_to, chunk_id))
+
+    def set_sources(self, chunk_id: str, sources: List[str]) -> None:
+        self._conn.execute("DELETE FROM doc_sources WHERE id = ?", (chunk_id,))
+        self._conn.executemany("INSERT INTO doc_sources (id, source) VALUES (?, ?)",
+                               [(chunk_id, source) for source in sources])
+
+    def has_sources(self) -> bool:
+        return self._conn.execute("SELECT 1 FROM doc_sources LIMIT 1").fetchone() is not None
+
+    def remove(self, ids: Iterable[str]) -> None:
+        for chunk_id in ids:
+            row = self._conn.execute("SELECT length FROM docs WHERE id = ?", (chunk_id,)).fetchone()
+            if row is None:
+                continue
+            terms = [(r[0],) for r in self._conn.execute("SELECT term FROM postings WHERE id = ?", (chunk_id,))]
+            self._conn.executemany("UPDATE terms SET df = df - 1 WHERE term = ?", terms)
+            self._conn.executemany("DELETE FROM terms WHERE term = ? AND df <= 0", terms)
+            self._conn.execute("DELETE FROM postings WHERE id = ?", (chunk_id,))
+            self._conn.execute("DELETE FROM docs WHERE id = ?", (chunk_id,))
+            self._conn.execute("DELETE FROM doc_sources WHERE id = ?", (chunk_id,))
+            self._bump_stats(-1, -row[0])
+
+    def count(self) -> int:
+        return self._conn.execute("SELECT value FROM stats WHERE name = 'docs'").fetchone()[0]
+
+    @staticmethod
+    def _filter_sql(filters: Optional[dict]) -> Tuple[str, list]:
+        clauses, params = [], []
+        if filters and filters.get("source"):
+            values = filter_values(filters["source"])
+            clauses.append(f"d.id IN (SELECT id FROM doc_sources WHERE source IN ({','.join('?' * len(values))}))")
+            params.extend(values)
+        if filters and filters.get("doc_type"):
+            values = filter_values(filters["doc_type"])
+            clauses.append(f"d.doc_type IN ({','.join('?' * len(values))})")
+            params.extend(values)
+        if filters and filters.get("date_from") is not None:
+            # A summary matches when its period overlaps the filter's
+            clauses.append("COALESCE(d.date_to, d.date) >= ?")
+            params.append(filters["date_from"])
+        if filters and filters.get("date_to") is not None:
+            clauses.append("d.date <= ?")
+            params.append(filters["date_to"])
+        return "".join(" AND " + clause for clause in clauses), params
+
+    def search(self, query: str, k: int, filters: Optional[dict] = None) -> List[Tuple[str, float]]:
+        """
+        Returns up to k (chunk ID, BM25 score) pairs, best first, among the chunks matching the filters
+        """
+        filter_sql, filter_params = self._filter_sql(filters)
+        scores: Dict[str, float] = {}
+        # Searches come from several answer threads sharing one connection
+        with self._lock:
+            stats = dict(self._conn.execute("SELECT name, value FROM stats"))
+            if not stats["docs"]:
+                return []
+            average_length = stats["tokens"] / stats["docs"]
+            for term in set(tokenize(query)):
+                row = self._conn.execute("SELECT df FROM terms WHERE term = ?", (term,)).fetchone()
+                if row is None:
+                    continue
+                idf = math.log(1 + (stats["docs"] - row[0] + 0.5) / (row[0] + 0.5))
+                rows = self._conn.execute(
+                    "SELECT p.id, p.tf, d.length FROM postings p JOIN docs d ON d.id = p.id "
+                    "WHERE p.term = ?" + filter_sql, [term] + filter_params)
+                for chunk_id, tf, length in rows:
+                    norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def commit(self) -> None:
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,192 @@
+import os
+import sys
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, List, Optional
+
+from tracing import start_trace
+
+if TYPE_CHECKING:
+    from langchain.callbacks.base import BaseCallbackHandler
+
+# Questions answered at the same time; Ollama serves one model, so more mostly adds contention
+max_concurrent_answers = int(os.environ.get('LLM_MAX_CONCURRENT', 2))
+# Questions allowed to wait for a free slot before new ones are turned away
+max_queued_answers = int(os.environ.get('LLM_MAX_QUEUED', 8))
+
+
+class AnswerCancelled(Exception):
+    """
+    Raised inside a running answer once its session cancelled it
+    """
+
+    trace_status = "cancelled"
+
+
+class ServiceBusy(Exception):
+    """
+    Raised by submit() when the wait queue is full
+    """
+
+
+def answer_question(question: str, callbacks: List["BaseCallbackHandler"]) -> str:
+    """
+    Answers numeric ledger questions from the table and everything else with the documents and the LLM
+    """
+    from privateGPT import get_engine
+    from query_router import route_question
+
+    with start_trace("answer", question=question) as trace:
+        with trace.span("route"):
+            answer = route_question(question)
+        trace.set(answered_by="ledger" if answer is not None else "llm")
+        if answer is not None:
+            return answer
+        answer, _ = get_engine().ask(question, hide_source=True, mute_stream=True, callbacks=callbacks)
+        return answer
+
+
+def loaded_engine():
+    """
+    The process-wide QueryEngine if a question or a prewarm already created it, else None.
+    Status displays use it so that showing a figure never loads the models.
+    """
+    # The module may still be importing on the prewarm thread
+    return getattr(sys.modules.get("privateGPT"), "_engine", None)
+
+
+def prewarm_engine() -> threading.Thread:
+    """
+    Imports LangChain and loads the query engine in a daemon thread, so the first question does
+    not wait for model initialisation
+    """
+    def warm_up():
+        try:
+            from privateGPT import get_engine
+
+            get_engine().warm_up()
+        except Exception as e:
+            # The first question reports the problem again; the dashboard keeps running meanwhile
+            print(f"Could not prewarm the query engine: {e}")
+
+    thread = threading.Thread(target=warm_up, name="query-engine-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+class AnswerRequest:
+    def __init__(self, question: str):
+        self.id = uuid.uuid4().hex
+        self.question = question
+        self.cancelled = threading.Event()
+        self.future: Optional[Future] = None
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+        # Drops the request outright if it is still waiting for a worker
+        if self.future is not None:
+            self.future.cancel()
+
+
+class AnswerService:
+    """
+    Runs questions on a bounded worker pool, off the Panel server's event loop.
+
+    At most `max_concurrent` questions are answered at once and at most `max_queued` more wait for
+    a worker; beyond that submit() raises ServiceBusy so the caller can tell the user to retry
+    instead of piling up work. A single service is shared by every dashboard session.
+    """
+
+    def __init__(self, answer_fn: Callable[[str, List["BaseCallbackHandler"]], str] = answer_question,
+                 max_concurrent: int = max_concurrent_answers, max_queued: int = max_queued_answers):
+        self.answer_fn = answer_fn
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="llm-answer")
+        self._lock = threading.Lock()
+        self._counts = {"queued": 0, "in_flight": 0, "completed": 0, "cancelled": 0, "failed": 0, "rejected": 0}
+
+    def submit(self, question: str, on_token: Callable[[str], None]) -> AnswerRequest:
+        with self._lock:
+            if self._counts["queued"] >= self.max_queued:
+                self._counts["rejected"] += 1
+                raise ServiceBusy(f"{self._counts['queued']} questions are already waiting")
+            self._counts["queued"] += 1
+        request = AnswerRequest(question)
+        request.future = self._executor.submit(self._run, request, on_token)
+        request.future.add_done_callback(self._on_done)
+        return request
+
+    def _on_done(self, future: Future) -> None:
+        # Only requests cancelled while still queued end here without passing through _run
+        if future.cancelled():
+            with self._lock:
+                self._counts["queued"] -= 1
+                self._counts["cancelled"] += 1
+
+    def _run(self, request: AnswerRequest, on_token: Callable[[str], None]) -> str:
+        with self._lock:
+            self._counts["queued"] -= 1
+            self._counts["in_flight"] += 1
+        outcome = "failed"
+        try:
+            # Imported here, as it loads LangChain
+            from callbacks import TokenStreamHandler
+
+            if request.cancelled.is_set():
+                raise AnswerCancelled()
+            answer = self.answer_fn(request.question, [TokenStreamHandler(on_token, request.cancelled)])
+            outcome = "completed"
+            return answer
+        except AnswerCancelled:
+            outcome = "cancelled"
+            raise
+        finally:
+            with self._lock:
+                self._counts["in_flight"] -= 1
+                self._counts[outcome] += 1
+
+    def metrics(self) -> dict:
+        """
+        Queue depth, questions being answered and totals by outcome since start-up
+        """
+        with self._lock:
+            return dict(self._counts, max_concurrent=self.max_concurrent, max_queued=self.max_queued)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class AnswerSession:
+    """
+    The questions of one dashboard session. Asking a new question cancels the previous one.
+    """
+
+    def __init__(self, service: AnswerService):
+        self.service = service
+        self.current: Optional[AnswerRequest] = None
+
+    def ask(self, question: str, on_token: Callable[[str], None]) -> AnswerRequest:
+        self.cancel()
+        self.current = self.service.submit(question, on_token)
+        return self.current
+
+    def cancel(self) -> None:
+        if self.current is not None:
+            self.current.cancel()
+
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_answer_service() -> AnswerService:
+    """
+    Returns the process-wide AnswerService, creating it on first use.
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = AnswerService()
+    return _service
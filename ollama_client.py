@@ -0,0 +1,64 @@
+import os
+import threading
+from typing import Any, Iterator, List, Optional
+
+import requests
+from langchain.llms import Ollama
+from requests.adapters import HTTPAdapter
+
+# Keep-alive connections to the Ollama server; at least as many as answers generated at once
+ollama_pool_size = int(os.environ.get('OLLAMA_POOL_SIZE', 8))
+
+
+def create_session(pool_size: int = ollama_pool_size) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    """
+    Returns the process-wide session to the Ollama server, creating it on first use.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+class PooledOllama(Ollama):
+    """
+    Ollama LLM that streams over a shared requests session, so consecutive and concurrent answers
+    reuse open connections instead of connecting for every call as LangChain's client does.
+    """
+
+    session: Any = None
+
+    def _create_stream(self, prompt: str, stop: Optional[List[str]] = None, **kwargs: Any) -> Iterator[str]:
+        if self.stop is not None and stop is not None:
+            raise ValueError("`stop` found in both the input and default params.")
+        stop = self.stop if self.stop is not None else stop or []
+        params = {**self._default_params, "stop": stop, **kwargs}
+        response = (self.session or get_session()).post(url=f"{self.base_url}/api/generate/",
+                                                        headers={"Content-Type": "application/json"},
+                                                        json={"prompt": prompt, **params}, stream=True)
+        response.encoding = "utf-8"
+        if response.status_code != 200:
+            optional_detail = response.json().get("error")
+            response.close()
+            raise ValueError(f"Ollama call failed with status code {response.status_code}. "
+                             f"Details: {optional_detail}")
+        return self._iter_lines(response)
+
+    @staticmethod
+    def _iter_lines(response: requests.Response) -> Iterator[str]:
+        # Closing hands the connection back to the pool, also when a cancelled answer stops reading early
+        with response:
+            yield from response.iter_lines(decode_unicode=True)
@@ -0,0 +1,86 @@
+import os
+import sqlite3
+from typing import Dict, Iterator, List, Optional
+
+from langchain.docstore.document import Document
+
+# Extracted page texts, kept outside the persist directory so they survive `ingest.py --reset`;
+# an empty value turns the cache off
+pdf_page_cache_path = os.environ.get('PDF_PAGE_CACHE_PATH', os.path.join('cache', 'pdf_pages.sqlite3'))
+
+
+class PageCache:
+    """
+    Persistent map from (PDF content hash, page number) to the page's text. Pages without text
+    are stored as NULL so they are skipped without being opened again.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Every loader process has its own connection; the timeout covers concurrent writers
+        self._conn = sqlite3.connect(path, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS pages (file_sha256 TEXT NOT NULL, page INTEGER NOT NULL, "
+                           "text TEXT, PRIMARY KEY (file_sha256, page))")
+
+    def get_many(self, file_sha256: str, start: int, stop: int) -> Dict[int, Optional[str]]:
+        rows = self._conn.execute("SELECT page, text FROM pages WHERE file_sha256 = ? AND page >= ? AND page < ?",
+                                  (file_sha256, start, stop))
+        return dict(rows)
+
+    def put_many(self, file_sha256: str, pages: Dict[int, Optional[str]]) -> None:
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO pages (file_sha256, page, text) VALUES (?, ?, ?)",
+                                   [(file_sha256, page, text) for page, text in pages.items()])
+
+
+_cache = None
+
+def get_page_cache() -> Optional[PageCache]:
+    global _cache
+    if _cache is None and pdf_page_cache_path:
+        _cache = PageCache(pdf_page_cache_path)
+    return _cache
+
+
+def page_count(file_path: str) -> int:
+    import fitz
+
+    with fitz.open(file_path) as doc:
+        return doc.page_count
+
+
+def extract_page(page) -> Optional[str]:
+    # A page without fonts has no text layer (blank or scanned), so it is not worth extracting
+    if not page.get_fonts():
+        return None
+    text = page.get_text()
+    return text if text.strip() else None
+
+
+def iter_pdf_pages(file_path: str, file_sha256: str, start: int, stop: int,
+                   cache: Optional[PageCache] = None) -> Iterator[Document]:
+    """
+    Yields one document per page with text in [start, stop), with the same metadata as
+    PyMuPDFLoader. Cached pages are not parsed again.
+    """
+    import fitz
+
+    cache = cache or get_page_cache()
+    texts = cache.get_many(file_sha256, start, stop) if cache else {}
+    with fitz.open(file_path) as doc:
+        stop = min(stop, doc.page_count)
+        extracted = {number: extract_page(doc[number]) for number in range(start, stop) if number not in texts}
+        if extracted and cache:
+            cache.put_many(file_sha256, extracted)
+        texts.update(extracted)
+        metadata = {key: value for key, value in doc.metadata.items() if type(value) in [str, int]}
+        for number in range(start, stop):
+            if texts.get(number) is not None:
+                yield Document(page_content=texts[number],
+                               metadata=dict({"source": file_path, "file_path": file_path, "page": number,
+                                              "total_pages": doc.page_count}, **metadata))
+
+
+def load_pdf_pages(file_path: str, file_sha256: str, start: int, stop: int) -> List[Document]:
+    return list(iter_pdf_pages(file_path, file_sha256, start, stop))
@@ -1,25 +1,265 @@
 from langchain.chains import RetrievalQA
 from langchain.embeddings import HuggingFaceEmbeddings
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
-from langchain.vectorstores import Chroma
-from langchain.llms import Ollama
+from langchain.schema import Document
+from answer_cache import AnswerCache, answer_cache_enabled
+from callbacks import TraceCallbackHandler
+from context_packing import PackedRetriever, context_max_chunks, context_packing_enabled
+from hybrid_retriever import HybridRetriever
+from lexical_index import LEXICAL_INDEX_FILE, LexicalIndex
+from ollama_client import PooledOllama
+from quantized_index import QuantizedIndex, is_quantized_index_current, quantized_index_path
+from tracing import current_trace, start_trace
+from vectorstore import IncompatibleStoreError, does_vectorstore_exist, open_vectorstore, read_store_meta, store_revision
 import os
 import argparse
+import functools
+import threading
 import time
+from datetime import datetime
 
 # Configuration
 model = os.environ.get("MODEL", "mistral")
+ollama_base_url = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
 embeddings_model_name = os.environ.get("EMBEDDINGS_MODEL_NAME", "all-MiniLM-L6-v2")
 persist_directory = os.environ.get("PERSIST_DIRECTORY", "db")
 target_source_chunks = int(os.environ.get('TARGET_SOURCE_CHUNKS', 4))
+# "hybrid" fuses BM25 and vector search, "dense" only uses the vectors
+retrieval_mode = os.environ.get('RETRIEVAL_MODE', 'hybrid')
+# "chroma" searches the Chroma HNSW index, "quantized" the int8 index built by quantized_index.py
+vector_backend = os.environ.get('VECTOR_BACKEND', 'chroma')
 
-CHROMA_SETTINGS = {
-    "host": "localhost",
-    "port": 8000,
-    "persist_directory": "./chroma_data",
-    "metric": "cosine",
-    "embedding_dim": 768
-}
+class QueryEngine:
+    """
+    Long-lived question answering engine.
+
+    Owns the embedding model, the Chroma handle, the retriever, the Ollama client and the
+    RetrievalQA chain so that they are built once per process instead of once per question.
+    A single instance can be shared by every Panel session. Every question first checks the vector
+    store revision, so the engine re-opens the store after an ingest run (e.g. by `ingest.py --watch`)
+    without a restart; `reload()` does so unconditionally. Answers are cached in `answer_cache` (if enabled)
+    until the vector store or the ledger changes.
+    """
+
+    def __init__(self, model_name=None, embeddings_model=None, persist_dir=None, k=None, answer_cache=None,
+                 base_url=None):
+        self.model_name = model_name or model
+        self.base_url = base_url or ollama_base_url
+        self.embeddings_model = embeddings_model or embeddings_model_name
+        self.persist_dir = persist_dir or persist_directory
+        self.k = k or target_source_chunks
+        if answer_cache is None and answer_cache_enabled:
+            answer_cache = AnswerCache()
+        self.answer_cache = answer_cache
+        self._lock = threading.Lock()
+        self._embeddings = None
+        self._db = None
+        self._lexical = None
+        self._qa = None
+        self._revision = None
+        # Chroma client replaced by the last reload, stopped at the next one (see _retire)
+        self._retired_client = None
+        # Vectors computed ahead by embed_queries(), taken by the first question that needs them
+        self._primed_queries = {}
+        # The answer cache and the retriever embed the same question; compute it once
+        self._embed_query = functools.lru_cache(maxsize=256)(self._embed_query_uncached)
+
+    def load(self):
+        """
+        Builds the engine components if they are not loaded yet. Safe to call repeatedly.
+        """
+        if self._qa is None:
+            with self._lock:
+                if self._qa is None:
+                    self._build()
+        return self
+
+    def reload(self):
+        """
+        Re-opens the vector store and rebuilds the chain, keeping the loaded embedding model.
+        """
+        with self._lock:
+            self._build()
+        return self
+
+    def _is_stale(self):
+        if store_revision(self.persist_dir) != self._revision:
+            return True
+        # Fell back to Chroma because the quantized index was outdated; switch once it is rebuilt
+        return (vector_backend == "quantized" and not isinstance(self._db, QuantizedIndex)
+                and is_quantized_index_current(self.persist_dir))
+
+    def refresh(self):
+        """
+        Reloads the engine if the vector store changed since it was built. Costs a small file read.
+        """
+        if self._qa is not None and self._is_stale():
+            with self._lock:
+                if self._is_stale():
+                    print(f"Vectorstore changed since revision {self._revision}, reloading")
+                    self._build()
+        return self
+
+    def _build(self):
+        if not does_vectorstore_exist(self.persist_dir):
+            raise IncompatibleStoreError(f"No vectorstore found at {self.persist_dir}, run ingest.py first")
+        meta = read_store_meta(self.persist_dir)
+        if meta and meta["embedding_model"] != self.embeddings_model:
+            raise IncompatibleStoreError(f"Vectorstore was built with {meta['embedding_model']} "
+                                         f"but {self.embeddings_model} is configured")
+        trace = current_trace()
+        if self._embeddings is None:
+            with trace.span("load_embedding_model", model=self.embeddings_model):
+                self._embeddings = HuggingFaceEmbeddings(model_name=self.embeddings_model)
+        with trace.span("open_vectorstore", backend=vector_backend):
+            db = self._open_vectors()
+        lexical_path = os.path.join(self.persist_dir, LEXICAL_INDEX_FILE)
+        lexical = LexicalIndex(lexical_path) if retrieval_mode == "hybrid" and os.path.exists(lexical_path) else None
+        if context_packing_enabled:
+            # The token budget decides how many of the candidates reach the prompt
+            retriever = PackedRetriever(retriever=HybridRetriever(collection=db, embed_query=self._embed_query,
+                                                                  lexical=lexical, k=context_max_chunks))
+        else:
+            retriever = HybridRetriever(collection=db, embed_query=self._embed_query, lexical=lexical, k=self.k)
+        llm = PooledOllama(model=self.model_name, base_url=self.base_url)
+        qa = RetrievalQA.from_chain_type(llm=llm, chain_type="stuff", retriever=retriever, return_source_documents=True)
+        # Publish the new handles together so concurrent callers never see a half-built engine
+        old_db = self._db
+        self._db, self._lexical, self._qa, self._revision = db, lexical, qa, meta["revision"] if meta else 0
+        self._embed_query.cache_clear()
+        self._retire(old_db)
+
+    def _retire(self, old_db):
+        """
+        Releases the Chroma client of a replaced store. Every client has its own system and HNSW
+        index in memory, which chromadb keeps until the system is stopped. A question still running
+        on the replaced store may be using it, so it is stopped one reload later.
+        """
+        if self._retired_client is not None:
+            self._retired_client._system.stop()
+        self._retired_client = getattr(old_db, "_client", None)
+
+    def _open_vectors(self):
+        """
+        Opens the configured vector backend: the Chroma collection or the quantized index
+        """
+        if vector_backend == "quantized":
+            if is_quantized_index_current(self.persist_dir):
+                return QuantizedIndex(quantized_index_path(self.persist_dir))
+            print("The quantized index is missing or older than the vectorstore, using Chroma. "
+                  "Rebuild it with: python quantized_index.py")
+        return open_vectorstore(self.persist_dir, self._embeddings)._collection
+
+    def _embed_query_uncached(self, query):
+        primed = self._primed_queries.pop(query, None)
+        if primed is not None:
+            return primed
+        with current_trace().span("embed_query"):
+            return tuple(self._embeddings.embed_query(query))
+
+    def embed_queries(self, queries):
+        """
+        Embeds many questions in one model call ahead of asking them; ask() then uses these vectors.
+
+        :param queries: The questions, duplicates included.
+        """
+        queries = [query for query in dict.fromkeys(queries) if query not in self._primed_queries]
+        if queries:
+            with current_trace().span("embed_queries", queries=len(queries)):
+                vectors = self.load()._embeddings.embed_documents(queries)
+            self._primed_queries.update(zip(queries, map(tuple, vectors)))
+
+    def warm_up(self, background=False):
+        """
+        Loads the engine and runs one query embedding so the first real question does not pay
+        for model initialisation.
+
+        :param background: If True, warm up in a daemon thread and return immediately.
+        """
+        if background:
+            thread = threading.Thread(target=self.warm_up, name="query-engine-warmup", daemon=True)
+            thread.start()
+            return thread
+        self.load()
+        self._embed_query("warm up")
+        return None
+
+    def data_version(self):
+        """
+        Identifies the data answers are based on: the vector store revision and the ledger contents.
+        """
+        from ledger_store import get_ledger_store
+
+        try:
+            # Only the source file's state: rebuilding the ledger cache is up to its readers
+            ledger_version = get_ledger_store().source_version()
+        except FileNotFoundError:
+            ledger_version = ""
+        return f"store:{store_revision(self.persist_dir)}|ledger:{ledger_version}"
+
+    def ask(self, query, hide_source=False, mute_stream=False, callbacks=None, use_cache=True, filters=None):
+        """
+        Answers a query with the shared components.
+
+        :param query: The query to ask the LLM.
+        :param hide_source: If True, do not include source documents in the response.
+        :param mute_stream: If True, suppress streaming output to stdout.
+        :param callbacks: Extra LangChain callback handlers for this call only.
+        :param use_cache: If False, neither read nor store a cached answer.
+        :param filters: Only retrieve chunks matching these fields: source, doc_type, date_from, date_to
+                        (dates as yyyymmdd integers).
+        :return: A tuple containing the answer and a list of source documents.
+        """
+        trace = current_trace()
+        qa = self.load().refresh()._qa
+        if filters:
+            # A per-call chain sharing the LLM chain, so concurrent callers keep their own filters
+            qa = RetrievalQA(combine_documents_chain=qa.combine_documents_chain,
+                             retriever=qa.retriever.with_filters(filters), return_source_documents=True)
+        # Cached answers were retrieved without filters
+        cache = self.answer_cache if use_cache and not filters else None
+        if cache:
+            version = self.data_version()
+            embedding = list(self._embed_query(query))
+            with trace.span("cache_lookup") as span:
+                cached = cache.lookup(query, version, embedding)
+                span.set(result=cached[2] if cached else "miss")
+            trace.set(cache=cached[2] if cached else "miss")
+            if cached:
+                answer, sources, _ = cached
+                docs = [Document(page_content=s["page_content"], metadata=s["metadata"]) for s in sources]
+                return answer, [] if hide_source else docs
+
+        # Callbacks are passed per call so sessions sharing the engine don't see each other's tokens
+        run_callbacks = list(callbacks or [])
+        if not mute_stream:
+            run_callbacks.append(StreamingStdOutCallbackHandler())
+        if trace.enabled:
+            run_callbacks.append(TraceCallbackHandler(trace))
+        res = qa(query, callbacks=run_callbacks)
+
+        answer = res['result']
+        if cache:
+            sources = [{"page_content": d.page_content, "metadata": d.metadata} for d in res['source_documents']]
+            with trace.span("cache_store"):
+                cache.store(query, answer, sources, version, embedding)
+        docs = [] if hide_source else res['source_documents']
+        return answer, docs
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """
+    Returns the process-wide QueryEngine, creating it on first use.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = QueryEngine()
+    return _engine
 
 def get_answer(query, hide_source=False, mute_stream=False):
     """
@@ -28,26 +268,18 @@ def get_answer(query, hide_source=False, mute_stream=False):
     :param query: The query to ask the LLM.
     :param hide_source: If True, do not include source documents in the response.
     :param mute_stream: If True, suppress streaming output.
-    :return: A tuple containing the answer and a list of source documents.
+    :return: The answer text.
     """
-    embeddings = HuggingFaceEmbeddings(model_name=embeddings_model_name)
-    db = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
-    retriever = db.as_retriever(search_kwargs={"k": target_source_chunks})
-    
-    # Set up callbacks for streaming output
-    callbacks = [] if mute_stream else [StreamingStdOutCallbackHandler()]
-    llm = Ollama(model=model, callbacks=callbacks)
-    
-    qa = RetrievalQA.from_chain_type(llm=llm, chain_type="stuff", retriever=retriever, return_source_documents=not hide_source)
-    res = qa(query)
-    
-    answer = res['result']
-    docs = [] if hide_source else res['source_documents']
+    with start_trace("answer", question=query):
+        answer, docs = get_engine().ask(query, hide_source=hide_source, mute_stream=mute_stream)
     return answer #, docs
 
 def main():
     # Parse command line arguments
     args = parse_arguments()
+    filters = {"source": args.source, "doc_type": args.doc_type,
+               "date_from": args.date_from, "date_to": args.date_to}
+    filters = {key: value for key, value in filters.items() if value}
     while True:
         query = input("\nEnter a query: ")
         if query == "exit":
@@ -57,7 +289,9 @@ def main():
 
         # Get the answer
         start = time.time()
-        answer, docs = get_answer(query, hide_source=args.hide_source, mute_stream=args.mute_stream)
+        with start_trace("answer", question=query, filters=filters):
+            answer, docs = get_engine().ask(query, hide_source=args.hide_source, mute_stream=args.mute_stream,
+                                            use_cache=not args.no_cache, filters=filters)
         end = time.time()
 
         # Print the result
@@ -71,6 +305,12 @@ def main():
                 print("\n> " + document.metadata["source"] + ":")
                 print(document.page_content)
 
+def date_filter(value):
+    """
+    Parses a YYYY-MM-DD date into the yyyymmdd integer stored in chunk metadata
+    """
+    return int(datetime.strptime(value, "%Y-%m-%d").strftime("%Y%m%d"))
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description='privateGPT: Ask questions to your documents without an internet connection, '
                                                  'using the power of LLMs.')
@@ -79,6 +319,16 @@ def parse_arguments():
     parser.add_argument("--mute-stream", "-M",
                         action='store_true',
                         help='Use this flag to disable the streaming StdOut callback for LLMs.')
+    parser.add_argument("--no-cache", action='store_true',
+                        help='Use this flag to always ask the LLM instead of reusing cached answers.')
+    parser.add_argument("--source", action='append',
+                        help='Only retrieve from this source file; may be given several times.')
+    parser.add_argument("--doc-type", action='append',
+                        help='Only retrieve from documents of this type (file extension, e.g. csv or pdf).')
+    parser.add_argument("--date-from", type=date_filter,
+                        help='Only retrieve ledger rows on or after this date (YYYY-MM-DD).')
+    parser.add_argument("--date-to", type=date_filter,
+                        help='Only retrieve ledger rows on or before this date (YYYY-MM-DD).')
 
     return parser.parse_args()
 
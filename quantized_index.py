@@ -0,0 +1,283 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from lexical_index import SOURCE_FLAG_PREFIX
+from vectorstore import COLLECTION_NAME, open_collection, store_revision
+
+persist_directory = os.environ.get('PERSIST_DIRECTORY', 'db')
+# Candidates per requested result that are re-ranked with the exact float vectors
+rerank_factor = int(os.environ.get('QUANTIZED_RERANK_FACTOR', 4))
+
+QUANTIZED_DIR = "quantized"
+QUANTIZED_FORMAT_VERSION = 2
+# Rows scored per block, so scoring never materialises a float copy of the whole index
+SCAN_BLOCK_ROWS = 8192
+
+
+def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-vector int8 quantization: returns (codes, scales) with vectors ~= codes * scales[:, None]
+    """
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def distances(space: str, dots: np.ndarray, norms_sq: np.ndarray, query_norm_sq: float) -> np.ndarray:
+    """
+    Chroma's distance for the given space from inner products and squared norms
+    """
+    if space == "ip":
+        return 1.0 - dots
+    if space == "cosine":
+        return 1.0 - dots / np.sqrt(np.maximum(norms_sq * query_norm_sq, 1e-30))
+    return norms_sq - 2.0 * dots + query_norm_sq
+
+
+def where_sql(where: Optional[dict]) -> Tuple[str, list]:
+    """
+    Translates the Chroma where clauses the retrievers build ($eq, $gte, $lte, $and, $or) into SQL
+    """
+    if not where:
+        return "1", []
+    key, value = next(iter(where.items()))
+    if key in ("$and", "$or"):
+        parts = [where_sql(clause) for clause in value]
+        joiner = " AND " if key == "$and" else " OR "
+        return "(" + joiner.join(sql for sql, _ in parts) + ")", [p for _, params in parts for p in params]
+    operator, operand = next(iter(value.items())) if isinstance(value, dict) else ("$eq", value)
+    sql_operator = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}[operator]
+    if key.startswith(SOURCE_FLAG_PREFIX):
+        # Source flags are not columns of their own; they are read from the chunk's metadata
+        return f"json_extract(metadata, ?) {sql_operator} ?", ['$."' + key + '"', operand]
+    if key not in ("source", "doc_type", "date", "date_to"):
+        raise ValueError(f"Unsupported filter field {key}")
+    return f"{key} {sql_operator} ?", [operand]
+
+
+class QuantizedIndex:
+    """
+    Read-only vector index of int8 codes in memory-mapped .npy files, built from the Chroma collection.
+
+    A query scores the codes block by block with NumPy, then re-ranks the best candidates with the
+    original float32 vectors, which are memory-mapped as well so only the rows touched are read.
+    Chunk texts and filterable metadata are kept in an SQLite file next to the arrays. It answers
+    the subset of the Chroma collection API the retrievers use (query, get, count).
+    """
+
+    def __init__(self, directory: str, rerank: bool = True):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), encoding="utf8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != QUANTIZED_FORMAT_VERSION:
+            raise ValueError(f"Unsupported quantized index format in {directory}, rebuild it")
+        self.space = self.meta["space"]
+        self.codes = np.load(os.path.join(directory, "codes.npy"), mmap_mode="r")
+        self.scales = np.load(os.path.join(directory, "scales.npy"), mmap_mode="r")
+        self.norms_sq = np.load(os.path.join(directory, "norms_sq.npy"), mmap_mode="r")
+        vectors_path = os.path.join(directory, "vectors.npy")
+        self.vectors = np.load(vectors_path, mmap_mode="r") if rerank and os.path.exists(vectors_path) else None
+        self.ids = np.load(os.path.join(directory, "ids.npy"), mmap_mode="r")
+        self._conn = sqlite3.connect(os.path.join(directory, "chunks.sqlite3"), check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def _rows(self, where: Optional[dict]) -> Optional[np.ndarray]:
+        if not where:
+            return None
+        sql, params = where_sql(where)
+        with self._lock:
+            rows = self._conn.execute(f"SELECT row FROM chunks WHERE {sql} ORDER BY row", params).fetchall()
+        return np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+
+    def search(self, embedding: List[float], k: int, where: Optional[dict] = None) -> List[Tuple[int, float]]:
+        """
+        Returns up to k (row, distance) pairs, nearest first, among the rows matching the where clause
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        query_norm_sq = float(query @ query)
+        rows = self._rows(where)
+        total = len(self.ids) if rows is None else len(rows)
+        if total == 0:
+            return []
+        shortlist = min(total, k * rerank_factor if self.vectors is not None else k)
+
+        best_rows, best_scores = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        for start in range(0, total, SCAN_BLOCK_ROWS):
+            block = np.arange(start, min(start + SCAN_BLOCK_ROWS, total)) if rows is None \
+                else rows[start:start + SCAN_BLOCK_ROWS]
+            codes = self.codes[block[0]:block[-1] + 1] if rows is None else self.codes[block]
+            scales = self.scales[block[0]:block[-1] + 1] if rows is None else self.scales[block]
+            norms_sq = self.norms_sq[block[0]:block[-1] + 1] if rows is None else self.norms_sq[block]
+            dots = (codes @ query) * scales
+            scores = distances(self.space, dots, norms_sq, query_norm_sq)
+            best_rows = np.concatenate([best_rows, block])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_rows) > shortlist:
+                keep = np.argpartition(best_scores, shortlist - 1)[:shortlist]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+        if self.vectors is not None:
+            order = np.argsort(best_rows)
+            best_rows = best_rows[order]
+            vectors = np.asarray(self.vectors[best_rows], dtype=np.float32)
+            best_scores = distances(self.space, vectors @ query, np.asarray(self.norms_sq[best_rows]), query_norm_sq)
+        order = np.argsort(best_scores, kind="stable")[:k]
+        return [(int(best_rows[i]), float(best_scores[i])) for i in order]
+
+    def _fetch(self, rows: List[int]) -> dict:
+        with self._lock:
+            found = {row: (text, json.loads(metadata)) for row, text, metadata in self._conn.execute(
+                f"SELECT row, text, metadata FROM chunks WHERE row IN ({','.join('?' * len(rows))})", rows)}
+        return found
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10, where: Optional[dict] = None,
+              include: List[str] = ("documents", "metadatas", "distances")) -> dict:
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for embedding in query_embeddings:
+            hits = self.search(embedding, n_results, where)
+            found = self._fetch([row for row, _ in hits]) if hits else {}
+            result["ids"].append([str(self.ids[row]) for row, _ in hits])
+            result["documents"].append([found[row][0] for row, _ in hits])
+            result["metadatas"].append([found[row][1] for row, _ in hits])
+            result["distances"].append([distance for _, distance in hits])
+        return result
+
+    def get(self, ids: List[str], include: List[str] = ("documents", "metadatas")) -> dict:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, text, metadata FROM chunks WHERE id IN ({','.join('?' * len(ids))})", ids).fetchall()
+        return {"ids": [r[0] for r in rows], "documents": [r[1] for r in rows],
+                "metadatas": [json.loads(r[2]) for r in rows]}
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def quantized_index_path(persist_dir: str) -> str:
+    return os.path.join(persist_dir, QUANTIZED_DIR)
+
+
+def is_quantized_index_current(persist_dir: str) -> bool:
+    """
+    Whether a quantized index of the current format exists and was built from the current vector
+    store revision
+    """
+    path = os.path.join(quantized_index_path(persist_dir), "meta.json")
+    if not os.path.exists(path):
+        return False
+    with open(path, encoding="utf8") as f:
+        meta = json.load(f)
+    return (meta.get("format_version") == QUANTIZED_FORMAT_VERSION
+            and meta.get("store_revision") == store_revision(persist_dir))
+
+
+def build_quantized_index(persist_dir: str, keep_vectors: bool = True, page_size: int = 5000) -> dict:
+    """
+    Converts the Chroma collection into a quantized index in <persist_dir>/quantized
+    """
+    collection = open_collection(persist_dir)
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+    total = collection.count()
+    target = quantized_index_path(persist_dir)
+    tmp = target + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    conn = sqlite3.connect(os.path.join(tmp, "chunks.sqlite3"))
+    conn.execute("CREATE TABLE chunks (row INTEGER PRIMARY KEY, id TEXT NOT NULL, text TEXT NOT NULL, metadata TEXT NOT NULL, "
+                 "source TEXT, doc_type TEXT, date INTEGER, date_to INTEGER)")
+    ids, vectors = [], None
+    for offset in range(0, total, page_size):
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+        page_vectors = np.asarray(page["embeddings"], dtype=np.float32)
+        if vectors is None:
+            # Written straight into a memory-mapped file, so conversion does not hold the corpus twice
+            vectors = np.lib.format.open_memmap(os.path.join(tmp, "vectors.npy"), mode="w+", dtype=np.float32,
+                                                shape=(total, page_vectors.shape[1]))
+        vectors[offset:offset + len(page_vectors)] = page_vectors
+        conn.executemany("INSERT INTO chunks (row, id, text, metadata, source, doc_type, date, date_to) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         [(offset + i, chunk_id, text, json.dumps(metadata or {}), (metadata or {}).get("source"),
+                           (metadata or {}).get("doc_type"), (metadata or {}).get("date"),
+                           (metadata or {}).get("date_to"))
+                          for i, (chunk_id, text, metadata) in enumerate(zip(page["ids"], page["documents"],
+                                                                             page["metadatas"]))])
+        ids.extend(page["ids"])
+    for column in ("id", "source", "doc_type", "date", "date_to"):
+        conn.execute(f"CREATE INDEX chunks_{column} ON chunks ({column})")
+    conn.commit()
+    conn.close()
+
+    dim = vectors.shape[1] if vectors is not None else 0
+    if vectors is None:
+        vectors = np.lib.format.open_memmap(os.path.join(tmp, "vectors.npy"), mode="w+", dtype=np.float32, shape=(0, 0))
+    codes = np.lib.format.open_memmap(os.path.join(tmp, "codes.npy"), mode="w+", dtype=np.int8, shape=(total, dim))
+    scales = np.empty(total, dtype=np.float32)
+    norms_sq = np.empty(total, dtype=np.float32)
+    for start in range(0, total, SCAN_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + SCAN_BLOCK_ROWS])
+        codes[start:start + len(block)], scales[start:start + len(block)] = quantize(block)
+        norms_sq[start:start + len(block)] = np.einsum("ij,ij->i", block, block)
+    codes.flush()
+    vectors.flush()
+    del codes, vectors
+    np.save(os.path.join(tmp, "scales.npy"), scales)
+    np.save(os.path.join(tmp, "norms_sq.npy"), norms_sq)
+    np.save(os.path.join(tmp, "ids.npy"), np.array(ids, dtype=f"<U{max(map(len, ids), default=1)}"))
+    if not keep_vectors:
+        os.remove(os.path.join(tmp, "vectors.npy"))
+
+    meta = {
+        "format_version": QUANTIZED_FORMAT_VERSION,
+        "collection": COLLECTION_NAME,
+        "count": total,
+        "dim": dim,
+        "space": space,
+        "store_revision": store_revision(persist_dir),
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf8") as f:
+        json.dump(meta, f, indent=2)
+    # Swap the finished index in, so readers never see a half-written one
+    if os.path.isdir(target):
+        shutil.rmtree(target + ".old", ignore_errors=True)
+        os.rename(target, target + ".old")
+    os.rename(tmp, target)
+    shutil.rmtree(target + ".old", ignore_errors=True)
+    return meta
+
+
+def main():
+    args = parse_arguments()
+    start = time.perf_counter()
+    meta = build_quantized_index(args.persist_directory, keep_vectors=not args.no_rerank)
+    size = sum(os.path.getsize(os.path.join(quantized_index_path(args.persist_directory), name))
+               for name in os.listdir(quantized_index_path(args.persist_directory)))
+    print(f"Quantized {meta['count']} {meta['dim']}-dimensional vectors ({meta['space']}) in "
+          f"{time.perf_counter() - start:.1f}s, {size / 1024 / 1024:.1f} MB on disk")
+    print("Set VECTOR_BACKEND=quantized to query it")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Build the int8 quantized vector index from the Chroma vectorstore.')
+    parser.add_argument("--persist-directory", default=persist_directory,
+                        help='Vectorstore directory to convert (default: PERSIST_DIRECTORY or db).')
+    parser.add_argument("--no-rerank", action='store_true',
+                        help='Do not keep the float32 vectors; smaller on disk, but results are not re-ranked exactly.')
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+import re
+from typing import List, Optional
+
+import pandas as pd
+
+from ledger import INCOME_CATEGORIES, TransactionLedger, money
+from ledger_store import get_ledger
+
+NUMBER_WORDS = {
+    "a": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
+MONTH_NAMES = {name: number for number, name in enumerate(
+    ["january", "february", "march", "april", "may", "june", "july",
+     "august", "september", "october", "november", "december"], start=1)}
+MONTH_NAMES.update({name[:3]: number for name, number in list(MONTH_NAMES.items())})
+
+# Phrases mapped to ledger categories, on top of the category names themselves
+CATEGORY_SYNONYMS = {
+    "restaurants": "Restaurant", "dining": "Restaurant", "eating out": "Restaurant",
+    "shop": "Shopping", "shops": "Shopping",
+    "movies": "Entertainment", "fun": "Entertainment",
+    "cash withdrawal": "ATM", "cash withdrawals": "ATM", "withdrawals": "ATM",
+    "doctor": "Medical", "health": "Medical", "healthcare": "Medical",
+    "trip": "Travel", "trips": "Travel", "flights": "Travel",
+    "salaries": "Salary", "wage": "Salary", "wages": "Salary", "paycheck": "Salary",
+}
+
+AGGREGATE_PATTERNS = [
+    ("top_category", r"\b(which|what) (category|categories)\b"),
+    ("count", r"\b(how many|number of|count)\b"),
+    ("avg", r"\b(average|avg|mean|typical)\b"),
+    ("max", r"\b(largest|biggest|highest|most expensive|maximum|max)\b"),
+    ("min", r"\b(smallest|lowest|cheapest|minimum|min)\b"),
+    ("sum", r"\b(how much|total|sum|spent|spend|spending|earned|earn)\b"),
+]
+INCOME_PATTERN = r"\b(income|earn|earned|earnings|salary|salaries|interest|credits?|received|paid me)\b"
+EXPENSE_PATTERN = r"\b(spend|spent|spending|expenses?|costs?|paid|debits?|purchases?|bought)\b"
+DATE_PATTERN = r"(\d{1,2})/(\d{1,2})/(\d{4})"
+MONTH_PATTERN = r"\b(?:in|during|for|of)\s+(" + "|".join(sorted(MONTH_NAMES, key=len, reverse=True)) + r")\b(?:\s+(\d{4}))?"
+# Advice questions ("how much should I spend on rent") are for the LLM, not the table. "May" only
+# as in "may I", so the month still routes
+ADVICE_PATTERN = r"\b(should|could|can|may (i|we)|might|ought|would|how (do|to))\b"
+# What the money went on ("spent on food", "paid for groceries"), which must then be a category
+OBJECT_PATTERN = r"\b(?:on|for)\s+(?:(?:my|the|a|an|all)\s+)?(?=([a-z]+))"
+# Words after "on"/"for" that are not a spending object: periods and the ledger's own terms
+NON_OBJECT_WORDS = {"last", "past", "previous", "this", "each", "every", "average", "total", "everything",
+                    "expense", "expenses", "spending", "income", "transactions", "purchases", "money",
+                    "category", "categories", "me", "it", "them"}
+# "Balance" as a noun about the account, not "how do I balance my budget"
+BALANCE_PATTERN = r"\b(my|account|closing|bank) balance\b|\bbalance (on|at|as of|in|was|is|after)\b"
+
+
+class StructuredQuery:
+    """
+    A question the ledger can answer directly: what to aggregate over which rows
+    """
+
+    def __init__(self, kind: str, aggregate: str, categories: List[str], start=None, end=None,
+                 include_start: bool = True, period: str = "in total"):
+        self.kind = kind                    # "expense", "income" or "balance"
+        self.aggregate = aggregate          # "sum", "avg", "count", "max", "min" or "top_category"
+        self.categories = categories
+        self.start = start
+        self.end = end
+        self.include_start = include_start
+        self.period = period
+
+    def __repr__(self):
+        return (f"StructuredQuery(kind={self.kind!r}, aggregate={self.aggregate!r}, categories={self.categories!r}, "
+                f"start={self.start}, end={self.end}, period={self.period!r})")
+
+
+def parse_number(token: str) -> int:
+    return int(token) if token.isdigit() else NUMBER_WORDS[token]
+
+
+def parse_date(day, month, year) -> Optional[pd.Timestamp]:
+    """
+    A dd/mm/yyyy date from the question, or None if there is no such day (e.g. 06/15/2018)
+    """
+    try:
+        return pd.Timestamp(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+def parse_period(text: str, ledger: TransactionLedger):
+    """
+    Returns (start, end, include_start, description) for the period mentioned in the question,
+    or None if it names a date that does not exist
+    """
+    dates = [parse_date(*date) for date in re.findall(DATE_PATTERN, text)[:2]]
+    if None in dates:
+        return None
+    if len(dates) == 2:
+        start, end = dates
+        return start, end, True, f"between {start:%d %b %Y} and {end:%d %b %Y}"
+    if len(dates) == 1:
+        return dates[0], dates[0], True, f"on {dates[0]:%d %b %Y}"
+
+    number = r"(\d+|" + "|".join(NUMBER_WORDS) + r")"
+    match = re.search(r"\b(?:last|past|previous)\s+" + number + r"\s+(month|week|day|year)s?\b", text)
+    if match:
+        count, unit = parse_number(match.group(1)), match.group(2)
+        return period_back(ledger, count, unit)
+    match = re.search(r"\b(?:last|past|previous|this)\s+(month|week|year)\b", text)
+    if match:
+        return period_back(ledger, 1, match.group(1))
+
+    match = re.search(MONTH_PATTERN, text)
+    if match:
+        month = MONTH_NAMES[match.group(1)]
+        year = int(match.group(2)) if match.group(2) else ledger.latest.year
+        # A month without a year means its most recent occurrence in the ledger
+        if not match.group(2) and month > ledger.latest.month:
+            year -= 1
+        start = parse_date(1, month, year)
+        if start is None:
+            return None
+        return start, start + pd.offsets.MonthEnd(0), True, f"in {start:%B %Y}"
+    match = re.search(r"\b(?:in|during|for)\s+(\d{4})\b", text)
+    if match:
+        year = int(match.group(1))
+        return pd.Timestamp(year, 1, 1), pd.Timestamp(year, 12, 31), True, f"in {year}"
+    return None, None, True, "in total"
+
+
+def period_back(ledger: TransactionLedger, count: int, unit: str):
+    if unit == "month" or unit == "year":
+        months = count * (12 if unit == "year" else 1)
+        start = ledger.last_months_start(months)
+        label = f"{count} {unit}" + ("s" if count > 1 else "")
+    else:
+        start = ledger.latest - pd.Timedelta(days=count * (7 if unit == "week" else 1))
+        label = f"{count} {unit}" + ("s" if count > 1 else "")
+    return start, ledger.latest, False, f"in the last {label}"
+
+
+def parse_categories(text: str, ledger: TransactionLedger) -> List[str]:
+    found = []
+    for category in ledger.categories:
+        if re.search(r"\b" + re.escape(category.lower()) + r"s?\b", text):
+            found.append(category)
+    for phrase, category in CATEGORY_SYNONYMS.items():
+        if re.search(r"\b" + re.escape(phrase) + r"\b", text) and category not in found:
+            found.append(category)
+    return found
+
+
+def names_unknown_object(text: str, ledger: TransactionLedger) -> bool:
+    """
+    True when the question says what the money went on ("on food") and that is not a ledger
+    category, so the answer would silently cover all expenses instead
+    """
+    names = [category.lower() for category in ledger.categories] + list(CATEGORY_SYNONYMS)
+    for match in re.finditer(OBJECT_PATTERN, text):
+        word = match.group(1)
+        if word in MONTH_NAMES or word in NUMBER_WORDS or word in NON_OBJECT_WORDS:
+            continue
+        rest = text[match.start(1):]
+        if not any(re.match(re.escape(name) + r"s?\b", rest) for name in names):
+            return True
+    return False
+
+
+def parse_question(question: str, ledger: TransactionLedger) -> Optional[StructuredQuery]:
+    """
+    Recognises aggregate and filter questions over the ledger. Returns None for anything else,
+    which is then left to the document QA chain.
+    """
+    text = " ".join(question.lower().split())
+    if not text or ledger.latest is None:
+        return None
+
+    if re.search(BALANCE_PATTERN, text):
+        dates = re.findall(DATE_PATTERN, text)
+        if dates:
+            date = parse_date(*dates[-1])
+            if date is None:
+                return None
+            return StructuredQuery("balance", "last", [], end=date, period=f"on {date:%d %b %Y}")
+        period = parse_period(text, ledger)
+        if period is None:
+            return None
+        start, end, _, period = period
+        end = end if end is not None and end < ledger.latest else ledger.latest
+        return StructuredQuery("balance", "last", [], end=end,
+                               period=period if start is not None else f"on {ledger.latest:%d %b %Y}")
+
+    aggregate = next((name for name, pattern in AGGREGATE_PATTERNS if re.search(pattern, text)), None)
+    if aggregate is None or re.search(ADVICE_PATTERN, text) or names_unknown_object(text, ledger):
+        return None
+    categories = parse_categories(text, ledger)
+    income = re.search(INCOME_PATTERN, text) or any(c in INCOME_CATEGORIES for c in categories)
+    expense = re.search(EXPENSE_PATTERN, text) or any(c not in INCOME_CATEGORIES for c in categories)
+    if income and not expense:
+        kind = "income"
+    elif expense and not income:
+        kind = "expense"
+    else:
+        # Mixed or no money words: not something to answer from the table
+        return None
+    categories = [c for c in categories if (c in INCOME_CATEGORIES) == (kind == "income")]
+    period = parse_period(text, ledger)
+    if period is None:
+        return None
+    return StructuredQuery(kind, aggregate, categories, *period)
+
+
+def execute(query: StructuredQuery, ledger: TransactionLedger) -> str:
+    if query.kind == "balance":
+        balance = ledger.balance_at(query.end)
+        if balance is None:
+            return f"There are no transactions before {query.end:%d %b %Y}."
+        return f"Your closing balance {query.period} was {money(balance)}."
+
+    rows = ledger.between(query.start, query.end, query.include_start)
+    if query.kind == "income":
+        rows, amount_column, noun, verb = ledger.income(rows, query.categories), 'Credit Amount', "income", "received"
+    else:
+        rows, amount_column, noun, verb = ledger.expenses(rows, query.categories), 'Debit Amount', "expense", "spent"
+    what = f" on {', '.join(query.categories)}" if query.categories and query.kind == "expense" else \
+        f" from {', '.join(query.categories)}" if query.categories else ""
+    amounts = rows[amount_column]
+
+    if rows.empty:
+        return f"There are no matching {noun} transactions{what} {query.period}."
+    if query.aggregate == "sum":
+        return f"You {verb} {money(amounts.sum())}{what} {query.period}, across {len(rows)} transactions."
+    if query.aggregate == "avg":
+        return f"Your average {noun} transaction{what} {query.period} " \
+               f"was {money(amounts.mean())}, across {len(rows)} transactions."
+    if query.aggregate == "count":
+        return f"You had {len(rows)} {noun} transactions{what} {query.period}, totalling {money(amounts.sum())}."
+    if query.aggregate in ("max", "min"):
+        row = rows.loc[amounts.idxmax() if query.aggregate == "max" else amounts.idxmin()]
+        size = "largest" if query.aggregate == "max" else "smallest"
+        return f"Your {size} {noun} {query.period} was " \
+               f"{money(row[amount_column])} on {row['Category']} on {row['Date']:%d %b %Y}."
+    totals = rows.groupby('Category', observed=True)[amount_column].sum().sort_values(ascending=False)
+    breakdown = ", ".join(f"{category} {money(amount)}" for category, amount in totals.head(3).items())
+    return f"Your top {noun} category {query.period} was {totals.index[0]} with {money(totals.iloc[0])} " \
+           f"(top categories: {breakdown})."
+
+
+def route_question(question: str, ledger: TransactionLedger = None) -> Optional[str]:
+    """
+    Answers numeric questions about the transaction ledger directly from the table.
+    Returns None when the question should go to the LLM instead.
+    """
+    try:
+        ledger = ledger or get_ledger()
+    except FileNotFoundError:
+        return None
+    query = parse_question(question, ledger)
+    if query is None:
+        return None
+    return execute(query, ledger)
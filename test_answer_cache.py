@@ -0,0 +1,27 @@
+from answer_cache import AnswerCache
+
+SOURCES = [{"page_content": "Spending on Shopping in 2018", "metadata": {"source": "ledger.csv"}}]
+
+
+def test_paraphrase_hits_but_a_different_number_misses(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite3"), threshold=0.95)
+    cache.store("How much did I spend in 2018?", "$1,200.00", SOURCES, "v1", [1.0, 0.0, 0.0])
+
+    assert cache.lookup("how much did i spend in 2018", "v1")[2] == "exact"
+    answer, sources, tier = cache.lookup("What did I spend in 2018?", "v1", [0.99, 0.01, 0.0])
+    assert (answer, sources, tier) == ("$1,200.00", SOURCES, "semantic")
+    # Embeds almost identically, but asks about another year
+    assert cache.lookup("How much did I spend in 2019?", "v1", [1.0, 0.0, 0.0]) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_entries_of_another_version_are_purged(tmp_path):
+    path = str(tmp_path / "answers.sqlite3")
+    cache = AnswerCache(path)
+    cache.store("How much did I spend in 2018?", "$1,200.00", SOURCES, "v1", [1.0, 0.0, 0.0])
+    assert cache.stats()["entries"] == 1
+
+    assert cache.lookup("How much did I spend in 2018?", "v2", [1.0, 0.0, 0.0]) is None
+    assert cache.stats()["entries"] == 0
+    # Gone for good, not just hidden: the old version finds nothing either
+    assert AnswerCache(path).lookup("How much did I spend in 2018?", "v1") is None
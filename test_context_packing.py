@@ -0,0 +1,36 @@
+from langchain.schema import Document
+
+from context_packing import estimate_tokens, pack_context
+
+
+def doc(text, source="a.txt", page=None):
+    return Document(page_content=text, metadata={"source": source, "page": page})
+
+
+def test_passages_within_budget_are_kept_whole():
+    chunks = [doc("The rent is due on the first of the month."), doc("Groceries cost about 400 dollars.", "b.txt")]
+    packed, stats = pack_context(chunks, 100)
+    assert [p.page_content for p in packed] == [c.page_content for c in chunks]
+    assert stats["passages"] == 2 and stats["tokens"] <= 100
+
+
+def test_last_passage_is_cut_at_a_sentence():
+    long = " ".join(f"Sentence number {i} is about budgeting." for i in range(50))
+    packed, stats = pack_context([doc("Short first passage about rent."), doc(long, "b.txt")], 60)
+    assert len(packed) == 2
+    assert packed[1].page_content.endswith("budgeting.")
+    assert stats["tokens"] <= 60
+
+
+def test_passage_without_sentence_break_is_cut_at_a_word():
+    long = " ".join(["word"] * 2000)
+    packed, stats = pack_context([doc(long), doc("A short second passage.", "b.txt")], 50)
+    assert stats["passages"] >= 1
+    assert packed[0].page_content.startswith("word word")
+    assert estimate_tokens(packed[0].page_content) <= 50 and stats["tokens"] <= 50
+
+
+def test_text_without_spaces_is_cut_at_characters():
+    packed, stats = pack_context([doc("x" * 5000)], 10)
+    assert packed[0].page_content == "x" * 40
+    assert stats["tokens"] == 10
@@ -0,0 +1,47 @@
+import os
+
+from ledger_store import LedgerStore
+
+HEADER = "Date,Day,Type,Category,Debit Amount,Credit Amount,Closing Balance\n"
+ROWS = [
+    "02/05/2018,Wednesday,Debit,Shopping,100,,900\n",
+    "15/06/2018,Friday,Debit,Restaurant,40,,860\n",
+]
+
+
+def write(path, rows):
+    with open(path, "w") as f:
+        f.write(HEADER + "".join(rows))
+
+
+def test_refresh_appends_new_rows(tmp_path):
+    source = str(tmp_path / "ledger.csv")
+    write(source, ROWS)
+    store = LedgerStore(source, str(tmp_path / "cache"))
+    assert store.refresh() == "rebuilt"
+    assert store.refresh() == "fresh"
+
+    with open(source, "a") as f:
+        f.write("20/06/2018,Wednesday,Debit,Travel,60,,800\n")
+    assert store.refresh() == "appended"
+    df = store.transactions()
+    assert len(df) == 3
+    assert list(df["Category"]) == ["Shopping", "Restaurant", "Travel"]
+    assert store.meta["partitions"] == {"2018-05": 1, "2018-06": 2}
+    # A second reader of the same cache finds it current
+    assert LedgerStore(source, str(tmp_path / "cache")).refresh() == "fresh"
+
+
+def test_refresh_rebuilds_after_an_edit(tmp_path):
+    source = str(tmp_path / "ledger.csv")
+    write(source, ROWS)
+    store = LedgerStore(source, str(tmp_path / "cache"))
+    store.refresh()
+
+    write(source, [ROWS[1]])
+    assert store.refresh() == "rebuilt"
+    assert len(store.transactions()) == 1
+    assert list(store.meta["partitions"]) == ["2018-06"]
+    # The rebuild was swapped in whole: no stale partition or temporary directory is left behind
+    assert sorted(os.listdir(tmp_path / "cache")) == ["2018-06", "meta.json"]
+    assert sorted(os.listdir(tmp_path)) == ["cache", "ledger.csv"]
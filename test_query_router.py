@@ -0,0 +1,48 @@
+import pandas as pd
+
+from ledger import TransactionLedger, normalize_transactions
+from query_router import parse_question, route_question
+
+
+def make_ledger() -> TransactionLedger:
+    return TransactionLedger(normalize_transactions(pd.DataFrame({
+        'Date': ['02/05/2018', '10/05/2018', '15/06/2018', '30/06/2018'],
+        'Type': ['Debit', 'Debit', 'Debit', 'Credit'],
+        'Category': ['Shopping', 'Restaurant', 'Shopping', 'Salary'],
+        'Debit Amount': [100.0, 40.0, 60.0, 0.0],
+        'Credit Amount': [0.0, 0.0, 0.0, 1000.0],
+        'Closing Balance': [900.0, 860.0, 800.0, 1800.0],
+    })))
+
+
+def test_unknown_spending_object_goes_to_the_llm():
+    ledger = make_ledger()
+    assert parse_question("How much did I spend on food?", ledger) is None
+    assert parse_question("What did I pay for groceries in June?", ledger) is None
+
+
+def test_known_category_and_periods_are_routed():
+    ledger = make_ledger()
+    assert route_question("How much did I spend on Shopping?", ledger) == \
+        "You spent $160.00 on Shopping in total, across 2 transactions."
+    assert route_question("How much did I spend on restaurants for the last 3 months?", ledger) is not None
+    assert route_question("How much did I spend?", ledger) == "You spent $200.00 in total, across 3 transactions."
+
+
+def test_month_of_may_is_not_advice():
+    ledger = make_ledger()
+    assert route_question("Total spent on Shopping in may 2018", ledger) == \
+        "You spent $100.00 on Shopping in May 2018, across 1 transactions."
+    assert parse_question("May I spend more on Shopping?", ledger) is None
+
+
+def test_impossible_dates_go_to_the_llm():
+    ledger = make_ledger()
+    assert route_question("What was my balance on 06/15/2018?", ledger) is None
+    assert route_question("How much did I spend between 31/02/2018 and 15/06/2018?", ledger) is None
+
+
+def test_single_date_is_that_day():
+    ledger = make_ledger()
+    assert route_question("How much did I spend on 15/06/2018?", ledger) == \
+        "You spent $60.00 on 15 Jun 2018, across 1 transactions."
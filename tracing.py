@@ -0,0 +1,288 @@
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# With tracing off no spans are recorded or written; the metrics endpoint only serves live gauges
+tracing_enabled = os.environ.get('TRACING', '1') == '1'
+trace_log_path = os.environ.get('TRACE_LOG_PATH', os.path.join('logs', 'traces.jsonl'))
+trace_log_max_bytes = int(os.environ.get('TRACE_LOG_MAX_BYTES', 10 * 1024 * 1024))
+trace_log_backups = int(os.environ.get('TRACE_LOG_BACKUPS', 5))
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# Numeric trace attributes that are also summed into counters, per trace name
+COUNTED_ATTRIBUTES = {
+    "answer": ("tokens", "retrieved_chunks", "context_chars", "prompt_chars"),
+    "ingest": ("files", "split_chunks", "embeddings"),
+}
+
+METRIC_HELP = {
+    "privategpt_traces_total": "Finished traces by name and status",
+    "privategpt_trace_duration_seconds": "Duration of traces",
+    "privategpt_stage_duration_seconds": "Duration of the stages of traces",
+}
+# A metric sample: (name, type, help, labels, value)
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+
+class Span:
+    """
+    One timed stage of a trace. Used as a context manager, or recorded afterwards with Trace.add_span.
+    """
+
+    __slots__ = ("trace", "name", "start", "end", "attributes")
+
+    def __init__(self, trace: "Trace", name: str, attributes: dict):
+        self.trace = trace
+        self.name = name
+        self.start = None
+        self.end = None
+        self.attributes = attributes
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end = time.perf_counter()
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.trace.spans.append(self)
+
+
+class Trace:
+    """
+    The stages of one question or ingest run. Entering it makes it the current trace of the
+    thread, so code further down can add spans through current_trace(); leaving it writes the
+    trace to the JSONL log and updates the metrics.
+
+    An exception leaving the trace sets its status to the exception's `trace_status` attribute,
+    or "error" if it has none.
+    """
+
+    enabled = True
+
+    def __init__(self, name: str, **attributes):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.attributes = attributes
+        self.spans: List[Span] = []
+        self.status = "ok"
+        self.started_at = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        self._token = None
+
+    def span(self, name: str, **attributes) -> Span:
+        return Span(self, name, attributes)
+
+    def add_span(self, name: str, seconds: float, start: Optional[float] = None, **attributes) -> None:
+        """
+        Records a stage timed elsewhere. Without a start it is a total over several intervals,
+        e.g. all embedding batches of an ingest run.
+        """
+        span = Span(self, name, attributes)
+        span.start, span.end = start, (start or 0.0) + seconds
+        self.spans.append(span)
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "Trace":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.status = getattr(exc_type, "trace_status", "error")
+            self.attributes["error"] = exc_type.__name__
+        self.finish()
+
+    def finish(self) -> None:
+        duration = time.perf_counter() - self.start
+        spans = []
+        for span in self.spans:
+            record = {"name": span.name, "duration_ms": round((span.end - (span.start or 0.0)) * 1000, 3)}
+            if span.start is not None:
+                record["start_ms"] = round((span.start - self.start) * 1000, 3)
+            if span.attributes:
+                record["attributes"] = span.attributes
+            spans.append(record)
+        _write_trace({"trace_id": self.id, "name": self.name, "start": self.started_at.isoformat(),
+                      "duration_ms": round(duration * 1000, 3), "status": self.status,
+                      "attributes": self.attributes, "spans": spans})
+        metrics.record_trace(self, duration)
+
+
+class _NullSpan:
+    def set(self, **attributes) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+class _NullTrace:
+    """
+    Stands in for a trace when tracing is off or no trace is running; every method is a no-op
+    """
+
+    enabled = False
+
+    def span(self, name: str, **attributes) -> _NullSpan:
+        return _NULL_SPAN
+
+    def add_span(self, name: str, seconds: float, start: Optional[float] = None, **attributes) -> None:
+        pass
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def __enter__(self) -> "_NullTrace":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+NULL_TRACE = _NullTrace()
+_current = contextvars.ContextVar("trace", default=NULL_TRACE)
+
+
+def start_trace(name: str, **attributes):
+    """
+    Starts a trace to be used as a context manager, or a no-op stand-in if tracing is off
+    """
+    return Trace(name, **attributes) if tracing_enabled else NULL_TRACE
+
+
+def current_trace():
+    """
+    The trace running in this thread, or the no-op stand-in
+    """
+    return _current.get()
+
+
+_trace_logger = None
+_trace_logger_lock = threading.Lock()
+
+def _write_trace(record: dict) -> None:
+    global _trace_logger
+    if _trace_logger is None:
+        with _trace_logger_lock:
+            if _trace_logger is None:
+                os.makedirs(os.path.dirname(trace_log_path) or ".", exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(trace_log_path, maxBytes=trace_log_max_bytes,
+                                                               backupCount=trace_log_backups, encoding="utf8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger = logging.getLogger("privategpt.traces")
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                logger.addHandler(handler)
+                _trace_logger = logger
+    _trace_logger.info(json.dumps(record, default=str))
+
+
+class MetricsRegistry:
+    """
+    In-process metrics in the Prometheus text format: per-stage duration histograms and counters
+    fed by finished traces, plus samples from collectors that are read at scrape time.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # (metric, labels) -> [bucket counts..., sum, count]
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], List[float]] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        self._collectors.append(collector)
+
+    def _observe(self, name: str, labels: dict, value: float) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                histogram[index] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+    def _increment(self, name: str, labels: dict, value: float = 1) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def record_trace(self, trace: Trace, duration: float) -> None:
+        with self._lock:
+            self._increment("privategpt_traces_total", {"trace": trace.name, "status": trace.status})
+            self._observe("privategpt_trace_duration_seconds", {"trace": trace.name}, duration)
+            for span in trace.spans:
+                self._observe("privategpt_stage_duration_seconds", {"trace": trace.name, "stage": span.name},
+                              span.end - (span.start or 0.0))
+            for attribute in COUNTED_ATTRIBUTES.get(trace.name, ()):
+                value = trace.attributes.get(attribute)
+                if isinstance(value, (int, float)):
+                    name = f"privategpt_{trace.name}_{attribute}_total"
+                    METRIC_HELP.setdefault(name, f"Sum of {attribute.replace('_', ' ')} over {trace.name} traces")
+                    self._increment(name, {}, value)
+
+    def samples(self) -> List[Sample]:
+        samples = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                samples.append((name, "counter", METRIC_HELP.get(name, ""), dict(labels), value))
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                help_text = METRIC_HELP.get(name, "")
+                for bound, count in zip(self.buckets, histogram):
+                    samples.append((f"{name}_bucket", "histogram", help_text, dict(labels, le=repr(bound)), count))
+                samples.append((f"{name}_bucket", "histogram", help_text, dict(labels, le="+Inf"), histogram[-1]))
+                samples.append((f"{name}_sum", "histogram", help_text, dict(labels), histogram[-2]))
+                samples.append((f"{name}_count", "histogram", help_text, dict(labels), histogram[-1]))
+        for collector in self._collectors:
+            samples.extend(collector())
+        return samples
+
+    def render(self) -> str:
+        """
+        Every metric in the Prometheus text exposition format
+        """
+        lines, described = [], set()
+        for name, kind, help_text, labels, value in self.samples():
+            family = _histogram_family(name) if kind == "histogram" else name
+            if family not in described:
+                described.add(family)
+                if help_text:
+                    lines.append(f"# HELP {family} {help_text}")
+                lines.append(f"# TYPE {family} {kind}")
+            label_text = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _histogram_family(name: str) -> str:
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,132 @@
+import glob
+import json
+import os
+import time
+from typing import List, Optional
+
+import chromadb
+from chromadb.config import Settings
+from langchain.vectorstores import Chroma
+
+# Store metadata written next to the Chroma files. It replaces the old CHROMA_SETTINGS dict,
+# which described a server setup that was never used and the wrong embedding dimension.
+STORE_META_FILE = "store_meta.json"
+STORE_FORMAT_VERSION = 1
+# LangChain's default collection, which privateGPT.py queries
+COLLECTION_NAME = "langchain"
+
+# On-disk layouts recognised by detect_layout
+LAYOUT_NONE = "none"
+LAYOUT_CHROMA_04 = "chroma-0.4"        # chroma.sqlite3 + <segment uuid>/data_level0.bin
+LAYOUT_LEGACY = "duckdb+parquet"       # chromadb < 0.4: index/ + chroma-*.parquet
+LAYOUT_ORPHANED = "orphaned-segments"  # segment directories without the sqlite catalogue
+
+# Keys that must match for new vectors to be comparable with the stored ones
+EMBEDDING_KEYS = ("embedding_model", "embedding_dim")
+# Keys that only change how documents are cut; a mismatch can be migrated by re-chunking
+CHUNKING_KEYS = ("chunk_size", "chunk_overlap", "csv_loader")
+
+
+class IncompatibleStoreError(Exception):
+    """Raised when the vector store on disk cannot be used with the current configuration"""
+
+
+def detect_layout(persist_directory: str) -> str:
+    """
+    Inspects the persist directory and returns which Chroma on-disk layout it holds
+    """
+    if os.path.exists(os.path.join(persist_directory, "chroma.sqlite3")):
+        return LAYOUT_CHROMA_04
+    if os.path.exists(os.path.join(persist_directory, "chroma-collections.parquet")) or \
+            os.path.isdir(os.path.join(persist_directory, "index")):
+        return LAYOUT_LEGACY
+    if glob.glob(os.path.join(persist_directory, "*", "data_level0.bin")):
+        return LAYOUT_ORPHANED
+    return LAYOUT_NONE
+
+
+def does_vectorstore_exist(persist_directory: str) -> bool:
+    """
+    Checks if a vectorstore this version of chromadb can open exists
+    """
+    return detect_layout(persist_directory) == LAYOUT_CHROMA_04
+
+
+def open_client(persist_directory: str) -> "chromadb.API":
+    """
+    Opens the persistent chromadb 0.4 client directly, skipping the legacy settings handling
+    LangChain does when it is only given a directory
+    """
+    return chromadb.PersistentClient(path=persist_directory, settings=Settings(anonymized_telemetry=False))
+
+
+def open_collection(persist_directory: str) -> "chromadb.api.models.Collection.Collection":
+    """
+    Opens the raw collection, for writers that compute embeddings themselves
+    """
+    return open_client(persist_directory).get_or_create_collection(COLLECTION_NAME)
+
+
+def open_vectorstore(persist_directory: str, embeddings) -> Chroma:
+    return Chroma(collection_name=COLLECTION_NAME, client=open_client(persist_directory),
+                  embedding_function=embeddings, persist_directory=persist_directory)
+
+
+def build_store_meta(embeddings_model: str, embedding_dim: int, chunk_size: int, chunk_overlap: int,
+                     csv_loader: str) -> dict:
+    return {
+        "format_version": STORE_FORMAT_VERSION,
+        "layout": LAYOUT_CHROMA_04,
+        "chromadb_version": chromadb.__version__,
+        "embedding_model": embeddings_model,
+        "embedding_dim": embedding_dim,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "csv_loader": csv_loader,
+        "revision": 0,
+    }
+
+
+def read_store_meta(persist_directory: str) -> Optional[dict]:
+    path = os.path.join(persist_directory, STORE_META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf8") as f:
+        meta = json.load(f)
+    if meta.get("format_version") != STORE_FORMAT_VERSION:
+        raise IncompatibleStoreError(f"{path}: unsupported store format version {meta.get('format_version')}")
+    return meta
+
+
+def write_store_meta(persist_directory: str, meta: dict) -> dict:
+    """
+    Writes the store metadata atomically, bumping its revision so readers can tell the store changed
+    """
+    meta = dict(meta, revision=meta.get("revision", 0) + 1, updated_at=time.time())
+    os.makedirs(persist_directory, exist_ok=True)
+    path = os.path.join(persist_directory, STORE_META_FILE)
+    with open(path + ".tmp", "w", encoding="utf8") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(path + ".tmp", path)
+    return meta
+
+
+def store_revision(persist_directory: str) -> int:
+    meta = read_store_meta(persist_directory)
+    return meta["revision"] if meta else 0
+
+
+def mismatched_keys(stored: dict, expected: dict, keys) -> List[str]:
+    return [key for key in keys if key in stored and key in expected and stored[key] != expected[key]]
+
+
+def check_compatibility(stored: dict, expected: dict) -> List[str]:
+    """
+    Raises IncompatibleStoreError if vectors in the store were made with a different embedding
+    model, and returns the chunking parameters that differ and need a migration
+    """
+    embedding_diff = mismatched_keys(stored, expected, EMBEDDING_KEYS)
+    if embedding_diff:
+        details = ", ".join(f"{key}: store has {stored[key]!r}, configured {expected[key]!r}" for key in embedding_diff)
+        raise IncompatibleStoreError(f"Vector store was built with a different embedding model ({details})")
+    return mismatched_keys(stored, expected, CHUNKING_KEYS)